@@ -0,0 +1,67 @@
+"""asyncio front end of a node: client packets are parsed, decrypted and dispatched from a single event loop, instead
+of a receiver thread feeding a queue that a pool of handler threads drains.
+
+Decryption can optionally be offloaded to a process pool, which runs outside of the node's GIL, at the cost of
+pickling every packet (and its player's cipher) to a worker process and back."""
+import asyncio
+import logging
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from typing import Set
+
+from backend.networks.networking import decrypt_client_packet
+from backend.profiling import profiler
+from common.consts import Addr
+
+
+class NodeDatagramProtocol(asyncio.DatagramProtocol):
+    """Serves a node's client packets from the event loop.
+
+    Without a crypto pool every packet is handled synchronously in ``datagram_received``, which keeps the packets of a
+    player in order; with one, packets are dispatched in the order their decryption completes."""
+
+    def __init__(self, node, crypto_pool: ProcessPoolExecutor | None = None):
+        self.node = node
+        self.crypto_pool = crypto_pool
+        self._pending: Set[asyncio.Task] = set()
+        """Strong references to the offloaded packets, which the event loop only weakly references."""
+
+    def datagram_received(self, data: bytes, addr: Addr):
+        profiler.count("packets_received")
+        if self.crypto_pool is None:
+            self.node.handle_client_packet(data)
+            return
+        task = asyncio.ensure_future(self.handle_offloaded(data))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def handle_offloaded(self, data: bytes):
+        if not (resolved := self.node.resolve_client_packet(data)):
+            return
+        player_uuid, player, encrypted_message = resolved
+        contents = await asyncio.get_running_loop().run_in_executor(self.crypto_pool, decrypt_client_packet,
+                                                                    encrypted_message, player.cipher)
+        if contents:
+            self.node.dispatch_client_message(player_uuid, contents)
+
+    def error_received(self, exc: Exception):
+        logging.warning(f"[error] front end socket error, {exc=}")
+
+
+def run_async_frontend(node, sock: socket.socket, crypto_workers: int = 0):
+    """Serves the client packets received on ``sock`` (which is already bound) until the event loop is stopped.
+
+    :param crypto_workers: size of the process pool decryption is offloaded to, or 0 to decrypt in the event loop"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    crypto_pool = ProcessPoolExecutor(crypto_workers) if crypto_workers else None
+    transport, _ = loop.run_until_complete(
+        loop.create_datagram_endpoint(lambda: NodeDatagramProtocol(node, crypto_pool), sock=sock))
+    logging.info(f"serving clients from an event loop, with {crypto_workers} crypto workers")
+    try:
+        loop.run_forever()
+    finally:
+        transport.close()
+        if crypto_pool:
+            crypto_pool.shutdown(cancel_futures=True)
+        loop.close()
@@ -1,4 +1,7 @@
-from common.consts import SWORD, AXE, BOW, INVENTORY_ROWS, INVENTORY_COLUMNS
+import math
+
+from common.consts import SWORD, AXE, BOW, INVENTORY_ROWS, INVENTORY_COLUMNS, CLIENT_WIDTH, CLIENT_HEIGHT, \
+    PROJECTILE_WIDTH, PROJECTILE_HEIGHT, BOT_WIDTH, BOT_HEIGHT, BAG_WIDTH, BAG_HEIGHT, SCREEN_WIDTH, SCREEN_HEIGHT
 
 # Scrypt Consts
 SCRYPT_KEY_LENGTH = 32
@@ -11,19 +14,73 @@ ARM_LENGTH_MULTIPLIER = 10
 # Game consts
 ATTACK_BBOX_LENGTH = 100
 FRAME_TIME = 1 / 60
+NETWORK_TICK_RATE = 30
+"""Rate (in Hz, e.g. 20/30/60) in which every player is sent a snapshot, independently of the simulation's rate and of
+the rate the client sends packets in. 0 replies with a snapshot to every routine client packet instead."""
+SNAPSHOT_TIMEOUT_TICKS = 3
+"""Network ticks the broadcaster waits for the simulation thread to build the snapshots, before skipping a broadcast."""
+MAX_CATCH_UP_TICKS = 5
+TICK_STATS_WINDOW = 600
+TICK_STATS_LOG_INTERVAL = 10
 MAX_SLOT = INVENTORY_ROWS * INVENTORY_COLUMNS - 1
 AFK_THRESHOLD_SECS = 6.5
 
 # Server communication ports
 ROOT_SERVER2SERVER_PORT = 35000
 
+# Client packets front end
+ASYNC_FRONTEND = False
+"""Whether nodes serve client packets from an asyncio event loop, rather than from a pool of handler threads."""
+CRYPTO_OFFLOAD_WORKERS = 0
+"""Size of the process pool the asyncio front end offloads decryption to, or 0 to decrypt in the event loop."""
+
+UDP_BATCH_SIZE = 64
+"""Maximal number of datagrams moved by a single batched receive/send syscall."""
+
+# Sharded nodes
+NODE_WORKERS = 4
+"""Number of worker processes a sharded node spawns by default, each owning a strip of the world."""
+
+# Profiling
+PROFILING_ENABLED = False
+HISTOGRAM_BUCKETS = 24
+STATS_EXPORT_INTERVAL = 5
+STATS_EXPORT_ADDR = ("127.0.0.1", 42070)
+STATS_EXPORT_PATH = None
+
 # other
 MOB_SIGHT_WIDTH = 700
 MOB_SIGHT_HEIGHT = 700
 MOB_ERROR_TERM = 30
 RANGED_OFFSET = 270
+# distance from the tracked entity in which melee mobs stop moving
+MOB_STOP_DISTANCE = 0.5 * (math.hypot(BOT_HEIGHT, BOT_WIDTH) + math.hypot(CLIENT_HEIGHT, CLIENT_WIDTH))
 
 PET_SPAWN_X_DELTA = 300
 PET_SPAWN_Y_DELTA = 300
 
 BAG_SIZE = 3
+ENTITY_POOL_SIZE = 1024
+"""Maximal number of released projectiles/bags of every class kept for reuse."""
+
+# spatial index
+# twice the largest entity dimension, so that every entity spans at most 2x2 grid cells
+GRID_CELL_SIZE = 2 * max(CLIENT_WIDTH, CLIENT_HEIGHT, PROJECTILE_WIDTH, PROJECTILE_HEIGHT, BOT_WIDTH, BOT_HEIGHT,
+                         BAG_WIDTH, BAG_HEIGHT)
+# tile-aligned cells for the static obstacles index
+OBSTACLE_CELL_SIZE = 64
+# cells of the broad phase that pairs mobs with the targets in their sight, which spans a single cell in every axis
+SIGHT_CELL_SIZE = max(MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT)
+MAP_COLLISION_LAYERS = (("client/assets/map/animapa_test.csv", "client/assets/map/new_props.tsj"),)
+"""Layers of the map whose tiles hold obstacles, as (tiles CSV, Tiled tileset) pairs relative to the repository root."""
+COLLISION_MAP_PATH = "backend/collision_map.bin"
+"""Compiled collision map of ``MAP_COLLISION_LAYERS`` (see ``backend.logic.collision_map``), relative to the repository
+root."""
+
+# area of interest
+AOI_CELL_SIZE = 256
+# a client's screen, grown by half of the largest entity on every side, so that entities partially in view are sent
+AOI_VIEW_WIDTH = SCREEN_WIDTH + GRID_CELL_SIZE // 2
+AOI_VIEW_HEIGHT = SCREEN_HEIGHT + GRID_CELL_SIZE // 2
+AOI_MARGIN = 256
+"""Distance an entity has to get beyond a player's view before it's unsubscribed from, so that it doesn't flicker."""
@@ -0,0 +1,287 @@
+"""Headless load generator, which puts deployed nodes under the load of many players without running their clients.
+
+Every bot logs in like ``client/connect_screen.py`` does: an ECDH exchange with the entry node followed by a signup (or
+login) over TCP. It then plays the node it was redirected to over UDP, sending routine packets encoded like
+``client/networking.py`` does, at a fixed rate. Bots are spread over several processes, each of which plays its share
+of them in a single event loop.
+
+Reported for every run:
+    * the reply latency: from sending a routine packet that acks a new snapshot, until receiving the first snapshot
+      that is delta-compressed against it, i.e. the round trip of a packet that the node actually handled
+    * the loss of snapshots, out of the gaps in their (per player) sequence numbers
+    * the rate at which the bots receive snapshots, i.e. the network tick rate the node achieves
+
+Run from the repository root with ``python -m backend.benchmarks.bot_swarm``, while the entry node and its nodes are
+up."""
+import argparse
+import base64
+import heapq
+import math
+import multiprocessing
+import random
+import selectors
+import socket
+import statistics
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from client.login import do_ecdh, send_credentials
+from common.consts import CipherMode, DEFAULT_POS_MARK, INVENTORY_COLUMNS, NODE_PORT, RECV_CHUNK, ROOT_PORT, SPEED
+from common.message_type import MessageType
+from common.protocol import decode_message, encode_client_packet, encode_json_message, encode_message, \
+    encode_routine_client
+from common.session_cipher import create_session_cipher
+from common.utils import deserialize_json
+
+PATTERNS = ("idle", "wander", "circle")
+WANDER_TURN_INTERVAL = 1.
+"""Seconds after which a wandering bot picks a new heading."""
+CIRCLE_PERIOD = 4.
+"""Seconds it takes a circling bot to go around its circle."""
+ACK_TIMEOUT = 1.
+"""Seconds after which an ack that no snapshot was delta-compressed against is counted as timed out."""
+CHAT_MESSAGES = ("gg", "anyone here?", "lfg", "nice loot", "brb")
+
+
+def log_in(root_addr: Tuple[str, int], advertised_ip: str, username: str, password: str, is_login: bool) -> dict:
+    """Logs a bot in through the entry node.
+
+    :returns: the bot's state, holding its game socket, its session cipher and its position
+    :raises ConnectionError: if the entry node refused the bot"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", 0))
+    try:
+        with socket.create_connection(root_addr) as conn:
+            shared_key = do_ecdh(conn)
+            fernet = Fernet(base64.urlsafe_b64encode(shared_key))
+            send_credentials(username, password, conn, fernet, (advertised_ip, sock.getsockname()[1]), is_login)
+            data = deserialize_json(conn.recv(RECV_CHUNK), fernet)
+        if not data["success"]:
+            raise ConnectionError(data["error"])
+    except (OSError, ValueError, KeyError, InvalidToken):
+        sock.close()
+        raise
+    sock.setblocking(False)
+    return {"sock": sock, "node_addr": (data["ip"], NODE_PORT), "uuid": data["uuid"],
+            "cipher": create_session_cipher(shared_key, CipherMode(data.get("cipher", CipherMode.FERNET)), False),
+            "pos": tuple(data["initial_pos"]), "origin": tuple(data["initial_pos"]), "heading": 0., "turn_at": 0.,
+            "slot": 0, "seqn": 0, "ack": 0, "pending_acks": {}, "alive": True}
+
+
+def next_position(bot: dict, pattern: str, packet_rate: float, now: float) -> Tuple[int, int]:
+    """Moves a bot by no more than ``SPEED``, which is the most a player moves between two routine packets."""
+    x, y = bot["pos"]
+    match pattern:
+        case "wander":
+            if now >= bot["turn_at"]:
+                bot["heading"] = random.uniform(0, 2 * math.pi)
+                bot["turn_at"] = now + WANDER_TURN_INTERVAL
+            return round(x + SPEED * math.cos(bot["heading"])), round(y + SPEED * math.sin(bot["heading"]))
+        case "circle":
+            # a circle around which the bot moves a bit slower than ``SPEED`` per packet, starting on it
+            radius = 0.9 * SPEED * packet_rate * CIRCLE_PERIOD / (2 * math.pi)
+            bot["heading"] = 2 * math.pi * (now % CIRCLE_PERIOD) / CIRCLE_PERIOD
+            return (round(bot["origin"][0] + radius * (math.cos(bot["heading"]) - 1)),
+                    round(bot["origin"][1] + radius * math.sin(bot["heading"])))
+    return x, y
+
+
+def send_client_message(bot: dict, message: bytes):
+    bot["sock"].sendto(encode_client_packet(bot["uuid"], bot["cipher"].encrypt(message)), bot["node_addr"])
+
+
+def send_routine(bot: dict, settings: argparse.Namespace, now: float):
+    """Sends a bot's routine packet, in which it moves along its pattern, and attacks, uses its skill or switches its
+    hotbar slot at random, at their configured rates."""
+    per_packet = 1 / settings.rate
+    bot["seqn"] += 1
+    bot["pos"] = next_position(bot, settings.pattern, settings.rate, now)
+    if random.random() < per_packet:
+        bot["slot"] = random.randrange(INVENTORY_COLUMNS)
+    body = encode_routine_client(bot["seqn"], bot["ack"], bot["pos"],
+                                 (math.cos(bot["heading"]), math.sin(bot["heading"])), bot["slot"],
+                                 random.random() < settings.attack_rate * per_packet,
+                                 random.random() < settings.skill_rate * per_packet)
+    send_client_message(bot, encode_message(MessageType.ROUTINE_CLIENT, body))
+    if bot["ack"] and bot["ack"] not in bot["pending_acks"]:
+        bot["pending_acks"][bot["ack"]] = now
+    if random.random() < settings.chat_rate * per_packet:
+        send_client_message(bot, encode_json_message(MessageType.CHAT_PACKET,
+                                                     {"new_message": random.choice(CHAT_MESSAGES)}))
+
+
+class SwarmStats:
+    """What a process measured while playing its bots."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.snapshots = 0
+        self.lost_snapshots = 0
+        self.timed_out_acks = 0
+        self.deaths = 0
+
+    def receive_snapshot(self, bot: dict, contents: dict, now: float):
+        seqn, baseline = contents["snapshot"], contents["baseline"]
+        if seqn <= bot["ack"]:
+            return  # reordered
+        if bot["ack"]:
+            self.lost_snapshots += seqn - bot["ack"] - 1
+        self.snapshots += 1
+        bot["ack"] = seqn
+        if contents["valid_pos"] != DEFAULT_POS_MARK:
+            bot["pos"] = tuple(contents["valid_pos"])
+        pending = bot["pending_acks"]
+        for ack in [ack for ack in pending if ack <= baseline]:
+            self.latencies.append(now - pending.pop(ack))
+
+    def expire_acks(self, bot: dict, now: float):
+        pending = bot["pending_acks"]
+        for ack in [ack for ack, sent_at in pending.items() if now - sent_at > ACK_TIMEOUT]:
+            del pending[ack]
+            self.timed_out_acks += 1
+
+
+def play(bots: List[dict], settings: argparse.Namespace) -> SwarmStats:
+    """Plays the bots for the run's duration, sending the routine packets of all bots at evenly staggered times.
+
+    :returns: the stats measured after the warmup"""
+    selector = selectors.DefaultSelector()
+    for bot in bots:
+        selector.register(bot["sock"], selectors.EVENT_READ, bot)
+    interval = 1 / settings.rate
+    start = time.perf_counter()
+    schedule = [(start + i * interval / len(bots), i) for i in range(len(bots))]
+    stats, warmed_up = SwarmStats(), False
+    while (now := time.perf_counter()) < start + settings.warmup + settings.duration:
+        if not warmed_up and now >= start + settings.warmup:
+            stats, warmed_up = SwarmStats(), True
+        while schedule and schedule[0][0] <= now:
+            send_at, i = heapq.heappop(schedule)
+            if not (bot := bots[i])["alive"]:
+                continue
+            send_routine(bot, settings, now)
+            stats.sent += 1
+            stats.expire_acks(bot, now)
+            heapq.heappush(schedule, (send_at + interval, i))
+        for key, _ in selector.select(max(schedule[0][0] - time.perf_counter(), 0) if schedule else interval):
+            bot = key.data
+            try:
+                contents = decode_message(bot["cipher"].decrypt(bot["sock"].recv(RECV_CHUNK)))
+            except (BlockingIOError, ConnectionError, InvalidToken, ValueError):
+                continue
+            match contents["id"]:
+                case MessageType.ROUTINE_SERVER:
+                    stats.receive_snapshot(bot, contents, time.perf_counter())
+                case MessageType.DIED_SERVER:
+                    bot["alive"] = False
+                    stats.deaths += 1
+                    selector.unregister(bot["sock"])
+    selector.close()
+    return stats
+
+
+def run_process(first: int, count: int, signed_up: int, settings: argparse.Namespace,
+                barrier: multiprocessing.Barrier, results: multiprocessing.Queue):
+    """Logs in bots ``first`` to ``first + count - 1``, waits for the other processes to log theirs in, plays them,
+    and closes their games. Bots whose username was already signed up (in an earlier run) log in instead."""
+    bots, login_times, failures = [], [], 0
+    for i in range(first, first + count):
+        start = time.perf_counter()
+        try:
+            bots.append(log_in((settings.root, ROOT_PORT), settings.advertise_ip, f"{settings.prefix}{i}",
+                               settings.password, settings.login or i < signed_up))
+        except (OSError, ValueError, KeyError, InvalidToken):
+            failures += 1
+            continue
+        login_times.append(time.perf_counter() - start)
+    barrier.wait()
+    stats = play(bots, settings) if bots else SwarmStats()
+    for bot in bots:
+        if bot["alive"]:
+            send_client_message(bot, encode_json_message(MessageType.CLOSED_GAME_CLIENT, {}))
+        bot["sock"].close()
+    results.put({"bots": len(bots), "alive": sum(bot["alive"] for bot in bots), "login_failures": failures,
+                 "login_times": login_times} | vars(stats))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[int(fraction * (len(values) - 1))] if values else 0.
+
+
+def run_swarm(bot_count: int, signed_up: int, settings: argparse.Namespace) -> Dict[str, float]:
+    """Plays a swarm of ``bot_count`` bots, split evenly between the processes.
+
+    :returns: latency, loss and tick rate stats of the whole swarm"""
+    context = multiprocessing.get_context("fork")
+    process_count = min(settings.processes, bot_count)
+    barrier, results = context.Barrier(process_count), context.Queue()
+    shares = [bot_count // process_count + (i < bot_count % process_count) for i in range(process_count)]
+    processes = [context.Process(target=run_process, daemon=True,
+                                 args=(sum(shares[:i]), share, signed_up, settings, barrier, results))
+                 for i, share in enumerate(shares)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for report in reports for latency in report["latencies"])
+    login_times = sorted(login_time for report in reports for login_time in report["login_times"])
+    snapshots = sum(report["snapshots"] for report in reports)
+    lost = sum(report["lost_snapshots"] for report in reports)
+    bots = sum(report["bots"] for report in reports)
+    return {"bots": bots,
+            "login_failures": sum(report["login_failures"] for report in reports),
+            "login_p50_ms": statistics.median(login_times) * 1000 if login_times else 0.,
+            "sent_pps": sum(report["sent"] for report in reports) / settings.duration,
+            "loss": lost / (snapshots + lost) if snapshots or lost else 0.,
+            "timed_out_acks": sum(report["timed_out_acks"] for report in reports),
+            "deaths": sum(report["deaths"] for report in reports),
+            "tick_rate": snapshots / bots / settings.duration if bots else 0.,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p90_ms": percentile(latencies, 0.9) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.}
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=socket.gethostbyname(socket.gethostname()), help="ip of the entry node")
+    parser.add_argument("--advertise-ip", default=socket.gethostbyname(socket.gethostname()),
+                        help="ip the nodes send the bots' snapshots to")
+    parser.add_argument("--bots", type=int, nargs="+", default=[16, 64, 256],
+                        help="numbers of bots, played one run after the other")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="processes the bots are spread over")
+    parser.add_argument("--duration", type=float, default=10, help="seconds every run is measured for")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds every run plays before it's measured")
+    parser.add_argument("--rate", type=float, default=60, help="routine packets every bot sends per second")
+    parser.add_argument("--pattern", choices=PATTERNS, default="wander", help="how the bots move")
+    parser.add_argument("--attack-rate", type=float, default=1, help="attacks per second of every bot")
+    parser.add_argument("--skill-rate", type=float, default=0.1, help="skill uses per second of every bot")
+    parser.add_argument("--chat-rate", type=float, default=0.05, help="chat messages per second of every bot")
+    parser.add_argument("--prefix", default=f"bot{uuid.uuid4().hex[:6]}_",
+                        help="prefix of the bots' usernames, which are numbered after it")
+    parser.add_argument("--password", default="bot-password")
+    parser.add_argument("--login", action="store_true",
+                        help="log in to existing accounts (of an earlier run with the same prefix) instead of "
+                             "signing up")
+    parsed = parser.parse_args(args)
+
+    print(f"{'bots':>5} {'logins':>7} {'login(ms)':>10} {'sent/s':>8} {'loss':>6} {'timeouts':>9} {'deaths':>7} "
+          f"{'tick(Hz)':>9} {'p50(ms)':>8} {'p90(ms)':>8} {'p99(ms)':>8} {'max(ms)':>8}")
+    signed_up = 0
+    for bot_count in parsed.bots:
+        res = run_swarm(bot_count, signed_up, parsed)
+        signed_up = max(signed_up, bot_count)
+        print(f"{bot_count:>5} {res['bots']:>7} {res['login_p50_ms']:>10.1f} {res['sent_pps']:>8.0f} "
+              f"{res['loss']:>6.1%} {res['timed_out_acks']:>9} {res['deaths']:>7} {res['tick_rate']:>9.1f} "
+              f"{res['p50_ms']:>8.2f} {res['p90_ms']:>8.2f} {res['p99_ms']:>8.2f} {res['max_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measures the memory footprint of the entity classes: bytes allocated per instance, objects the garbage collector
+has to track per instance, and the time it takes to create one.
+
+Run from the repository root with ``python -m backend.benchmarks.entity_memory_benchmark``."""
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List
+
+from backend.logic.entity_logic import Bag, Entity, Mob, Player, Projectile
+
+SHOOTER = Mob(pos=(0, 0))
+FACTORIES: Dict[str, Callable[[int], Entity]] = {
+    "mob": lambda i: Mob(pos=(i, i)),
+    "projectile": lambda i: Projectile(pos=(i, i), direction=(1., 0.), damage=10, shot_by=SHOOTER),
+    "bag": lambda i: Bag(pos=(i, i)),
+    "player": lambda i: Player(uuid=str(uuid.uuid4()), pos=(i, i), addr=("127.0.0.1", i)),
+}
+
+
+def measure(factory: Callable[[int], Entity], count: int) -> Dict[str, float]:
+    """Creates ``count`` entities twice: once timed, and once while tracing allocations, which slows it down.
+
+    :returns: bytes and gc tracked objects per entity, and microseconds per creation"""
+    start = time.perf_counter()
+    entities = [factory(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    del entities
+
+    gc.collect()
+    gc.disable()
+    tracked_before = len(gc.get_objects())
+    tracemalloc.start()
+    entities = [factory(i) for i in range(count)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracked = len(gc.get_objects()) - tracked_before
+    gc.enable()
+    # the list holding the entities is neither an entity's memory nor its gc overhead
+    allocated -= entities.__sizeof__()
+    return {"bytes": allocated / count, "gc_objects": (tracked - 1) / count, "create_us": elapsed / count * 1e6}
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=50000, help="number of entities created per class")
+    parser.add_argument("--kinds", nargs="+", choices=FACTORIES, default=list(FACTORIES))
+    parsed = parser.parse_args(args)
+
+    print(f"{'entity':>10} {'bytes/entity':>13} {'gc objects/entity':>18} {'create(us)':>11}")
+    for kind in parsed.kinds:
+        res = measure(FACTORIES[kind], parsed.count)
+        print(f"{kind:>10} {res['bytes']:>13.0f} {res['gc_objects']:>18.2f} {res['create_us']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
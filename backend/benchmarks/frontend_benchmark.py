@@ -0,0 +1,154 @@
+"""Compares the node's client packet front ends: the receiver thread feeding a pool of handler threads, the asyncio
+front end, and the asyncio front end with decryption offloaded to a process pool.
+
+Every front end serves a real ``Node`` in a process of its own, while this process plays closed-loop clients over
+loopback UDP: each client sends a routine packet, waits for the snapshot it triggers and sends the next one, so the
+reported latency is the full round trip of a routine packet (which includes waiting for the next simulation tick).
+
+Run from the ``backend`` directory (like the node itself) with
+``PYTHONPATH=.. python -m benchmarks.frontend_benchmark``."""
+import argparse
+import base64
+import logging
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import statistics
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from cryptography.fernet import InvalidToken
+
+import backend.node
+from backend.logic.server_controlled_entities import server_entities_handler
+from backend.networks.networking import S2SMessageType
+from common.consts import CipherMode, SHARED_KEY_SIZE, SESSION_CIPHER_MODE
+from common.message_type import MessageType
+from common.protocol import decode_message, encode_client_packet, encode_message, encode_routine_client
+from common.session_cipher import create_session_cipher
+
+FRONTENDS = ("threads", "asyncio", "asyncio+offload")
+REQUEST_TIMEOUT = 0.5
+"""Seconds after which a routine packet (or its snapshot) is considered lost, and the client moves on."""
+SPAWN_POS = (1500, 1500)
+SPAWN_SPACING = 100
+"""Horizontal distance between the clients' (fixed) positions, so that they don't collide with each other."""
+
+
+def serve(frontend: str, crypto_workers: int, logins: List[dict], port: multiprocessing.Value,
+          ready: multiprocessing.Event):
+    """Runs a node with the given front end, which has all the benchmark's clients about to join."""
+    logging.disable(logging.INFO)
+    os.setpgrp()  # so that the crypto pool's processes are killed together with the node
+    backend.node.ASYNC_FRONTEND = frontend != "threads"
+    backend.node.CRYPTO_OFFLOAD_WORKERS = crypto_workers if frontend == "asyncio+offload" else 0
+    backend.node.NETWORK_TICK_RATE = 0  # every routine packet is replied to, which the closed loop relies on
+    node = backend.node.Node(0, None)
+    node.server_sock.bind(("127.0.0.1", 0))
+    port.value = node.server_sock.getsockname()[1]
+    for login in logins:
+        node.handle_player_prelogin(login)
+    node.start_frontend()
+    threading.Thread(target=server_entities_handler, args=(node.tick_loop,), name="simulation").start()
+    ready.set()
+    backend.node.wait_for_threads()
+
+
+def run_clients(node_addr, clients: List[dict], duration: float) -> Dict[str, float]:
+    """Plays closed-loop clients against a node for ``duration`` seconds.
+
+    :returns: throughput, loss and round trip latency stats"""
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        client |= {"seqn": 0, "ack": 0, "sent_at": 0.}
+        selector.register(client["sock"], selectors.EVENT_READ, client)
+
+    def send(client: dict):
+        client["seqn"] += 1
+        message = encode_message(MessageType.ROUTINE_CLIENT, encode_routine_client(
+            client["seqn"], client["ack"], client["pos"], (0., 0.), 0, False, False))
+        client["sock"].sendto(encode_client_packet(client["uuid"], client["cipher"].encrypt(message)), node_addr)
+        client["sent_at"] = time.perf_counter()
+
+    latencies, lost = [], 0
+    start = time.perf_counter()
+    for client in clients:
+        send(client)
+    while (now := time.perf_counter()) - start < duration:
+        for key, _ in selector.select(timeout=REQUEST_TIMEOUT / 10):
+            client = key.data
+            packet = client["sock"].recv(2 ** 16)
+            latencies.append(time.perf_counter() - client["sent_at"])
+            try:
+                contents = decode_message(client["cipher"].decrypt(packet))
+            except (InvalidToken, ValueError):
+                continue
+            if contents["id"] == MessageType.ROUTINE_SERVER:
+                client["ack"] = contents["snapshot"]
+            send(client)
+        for client in clients:
+            if now - client["sent_at"] > REQUEST_TIMEOUT:
+                lost += 1
+                send(client)
+    elapsed = time.perf_counter() - start
+    selector.close()
+
+    latencies.sort()
+    return {"pps": len(latencies) / elapsed,
+            "loss": lost / (len(latencies) + lost) if latencies or lost else 0.,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.,
+            "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else 0.}
+
+
+def run_frontend(frontend: str, client_count: int, duration: float, crypto_workers: int, mode: CipherMode) \
+        -> Dict[str, float]:
+    clients, logins = [], []
+    for i in range(client_count):
+        pos = (SPAWN_POS[0] + i * SPAWN_SPACING, SPAWN_POS[1])
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        shared_key, player_uuid = os.urandom(SHARED_KEY_SIZE), str(uuid.uuid4())
+        clients.append({"sock": sock, "uuid": player_uuid, "pos": pos,
+                        "cipher": create_session_cipher(shared_key, mode, is_server=False)})
+        logins.append({"id": S2SMessageType.PLAYER_LOGIN, "key": base64.b64encode(shared_key).decode(),
+                       "uuid": player_uuid, "initial_pos": pos, "client_ip": "127.0.0.1",
+                       "client_port": sock.getsockname()[1], "is_login": False, "cipher": mode})
+
+    context = multiprocessing.get_context("fork")
+    port, ready = context.Value("i", 0), context.Event()
+    server = context.Process(target=serve, args=(frontend, crypto_workers, logins, port, ready))
+    server.start()
+    try:
+        ready.wait()
+        return run_clients(("127.0.0.1", port.value), clients, duration)
+    finally:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.join()
+        for client in clients:
+            client["sock"].close()
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64], help="numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=5, help="seconds every run lasts")
+    parser.add_argument("--crypto-workers", type=int, default=2, help="size of the offloaded decryption pool")
+    parser.add_argument("--cipher", choices=[mode.name for mode in CipherMode], default=SESSION_CIPHER_MODE.name)
+    parser.add_argument("--frontends", nargs="+", choices=FRONTENDS, default=FRONTENDS)
+    parsed = parser.parse_args(args)
+
+    print(f"{'clients':>7} {'frontend':>16} {'packets/s':>10} {'loss':>6} {'p50(ms)':>8} {'p99(ms)':>8}")
+    for client_count in parsed.clients:
+        for frontend in parsed.frontends:
+            res = run_frontend(frontend, client_count, parsed.duration, parsed.crypto_workers,
+                               CipherMode[parsed.cipher])
+            print(f"{client_count:>7} {frontend:>16} {res['pps']:>10.0f} {res['loss']:>6.1%} "
+                  f"{res['p50_ms']:>8.2f} {res['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Times the simulation on the real map: projectile and mob updates, melee attacks, movement validation and the view
+queries that snapshots are built from, for configurable numbers of players, mobs, projectiles and bags.
+
+Runs are deterministic for a given seed: the world and every player's input are drawn from seeded generators, entity
+ids are allocated anew for every run, and attack cooldowns run on a simulated clock that advances by one frame per
+tick instead of on the wall clock. Results are written as JSON, so that they can be compared across spatial index and
+AI changes.
+
+Run from the ``backend`` directory (like the node itself, which the map is loaded by) with
+``PYTHONPATH=.. python -m benchmarks.simulation_benchmark``."""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+
+import backend.logic.entity_logic as entity_logic
+from backend.backend_consts import GRID_CELL_SIZE, FRAME_TIME
+from backend.logic.collision import invalid_movement
+from backend.logic.entity_logic import Bag, EntityManager, Mob, Player, Projectile, get_item, partition_entity_ids
+from backend.logic.server_controlled_entities import update_mobs, update_projectiles
+from backend.logic.spatial_index import GridIndex, StaticRectIndex
+from backend.networks.networking import serialize_entity_list
+from backend.node import create_map
+from common.consts import EntityType, SCREEN_HEIGHT, SCREEN_WIDTH, SPEED, SWORD
+from common.utils import get_bounding_box
+
+PHASES = ("update_projectiles", "update_mobs", "melee_attack", "invalid_movement", "view_query")
+POPULATIONS = {
+    "small": {"players": 16, "mobs": 100, "projectiles": 50, "bags": 20},
+    "medium": {"players": 64, "mobs": 400, "projectiles": 300, "bags": 100},
+    "large": {"players": 256, "mobs": 1600, "projectiles": 1500, "bags": 400},
+}
+
+
+class SimulatedClock:
+    """Stands in for the ``time`` module of ``entity_logic``, so that attack cooldowns depend on ticks only."""
+
+    def __init__(self):
+        self.now = 0.
+
+    def time(self) -> float:
+        return self.now
+
+
+@contextlib.contextmanager
+def simulated_clock() -> Iterator[SimulatedClock]:
+    clock, real_time = SimulatedClock(), entity_logic.time
+    entity_logic.time = clock
+    try:
+        yield clock
+    finally:
+        entity_logic.time = real_time
+
+
+def spawn_projectile(manager: EntityManager, rng: random.Random, shooters: List):
+    angle = rng.uniform(0, 2 * math.pi)
+    manager.add_entity(Projectile(pos=manager.get_available_position(EntityType.PROJECTILE),
+                                  direction=(math.cos(angle), math.sin(angle)), damage=10,
+                                  shot_by=rng.choice(shooters)))
+
+
+def populate(obstacles: StaticRectIndex, population: Dict[str, int], rng: random.Random) -> EntityManager:
+    """Builds a world on the map with the given numbers of entities, at available positions."""
+    manager = EntityManager(GridIndex(GRID_CELL_SIZE), obstacles)
+    for i in range(population["players"]):
+        manager.add_entity(Player(pos=manager.get_available_position(EntityType.PLAYER), addr=("127.0.0.1", i)))
+    for _ in range(population["mobs"]):
+        manager.add_entity(Mob(pos=manager.get_available_position(EntityType.MOB)))
+    for _ in range(population["bags"]):
+        manager.add_entity(Bag(pos=manager.get_available_position(EntityType.BAG)))
+    shooters = list(manager.players.values()) + list(manager.mobs.values())
+    for _ in range(population["projectiles"]):
+        spawn_projectile(manager, rng, shooters)
+    return manager
+
+
+def run_population(obstacles: StaticRectIndex, population: Dict[str, int], ticks: int, seed: int) \
+        -> Dict[str, object]:
+    """Simulates ``ticks`` ticks, in which every player moves, attacks with a sword and queries its view, and the
+    projectiles and mobs are updated. Projectiles that were removed are replenished between ticks, so that their
+    number stays steady.
+
+    :returns: the milliseconds every phase took on every tick, and the entities left in the end"""
+    random.seed(seed)
+    np.random.seed(seed)
+    rng = random.Random(seed)
+    partition_entity_ids(0, 1)  # fresh ids, so that every run has the same keys and iteration orders
+    manager = populate(obstacles, population, rng)
+    sword = get_item(SWORD)
+    timings: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+
+    def timed(phase: str, func: Callable[[], None]):
+        start = time.perf_counter()
+        func()
+        timings[phase].append((time.perf_counter() - start) * 1000)
+
+    def attack_all():
+        for player in list(manager.players.values()):
+            sword.use_to_attack(player, manager)
+
+    def move_all():
+        for player in manager.players.values():
+            seqn = player.last_updated_seqn + 1
+            new_pos = player.pos[0] + rng.randint(-SPEED, SPEED), player.pos[1] + rng.randint(-SPEED, SPEED)
+            if not invalid_movement(player, new_pos, seqn, manager):
+                manager.update_entity_location(player, new_pos)
+            player.last_updated_seqn = seqn
+
+    def query_all():
+        packed = {}
+        for player in manager.players.values():
+            view = get_bounding_box(player.pos, SCREEN_HEIGHT, SCREEN_WIDTH)
+            serialize_entity_list(manager.get_visible_entities(player, view), packed)
+            manager.pack_visible_projectiles(view, packed)
+
+    with simulated_clock() as clock:
+        for _ in range(ticks):
+            clock.now += FRAME_TIME
+            timed("update_projectiles", lambda: update_projectiles(manager))
+            timed("update_mobs", lambda: update_mobs(manager))
+            timed("melee_attack", attack_all)
+            timed("invalid_movement", move_all)
+            timed("view_query", query_all)
+            shooters = list(manager.players.values()) + list(manager.mobs.values())
+            for _ in range(population["projectiles"] - len(manager.projectile_store)):
+                spawn_projectile(manager, rng, shooters)
+
+    return {"phases": {phase: {"mean_ms": statistics.fmean(samples),
+                               "p50_ms": statistics.median(samples),
+                               "p99_ms": sorted(samples)[int(0.99 * (len(samples) - 1))],
+                               "total_ms": sum(samples)}
+                       for phase, samples in timings.items()},
+            "final": {"players": len(manager.players), "mobs": len(manager.mobs), "bags": len(manager.bags),
+                      "projectiles": len(manager.projectile_store)}}
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--populations", nargs="+", choices=POPULATIONS, default=list(POPULATIONS))
+    parser.add_argument("--players", type=int, help="overrides the number of players of every population")
+    parser.add_argument("--mobs", type=int, help="overrides the number of mobs of every population")
+    parser.add_argument("--projectiles", type=int, help="overrides the number of projectiles of every population")
+    parser.add_argument("--bags", type=int, help="overrides the number of bags of every population")
+    parser.add_argument("--ticks", type=int, default=200, help="number of simulated ticks per population")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file the JSON results are written to, instead of the standard output")
+    parsed = parser.parse_args(args)
+    logging.disable(logging.WARNING)  # mobs log every tracking decision, and players every collision
+
+    start = time.perf_counter()
+    obstacles = create_map()
+    results = {"seed": parsed.seed,
+               "ticks": parsed.ticks,
+               "python": platform.python_version(),
+               "map": {"obstacles": len(obstacles), "load_ms": (time.perf_counter() - start) * 1000},
+               "populations": {}}
+    for name in parsed.populations:
+        population = {kind: getattr(parsed, kind) if getattr(parsed, kind) is not None else count
+                      for kind, count in POPULATIONS[name].items()}
+        results["populations"][name] = {"population": population} | \
+            run_population(obstacles, population, parsed.ticks, parsed.seed)
+
+    if parsed.output:
+        with open(parsed.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compares the spatial index backends under a game-like workload.
+
+Run from the repository root with ``python -m backend.benchmarks.spatial_index_benchmark``."""
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from backend.backend_consts import GRID_CELL_SIZE, MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT
+from backend.logic.spatial_index import SpatialIndex, QuadtreeIndex, GridIndex
+from common.consts import WORLD_WIDTH, WORLD_HEIGHT, EntityType, SPEED
+from common.utils import get_entity_bounding_box, get_bounding_box
+
+ENTITY_COUNTS = (100, 1000, 10000)
+BACKENDS: Dict[str, Callable[[], SpatialIndex]] = {
+    "quadtree": lambda: QuadtreeIndex((0, 0, WORLD_WIDTH, WORLD_HEIGHT)),
+    "grid": lambda: GridIndex(GRID_CELL_SIZE),
+}
+
+
+def _timed(func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_backend(make_index: Callable[[], SpatialIndex], entity_count: int, ticks: int, seed: int) -> Dict[str, float]:
+    """Times insertion, a number of ticks in which every entity moves, and one sight query per entity per tick.
+
+    :returns: total seconds spent in each phase"""
+    rng = random.Random(seed)
+    kinds = [rng.choice((EntityType.PLAYER, EntityType.MOB, EntityType.PROJECTILE)) for _ in range(entity_count)]
+    positions = [(rng.randrange(WORLD_WIDTH // 3), rng.randrange(WORLD_HEIGHT // 3)) for _ in range(entity_count)]
+    steps = [(rng.randint(-SPEED, SPEED), rng.randint(-SPEED, SPEED)) for _ in range(entity_count)]
+    index = make_index()
+
+    def insert_all():
+        for i, (kind, pos) in enumerate(zip(kinds, positions)):
+            index.insert((kind, i), get_entity_bounding_box(pos, kind))
+
+    def move_all():
+        for i, (kind, pos, step) in enumerate(zip(kinds, positions, steps)):
+            new_pos = pos[0] + step[0], pos[1] + step[1]
+            index.move((kind, i), get_entity_bounding_box(pos, kind), get_entity_bounding_box(new_pos, kind))
+            positions[i] = new_pos
+
+    def query_all():
+        for pos in positions:
+            index.intersect(get_bounding_box(pos, MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT))
+
+    results = {"insert": _timed(insert_all), "move": 0., "query": 0.}
+    for _ in range(ticks):
+        results["move"] += _timed(move_all)
+        results["query"] += _timed(query_all)
+    return results
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=5, help="number of simulated ticks per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parsed = parser.parse_args(args)
+
+    print(f"{'entities':>8} {'backend':>9} {'insert(ms)':>11} {'move/tick(ms)':>14} {'query/tick(ms)':>15}")
+    for entity_count in ENTITY_COUNTS:
+        for name, make_index in BACKENDS.items():
+            res = run_backend(make_index, entity_count, parsed.ticks, parsed.seed)
+            print(f"{entity_count:>8} {name:>9} {res['insert'] * 1000:>11.2f} "
+                  f"{res['move'] * 1000 / parsed.ticks:>14.2f} {res['query'] * 1000 / parsed.ticks:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Precompiled collision map: the map's obstacles, compiled out of its tile layers and Tiled tilesets into a binary
+artifact that nodes memory-map at startup, instead of loading the map's tiles and images themselves.
+
+The artifact holds two arrays:
+    * ``rects``: the bounding box of every obstacle in world coordinates, of shape (n, 4) and format
+      (x_min, y_min, x_max, y_max)
+    * ``solidity``: a grid with a cell per map tile, which is 1 where a tile of any layer has collision objects
+
+It's a short JSON header describing the arrays, followed by their raw data. Compile it from the repository root with
+``python -m backend.logic.collision_map``; nodes compile it themselves if it's missing or older than the layers."""
+import argparse
+import json
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from backend.backend_consts import COLLISION_MAP_PATH, MAP_COLLISION_LAYERS
+from backend.logic.spatial_index import StaticRectIndex
+
+REPOSITORY_ROOT = Path(__file__).resolve().parents[2]
+MAGIC = b"RPGCMAP1"
+HEADER_SIZE = struct.Struct("!I")
+ALIGNMENT = 64
+"""Alignment of every array's data in the artifact."""
+
+Layer = Tuple[str, str]
+
+
+class CollisionMap:
+    """The arrays of a collision map, see the module's documentation."""
+
+    def __init__(self, rects: np.ndarray, solidity: np.ndarray, tile_width: int, tile_height: int):
+        self.rects = rects
+        self.solidity = solidity
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+
+    def build_index(self, cell_size: int) -> StaticRectIndex:
+        return StaticRectIndex(self.rects, cell_size)
+
+    def is_solid(self, tile_x: int, tile_y: int) -> bool:
+        """Returns whether a map tile has collision objects. Tiles outside the map have none."""
+        return 0 <= tile_y < self.solidity.shape[0] and 0 <= tile_x < self.solidity.shape[1] and \
+            bool(self.solidity[tile_y, tile_x])
+
+
+def load_tileset_collisions(tileset_path: Path) -> Tuple[Dict[int, List[Tuple[int, int, int, int]]], int, int]:
+    """Reads the collision objects of a Tiled tileset.
+
+    :returns: the (x, y, width, height) collision rects of every tile that has any, relative to the tile, and the
+        width and height of the tiles"""
+    with open(tileset_path) as tileset_file:
+        tileset = json.load(tileset_file)
+    collisions = {tile["id"]: [(int(obj["x"]), int(obj["y"]), int(obj["width"]), int(obj["height"]))
+                               for obj in tile["objectgroup"]["objects"]]
+                  for tile in tileset.get("tiles", ()) if tile.get("objectgroup", {}).get("objects")}
+    return collisions, tileset["tilewidth"], tileset["tileheight"]
+
+
+def compile_collision_map(layers: Iterable[Layer], root: Path = REPOSITORY_ROOT) -> CollisionMap:
+    """Compiles the obstacles of the given map layers.
+
+    An obstacle's bounding box is the one the map loader gave it: centered on the top left corner of its collision
+    rect (see ``common.utils.get_bounding_box``), which is what the game was tuned with.
+
+    :param layers: (tiles CSV, Tiled tileset) pairs, relative to ``root``"""
+    rects, grids, tile_size = [], [], None
+    for csv_path, tileset_path in layers:
+        collisions, tile_width, tile_height = load_tileset_collisions(root / tileset_path)
+        if tile_size not in (None, (tile_width, tile_height)):
+            raise ValueError(f"tileset {tileset_path} has a different tile size than the previous layers")
+        tile_size = tile_width, tile_height
+        grid = np.loadtxt(root / csv_path, delimiter=",", dtype=np.int32, ndmin=2)
+        grids.append(np.isin(grid, list(collisions)))
+        for tile_id, objects in collisions.items():
+            tile_ys, tile_xs = np.nonzero(grid == tile_id)
+            for x, y, width, height in objects:
+                xs, ys = tile_xs * tile_width + x, tile_ys * tile_height + y
+                rects.append(np.column_stack((xs - width // 2, ys - height // 2, xs + width // 2, ys + height // 2)))
+
+    tile_width, tile_height = tile_size or (1, 1)
+    shape = (max((grid.shape[0] for grid in grids), default=0), max((grid.shape[1] for grid in grids), default=0))
+    solidity = np.zeros(shape, dtype=np.uint8)
+    for grid in grids:
+        solidity[:grid.shape[0], :grid.shape[1]] |= grid
+    return CollisionMap(np.concatenate(rects).astype(np.int32) if rects else np.empty((0, 4), dtype=np.int32),
+                        solidity, tile_width, tile_height)
+
+
+def _align(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def save_collision_map(collision_map: CollisionMap, path: Path, layers: Sequence[Layer]):
+    """Writes a collision map artifact. It's written to a temporary file that then replaces ``path``, so that nodes
+    starting meanwhile never map a partially written artifact."""
+    arrays = {"rects": np.ascontiguousarray(collision_map.rects, dtype="<i4"),
+              "solidity": np.ascontiguousarray(collision_map.solidity, dtype=np.uint8)}
+    header = {"tile_width": collision_map.tile_width, "tile_height": collision_map.tile_height,
+              "layers": [list(layer) for layer in layers], "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        # relative to the end of the header, which is aligned as well
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += _align(array.nbytes)
+
+    encoded_header = json.dumps(header).encode()
+    data_start = _align(len(MAGIC) + HEADER_SIZE.size + len(encoded_header))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as artifact:
+        artifact.write(MAGIC + HEADER_SIZE.pack(len(encoded_header)) + encoded_header)
+        for name, array in arrays.items():
+            artifact.seek(data_start + header["arrays"][name]["offset"])
+            artifact.write(array.tobytes())
+        artifact.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+
+def read_header(path: Path) -> Tuple[dict, int]:
+    """:returns: the header of a collision map artifact, and the offset its arrays' data starts at
+    :raises ValueError: if the file isn't a collision map artifact"""
+    with open(path, "rb") as artifact:
+        if artifact.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} isn't a collision map")
+        header_length, = HEADER_SIZE.unpack(artifact.read(HEADER_SIZE.size))
+        return json.loads(artifact.read(header_length)), _align(len(MAGIC) + HEADER_SIZE.size + header_length)
+
+
+def load_collision_map(path: Path) -> CollisionMap:
+    """Memory-maps a collision map artifact, read-only.
+
+    :raises ValueError: if the file isn't a collision map artifact"""
+    header, data_start = read_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        # empty arrays can't be mapped
+        arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape) \
+            if all(shape) else np.empty(shape, dtype=dtype)
+    return CollisionMap(arrays["rects"], arrays["solidity"], header["tile_width"], header["tile_height"])
+
+
+def is_outdated(path: Path, layers: Sequence[Layer], root: Path = REPOSITORY_ROOT) -> bool:
+    """Returns whether an artifact is missing, was compiled from other layers, or is older than any of its layers."""
+    try:
+        header, _ = read_header(path)
+    except (OSError, ValueError):
+        return True
+    if header["layers"] != [list(layer) for layer in layers]:
+        return True
+    compiled_at = path.stat().st_mtime
+    return any((root / source).stat().st_mtime > compiled_at for layer in layers for source in layer)
+
+
+def load_or_compile_collision_map(path: str = COLLISION_MAP_PATH, layers: Sequence[Layer] = MAP_COLLISION_LAYERS,
+                                  root: Path = REPOSITORY_ROOT) -> CollisionMap:
+    """Memory-maps the collision map, compiling it first if it's outdated (see ``is_outdated``).
+
+    :param path: path of the artifact, relative to ``root``"""
+    artifact_path = root / path
+    if is_outdated(artifact_path, layers, root):
+        logging.info(f"[map] compiling the collision map into {artifact_path}")
+        save_collision_map(compile_collision_map(layers, root), artifact_path, layers)
+    return load_collision_map(artifact_path)
+
+
+def main(args: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=COLLISION_MAP_PATH, help="artifact path, relative to the repository root")
+    parser.add_argument("--layer", nargs=2, action="append", metavar=("CSV", "TILESET"), dest="layers",
+                        help="a layer of the map and its tileset, relative to the repository root (repeatable); "
+                             "defaults to the layers in backend_consts.MAP_COLLISION_LAYERS")
+    parsed = parser.parse_args(args)
+    layers = [tuple(layer) for layer in parsed.layers] if parsed.layers else list(MAP_COLLISION_LAYERS)
+
+    collision_map = compile_collision_map(layers)
+    save_collision_map(collision_map, REPOSITORY_ROOT / parsed.output, layers)
+    print(f"compiled {len(collision_map.rects)} obstacles on a {collision_map.solidity.shape[1]}x"
+          f"{collision_map.solidity.shape[0]} tile grid into {parsed.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Node-local integer entity ids, which identify entities on the wire, and key the transient entities (everything but
+players) in the node's indices instead of uuids."""
+import collections
+import threading
+from typing import Callable, Deque, Dict
+
+INDEX_BITS = 20
+"""Low bits of an id, holding its index. The high bits hold its generation, so that an id fits the wire's uint32."""
+GENERATION_BITS = 32 - INDEX_BITS
+INDEX_MASK = (1 << INDEX_BITS) - 1
+GENERATION_MASK = (1 << GENERATION_BITS) - 1
+
+
+class EntityIdAllocator:
+    """Allocates entity ids, recycling the indices of released ids.
+
+    Every id is an index and a generation. A released index is reused (in FIFO order) with its generation bumped, so
+    that a stale id, e.g. one still tracked by a mob or not yet removed by a client, never aliases the entity that
+    reuses its index. Releasing an id that is stale does nothing.
+
+    With ``count`` greater than 1, only the indices that are ``offset`` modulo ``count`` (counting from 1) are
+    allocated, so that the workers of a sharded node never allocate colliding ids. An entity handed off to another
+    worker keeps its id, so the worker that removes it may not be the one that allocated it: releasing an id of another
+    allocator passes it to ``release_foreign``, which should send it back to its owner (see ``owner_of``). Without
+    it, such ids would never be reused, and a long-running worker would eventually run out of ids."""
+
+    def __init__(self, offset: int = 0, count: int = 1, release_foreign: Callable[[int], None] | None = None):
+        self.offset = offset
+        self.count = count
+        self.release_foreign = release_foreign
+        self._lock = threading.Lock()
+        self._next_index = offset + 1
+        self._free: Deque[int] = collections.deque()
+        self._generations: Dict[int, int] = {}
+        """Current generation of every index that was ever released."""
+
+    def __len__(self):
+        """Number of ids that are currently allocated."""
+        return (self._next_index - self.offset - 1) // self.count - len(self._free)
+
+    def allocate(self) -> int:
+        """:raises OverflowError: if all indices are allocated"""
+        with self._lock:
+            if self._free:
+                index = self._free.popleft()
+                return self._generations[index] << INDEX_BITS | index
+            index = self._next_index
+            if index > INDEX_MASK:
+                raise OverflowError("ran out of entity ids")
+            self._next_index += self.count
+            return index
+
+    def owner_of(self, entity_id: int) -> int:
+        """Returns the offset of the allocator that allocated an id."""
+        return ((entity_id & INDEX_MASK) - 1) % self.count
+
+    def release(self, entity_id: int):
+        """Makes the index of an id reusable, under the next generation. Ids of other allocators are passed to
+        ``release_foreign``."""
+        index, generation = entity_id & INDEX_MASK, entity_id >> INDEX_BITS
+        if self.owner_of(entity_id) != self.offset:
+            # allocated by another worker, and handed off to this one
+            if self.release_foreign is not None:
+                self.release_foreign(entity_id)
+            return
+        if index >= self._next_index:
+            return
+        with self._lock:
+            if self._generations.get(index, 0) != generation:
+                return
+            self._generations[index] = (generation + 1) & GENERATION_MASK
+            self._free.append(index)
@@ -1,59 +1,126 @@
 import abc
-import contextlib
 import dataclasses
+import itertools
 import logging
+import math
 import random
-import threading
 import time
-import uuid
 from abc import ABC
 from dataclasses import dataclass
 from typing import Dict, Iterable, List, Type, Callable, ClassVar, Tuple
 
 import numpy as np
-from cryptography.fernet import Fernet
-from pyqtree import Index
 
 from backend.backend_consts import BAG_SIZE, MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT, RANGED_OFFSET, MOB_ERROR_TERM, \
-    FRAME_TIME, PET_SPAWN_X_DELTA, PET_SPAWN_Y_DELTA
+    FRAME_TIME, PET_SPAWN_X_DELTA, PET_SPAWN_Y_DELTA, MOB_STOP_DISTANCE
+from backend.logic.entity_ids import EntityIdAllocator
+from backend.logic.entity_pool import EntityPool
+from backend.logic.interest import InterestGrid
+from backend.logic.projectile_store import ProjectileStore
+from backend.logic.spatial_index import SpatialIndex, StaticRectIndex
 from common.consts import EntityType, DEFAULT_POS_MARK, Pos, Dir, DEFAULT_DIR, WORLD_WIDTH, WORLD_HEIGHT, \
     MIN_ITEM_NUMBER, MAX_ITEM_NUMBER, MAX_HEALTH, PROJECTILE_TTL, PROJECTILE_WIDTH, PROJECTILE_HEIGHT, PROJECTILE_SPEED, \
     SWORD, AXE, BOW, REGENERATION_POTION, EMPTY_SLOT, INVENTORY_COLUMNS, INVENTORY_ROWS, Addr, MOB_MIN_WEAPON, \
     MOB_MAX_WEAPON, MOB_SPEED, BOT_HEIGHT, BOT_WIDTH, CLIENT_HEIGHT, CLIENT_WIDTH, MIN_HEALTH, \
     ARROW_OFFSET_FACTOR, DAMAGE_POTION, RESISTANCE_POTION, USELESS_ITEM, FIRE_BALL, MAHAK, PET_EGG, MIN_SKILL, \
     MAX_SKILL, FIREBALL_PROJECTILE, ERASER_PROJECTILE
-from common.utils import get_entity_bounding_box, get_bounding_box, normalize_vec
+from common.protocol import encode_entity
+from common.session_cipher import SessionCipher
+from common.utils import get_entity_bounding_box, get_bounding_box, normalize_vec, is_empty
 
+_entity_ids = EntityIdAllocator()
+"""Source of the node-local integer ids that identify entities on the wire."""
 
-@dataclass
+
+def partition_entity_ids(index: int, count: int, release_foreign: Callable[[int], None] | None = None):
+    """Makes this process allocate only the entity ids that are ``index`` modulo ``count``, so that the workers of a
+    sharded node never hand off entities with colliding ids.
+
+    :param release_foreign: sends the ids of other workers that are released in this one back to their owner, see
+        ``EntityIdAllocator``"""
+    global _entity_ids
+    _entity_ids = EntityIdAllocator(index, count, release_foreign)
+
+
+def entity_id_owner(entity_id: int) -> int:
+    """Returns the index (see ``partition_entity_ids``) of the process that allocated an entity id."""
+    return _entity_ids.owner_of(entity_id)
+
+
+def release_entity_id(entity_id: int):
+    """Lets the id of an entity that left the game be reused, see ``EntityIdAllocator``."""
+    _entity_ids.release(entity_id)
+
+
+@dataclass(slots=True)
 class Entity(abc.ABC):
+    """Base of all entities. Entities are slotted, since a node holds tens of thousands of them, and a per-instance
+    ``__dict__`` would be most of their memory. Note that zero-argument ``super()`` doesn't work in the methods of
+    slotted dataclasses (which are recreated by the decorator), so their methods pass their class explicitly."""
     speed: ClassVar[int] = 0
     kind: ClassVar[EntityType]
     pos: Pos = DEFAULT_POS_MARK
     direction: Dir = DEFAULT_DIR
-    uuid: str = dataclasses.field(default_factory=lambda: str(uuid.uuid4()))
+    uuid: str | int | None = None
+    """Key of the entity in the entity manager. Players are keyed by their persistent uuid, and all other entities by
+    their entity id, which is what it defaults to."""
+    entity_id: int = dataclasses.field(default_factory=lambda: _entity_ids.allocate())
+    _packed: Tuple[tuple, bytes] | None = dataclasses.field(default=None, init=False, repr=False, compare=False)
+    """The latest packed record, with the ``record_key`` it was packed from."""
+
+    def __post_init__(self):
+        if self.uuid is None:
+            self.uuid = self.entity_id
+
+    def record_key(self) -> tuple:
+        """Returns the values the entity's packed record is made of, so that the record is only packed again once one
+        of them changes."""
+        return self.entity_id, self.pos, self.direction
+
+    def pack(self) -> bytes:
+        """Returns the entity's packed record (see ``encode_entity``), which is cached until the entity changes, so
+        that all players seeing an entity share its encoding across ticks."""
+        key = self.record_key()
+        if self._packed is None or self._packed[0] != key:
+            self._packed = key, encode_entity(self.serialize())
+        return self._packed[1]
 
     def serialize(self) -> dict:
         """Returns a dictionary encoding for a client all necessary data to know about an entity."""
         return {"type": self.kind,
                 "pos": self.pos,
                 "dir": self.direction,
-                "uuid": self.uuid}
+                "id": self.entity_id}
 
 
 class EntityManager:
-    """Use to control and access all game entities."""
+    """Use to control and access all game entities.
+
+    The manager isn't thread safe: the world is only ever mutated by the simulation thread, which the other threads
+    queue their changes to (see ``Node.commands``)."""
 
-    def __init__(self, spindex: Index):
+    def __init__(self, spindex: SpatialIndex, obstacles: StaticRectIndex | None = None,
+                 interest: InterestGrid | None = None):
         self._grouped_entities: Dict[EntityType, Dict[str, Entity]] = {}
         """Dictionary of entities ordered by type."""
 
         self.spindex = spindex
-        """Quadtree for collision/range detection. Player keys are tuples `(type, uuid)`, with the type being
-        projectile/player/mob, and the uuid being, well, the uuid."""
+        """Spatial index for collision/range detection of dynamic entities. Player keys are tuples `(type, uuid)`,
+        with the type being projectile/player/mob/bag, and the uuid being the entity's ``uuid`` key (which is the
+        entity id of anything but a player)."""
+
+        self.obstacles = obstacles if obstacles is not None else StaticRectIndex([], 1)
+        """Static map obstacles, kept out of ``spindex`` and only queried by collision code."""
+
+        self.interest = interest if interest is not None else InterestGrid()
+        """Subscriptions of the players to the entities around them, with the same keys as ``spindex``."""
+
+        self.projectile_store = ProjectileStore()
+        """Projectiles are kept out of ``spindex`` and ``_grouped_entities``, and are advanced in batches instead."""
 
-        self.mob_lock = threading.RLock()
-        self.projectile_lock = threading.RLock()
+        self.pool = EntityPool()
+        """Released projectile and bag objects, which are reused instead of allocating new ones. Projectiles are only
+        materialized from it for handling hits and for packing snapshots."""
 
     @property
     def players(self) -> dict:
@@ -61,13 +128,20 @@ class EntityManager:
 
     @property
     def projectiles(self) -> dict:
-        return self._grouped_entities.get(EntityType.PROJECTILE, {})
+        """Materialized copies of all projectiles. Changing them doesn't affect ``projectile_store``."""
+        return {projectile.uuid: projectile for projectile in self.projectile_store}
 
     @property
     def mobs(self) -> dict:
         return self._grouped_entities.get(EntityType.MOB, {})
 
+    @property
+    def bags(self) -> dict:
+        return self._grouped_entities.get(EntityType.BAG, {})
+
     def get(self, entity_uuid: str, entity_kind: EntityType) -> Entity | None:
+        if entity_kind == EntityType.PROJECTILE:
+            return self.projectile_store.get(entity_uuid)
         if not (kind_group := self._grouped_entities.get(entity_kind, None)):
             return None
         return kind_group.get(entity_uuid, None)
@@ -93,39 +167,74 @@ class EntityManager:
         :returns: an iterable containing all entities in a search rectangle of dimensions `height` and `width`, except
             the entity with uuid `entity_uuid`
         """
-        return map(lambda data: self.get(data[1], data[0]),
-                   filter(lambda data: entity_filter(*data) and data[0] != EntityType.OBSTACLE,
-                          self.spindex.intersect(bbox)))
+        return itertools.chain(map(lambda data: self.get(data[1], data[0]),
+                                   filter(lambda data: entity_filter(*data), self.spindex.intersect(bbox))),
+                               self.projectile_store.in_range(bbox, entity_filter))
+
+    def get_visible_entities(self, player: Entity, view: Tuple[int, int, int, int]) -> List[Entity]:
+        """Returns the entities a player sees: the ones it's subscribed to in ``interest`` whose bounding box intersects
+        with its view. Subscriptions span whole cells and a margin around them, so they're clipped to the view, which
+        keeps snapshots (and their deltas) as small as the view. Projectiles are short-lived and move every tick, so
+        they aren't subscribed to, and are packed straight from their store instead (see ``pack_visible_projectiles``).
+
+        :param view: the player's view rectangle, of format (x_min, y_min, x_max, y_max)"""
+        # the area the position of an entity of every kind is in if its bounding box intersects with the view
+        areas = {}
+        visible = []
+        for kind, entity_uuid in self.interest.subscriptions((player.kind, player.uuid)):
+            if (entity := self.get(entity_uuid, kind)) is None:
+                continue
+            if (area := areas.get(kind, None)) is None:
+                x_min, y_min, x_max, y_max = get_entity_bounding_box((0, 0), kind)
+                area = areas[kind] = view[0] - x_max, view[1] - y_max, view[2] - x_min, view[3] - y_min
+            if area[0] <= entity.pos[0] <= area[2] and area[1] <= entity.pos[1] <= area[3]:
+                visible.append(entity)
+        return visible
+
+    def pack_visible_projectiles(self, view: Tuple[int, int, int, int],
+                                 packed: Dict[int, bytes] | None = None) -> Dict[int, bytes]:
+        """Returns the packed records of the projectiles in a player's view, by entity id.
+
+        :param view: the player's view rectangle, of format (x_min, y_min, x_max, y_max)
+        :param packed: records already packed during this network tick, see ``serialize_entity_list``"""
+        return self.projectile_store.pack_in_range(view, self.pool, packed)
 
     def get_collidables_with(self, entity: Entity) -> Iterable[Entity]:
         """Get all objects that collide with entity"""
         return self.get_entities_in_range(get_entity_bounding_box(entity.pos, entity.kind),
                                           entity_filter=lambda _, entity_id: entity_id != entity.uuid)
 
-    def get_entity_lock(self, entity: Entity):
-        """Returns a matching lock for an entity, or a null context handler otherwise."""
-        match entity.kind:
-            case EntityType.PROJECTILE:
-                return self.projectile_lock
-            case EntityType.MOB:
-                return self.mob_lock
-            case EntityType.PLAYER:
-                return entity.lock
-            case _:
-                return contextlib.nullcontext()
+    def collides_with_obstacles(self, bbox: Tuple[int, int, int, int]) -> bool:
+        """Returns whether a bounding box intersects with any of the map's obstacles."""
+        return self.obstacles.collides(bbox)
 
     def update_entity_location(self, entity: Entity, new_location: Pos):
-        # with self.get_entity_lock(entity):
         # logging.debug(f"[debug] updating entity uuid={entity.uuid} of {kind=} to {new_location=}")
-        self.spindex.remove((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind))
+        if entity.kind == EntityType.PROJECTILE:
+            self.projectile_store.move(entity.uuid, new_location)
+            entity.pos = new_location
+            return
+        self.spindex.move((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind),
+                          get_entity_bounding_box(new_location, entity.kind))
+        self.interest.move((entity.kind, entity.uuid), new_location)
         entity.pos = new_location
         self._grouped_entities[entity.kind][entity.uuid].pos = new_location
-        self.spindex.insert((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind))
 
-    def remove_entity(self, entity: Entity):
-        with self.get_entity_lock(entity):
+    def remove_entity(self, entity: Entity, release_id: bool = True):
+        """Removes an entity from the game.
+
+        :param release_id: whether the entity's id (and a bag's object) can be reused, which they can't if the entity
+            lives on elsewhere, e.g. when it's handed off to another worker"""
+        if entity.kind == EntityType.PROJECTILE:
+            self.projectile_store.remove(entity.uuid)
+        else:
             self._grouped_entities[entity.kind].pop(entity.uuid)
             self.spindex.remove((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind))
+            self.interest.remove((entity.kind, entity.uuid))
+        if release_id:
+            release_entity_id(entity.entity_id)
+            if entity.kind == EntityType.BAG:
+                self.pool.release(entity)
 
     def get_available_position(self, kind: EntityType, x_min: int = 0, y_min: int = 0, x_max: int = WORLD_WIDTH // 3,
                                y_max: int = WORLD_HEIGHT // 3) -> Pos:
@@ -136,14 +245,27 @@ class EntityManager:
         :returns: available position"""
         pos_x, pos_y = int(np.random.uniform(x_min, x_max)), int(np.random.uniform(y_min, y_max))
 
-        while len(self.spindex.intersect(get_entity_bounding_box((pos_x, pos_y), kind))) != 0:
+        while not is_empty(self.get_entities_in_range(get_entity_bounding_box((pos_x, pos_y), kind))) or \
+                self.collides_with_obstacles(get_entity_bounding_box((pos_x, pos_y), kind)):
             pos_x, pos_y = int(np.random.uniform(x_min, x_max)), int(np.random.uniform(y_min, y_max))
         return pos_x, pos_y
 
+    def add_projectile(self, cls: type, pos: Pos, direction: Dir, damage: int, shot_by: Entity) -> int:
+        """Adds a new projectile of class ``cls`` straight to the projectile store, without creating a projectile
+        object.
+
+        :returns: the projectile's entity id, which is its key as well"""
+        entity_id = _entity_ids.allocate()
+        self.projectile_store.spawn(cls, entity_id, pos, direction, damage, shot_by)
+        return entity_id
+
     def add_entity(self, entity: Entity):
-        with self.get_entity_lock(entity):
-            self.spindex.insert((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind))
-            self.add_to_dict(entity)
+        if entity.kind == EntityType.PROJECTILE:
+            self.projectile_store.add(entity)
+            return
+        self.spindex.insert((entity.kind, entity.uuid), get_entity_bounding_box(entity.pos, entity.kind))
+        self.interest.add((entity.kind, entity.uuid), entity.pos, is_watcher=entity.kind == EntityType.PLAYER)
+        self.add_to_dict(entity)
 
 
 @dataclass(frozen=True)
@@ -159,7 +281,7 @@ class Item:
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class Bag(Entity):
     kind = EntityType.BAG
     items: List = dataclasses.field(
@@ -169,6 +291,7 @@ class Bag(Entity):
 
 class CanHit(abc.ABC):
     """An interface for game objects that can hit others, such as weapons and projectiles."""
+    __slots__ = ()
 
     @abc.abstractmethod
     def on_hit(self, hit_objects: Iterable[Entity], manager: EntityManager) -> bool:
@@ -183,6 +306,7 @@ class CanHit(abc.ABC):
 class ServerControlled(Entity, abc.ABC):
     """An abstract class for server controlled objects, i.e., objects with server-controlled
     movement and general behaviour such as mobs and projectiles."""
+    __slots__ = ()
 
     @abc.abstractmethod
     def action_per_tick(self, manager: EntityManager) -> bool:
@@ -191,17 +315,21 @@ class ServerControlled(Entity, abc.ABC):
         :returns: whether the entity should be removed from the game"""
         ...
 
+    def advance_location(self, manager: EntityManager):
+        """Moves the entity one tick along its direction."""
+        manager.update_entity_location(self, (self.pos[0] + int(self.speed * self.direction[0]),
+                                              self.pos[1] + int(self.speed * self.direction[1])))
+
     def advance_per_tick(self, manager: EntityManager) -> bool:
         """Wrapper for ``self.action_per_tick`` that also advances the entity's location."""
         res = self.action_per_tick(manager)
-        manager.update_entity_location(self, (self.pos[0] + int(self.speed * self.direction[0]),
-                                              self.pos[1] + int(self.speed * self.direction[1])))
+        self.advance_location(manager)
         # if self.kind != EntityType.PROJECTILE:
         # logging.debug(f"updated mob location to {self.pos}, {self.speed=}, {self.direction=}, {self.uuid}")
         return res
 
 
-@dataclass
+@dataclass(slots=True)
 class Combatant(Entity):
     attacking_direction: Dir = DEFAULT_DIR
     is_attacking: bool = False
@@ -225,13 +353,16 @@ class Combatant(Entity):
         """Deals some amount of damage to another combatant, factoring in the resistance/damage boost of both."""
         other.health -= (damage * self.damage_multiplier) + other.resistance
 
+    def record_key(self) -> tuple:
+        return super(Combatant, self).record_key() + (self.is_attacking, self.health)
+
     def serialize(self) -> dict:
-        return super().serialize() | {"is_attacking": self.is_attacking,
-                                      "hp": self.health,
-                                      "resistance": self.resistance}
+        return super(Combatant, self).serialize() | {"is_attacking": self.is_attacking,
+                                                     "hp": self.health,
+                                                     "resistance": self.resistance}
 
 
-@dataclass
+@dataclass(slots=True)
 class Projectile(ServerControlled, CanHit):
     damage: int = 0
     ttl: int = PROJECTILE_TTL
@@ -261,14 +392,13 @@ class Projectile(ServerControlled, CanHit):
                     should_remove = False
                 case EntityType.MOB | EntityType.PLAYER:
                     logging.info(f"projectile {self.uuid} hit entity {hit!r}")
-                    with manager.get_entity_lock(hit):
-                        self.shot_by.deal_damage_to(hit, self.damage)
-                        logging.info(f"entity {hit!r} was updated after hit")
+                    self.shot_by.deal_damage_to(hit, self.damage)
+                    logging.info(f"entity {hit!r} was updated after hit")
 
         return should_remove
 
 
-@dataclass
+@dataclass(slots=True)
 class Player(Combatant):
     addr: Addr = ("", 0)
     last_updated_seqn: int = -1  # latest sequence number basically
@@ -279,11 +409,10 @@ class Player(Combatant):
                                                                           for _ in range(
                 INVENTORY_COLUMNS * INVENTORY_ROWS - 4)])
     skill_id: int = dataclasses.field(default_factory=lambda: random.randint(MIN_SKILL, MAX_SKILL))
-    fernet: Fernet | None = None
+    cipher: SessionCipher | None = None
     kind: int = EntityType.PLAYER
     last_time_used_skill: int = 0
     skill_cooldown: int = -1
-    lock: threading.RLock = threading.RLock()
 
     @property
     def item(self) -> Item:
@@ -293,8 +422,11 @@ class Player(Combatant):
     def skill(self) -> Item:
         return get_item(self.skill_id)
 
+    def record_key(self) -> tuple:
+        return super(Player, self).record_key() + (self.inventory[self.slot], self.skill_id)
+
     def serialize(self) -> dict:
-        return super().serialize() | {"tool": self.inventory[self.slot], "skill_id": self.skill_id}
+        return super(Player, self).serialize() | {"tool": self.inventory[self.slot], "skill_id": self.skill_id}
 
     def __repr__(self):
         return f"Player(uuid={self.uuid}, addr={self.addr}, pos={self.pos}, item={self.item!r}, health={self.health})"
@@ -310,7 +442,7 @@ class Player(Combatant):
                 new_item_slot += 1
 
 
-@dataclass
+@dataclass(slots=True)
 class Mob(Combatant, ServerControlled):
     weapon: int = dataclasses.field(default_factory=lambda: random.randint(MOB_MIN_WEAPON, MOB_MAX_WEAPON))
     tracked_uuid: str | None = None
@@ -326,16 +458,18 @@ class Mob(Combatant, ServerControlled):
     def attacking_kind(self):
         return EntityType.MOB if self.parent_uuid else EntityType.PLAYER
 
+    def record_key(self) -> tuple:
+        return super(Mob, self).record_key() + (self.weapon,)
+
     def serialize(self) -> dict:
-        return super().serialize() | {"weapon": self.weapon, "hp": self.health}
+        return super(Mob, self).serialize() | {"weapon": self.weapon, "hp": self.health}
 
     def in_attack_range(self, pos: Pos) -> bool:
         return abs(self.pos[0] - pos[0]) <= MOB_SIGHT_WIDTH and \
                abs(self.pos[1] - pos[1]) <= MOB_SIGHT_HEIGHT
 
     def get_mob_stop_distance(self) -> float:
-        return 0.5 * (np.sqrt(BOT_HEIGHT ** 2 + BOT_WIDTH ** 2) + np.sqrt(CLIENT_HEIGHT ** 2 + CLIENT_WIDTH ** 2)) + \
-               (RANGED_OFFSET if isinstance(self.item, RangedWeapon) else 0)
+        return MOB_STOP_DISTANCE + (RANGED_OFFSET if self.has_ranged_weapon else 0)
 
     def update_direction(self, manager: EntityManager):
         """Updates mob's attacking/movement directions, and updates whether he is currently tracking a player."""
@@ -352,37 +486,53 @@ class Mob(Combatant, ServerControlled):
 
         nearest_entity = min(in_range,
                              key=lambda p: (self.pos[0] - p.pos[0]) ** 2 + (self.pos[1] - p.pos[1]) ** 2)
-        self.tracked_uuid = nearest_entity.uuid
-        logging.info(f"mob {self.uuid} tracking entity {self.tracked_uuid}")
-        if np.sqrt(((self.pos[0] - nearest_entity.pos[0]) ** 2 + (self.pos[1] - nearest_entity.pos[1]) ** 2)) <= \
-                self.get_mob_stop_distance() + MOB_ERROR_TERM:
+        logging.info(f"mob {self.uuid} tracking entity {nearest_entity.uuid}")
+        dir_x, dir_y = nearest_entity.pos[0] - self.pos[0], nearest_entity.pos[1] - self.pos[1]
+        self.track(nearest_entity.uuid, normalize_vec(dir_x, dir_y),
+                   math.hypot(dir_x, dir_y) <= self.get_mob_stop_distance() + MOB_ERROR_TERM)
+
+    def track(self, tracked_uuid: str | None, attacking_direction: Dir = DEFAULT_DIR, should_stop: bool = True):
+        """Updates the tracked entity and the attacking/movement directions of the mob.
+
+        :param tracked_uuid: uuid of the nearest entity in sight, or None if there isn't one
+        :param attacking_direction: normalized direction to the tracked entity
+        :param should_stop: whether the mob is within stopping distance of the tracked entity"""
+        self.tracked_uuid = tracked_uuid
+        if tracked_uuid is None:
+            self.direction = 0.0, 0.0
+            return
+        self.attacking_direction = attacking_direction
+        if should_stop:
             logging.debug(f"mob {self.uuid} staying put cuz stop distance")
             self.direction = 0.0, 0.0
-        dir_x, dir_y = nearest_entity.pos[0] - self.pos[0], nearest_entity.pos[1] - self.pos[1]
-        dir_x, dir_y = normalize_vec(dir_x, dir_y)
-        self.attacking_direction = dir_x, dir_y
-        if self.direction != (0., 0.):
-            self.direction = (dir_x * MOB_SPEED, dir_y * MOB_SPEED)
+        else:
+            self.direction = (attacking_direction[0] * MOB_SPEED, attacking_direction[1] * MOB_SPEED)
             logging.debug(f"mob {self.uuid} has updated direction {self.direction}")
 
-    def action_per_tick(self, manager: EntityManager) -> bool:
-        if self.health <= MIN_HEALTH:
-            return True
-
-        self.update_direction(manager)
+    def attack_tracked(self, manager: EntityManager):
+        """Attacks the tracked entity if it's in range."""
         if self.tracked_uuid and (player := manager.get(self.tracked_uuid, self.attacking_kind)):
             if self.in_attack_range(player.pos):
                 self.item.on_click(self, manager)
 
-        colliding = list(manager.get_collidables_with(self))
-        if colliding and self.tracked_uuid:
+    def stop_if_colliding(self, manager: EntityManager):
+        """Stops the mob if it's tracking an entity and collides with anything."""
+        if self.tracked_uuid and not is_empty(manager.get_collidables_with(self)):
             self.direction = (0.0, 0.0)
-            logging.debug(f"mob {self.uuid} stopped due to colliding with {colliding}")
+            logging.debug(f"mob {self.uuid} stopped due to colliding")
 
+    def action_per_tick(self, manager: EntityManager) -> bool:
+        if self.health <= MIN_HEALTH:
+            return True
+
+        self.update_direction(manager)
+        self.attack_tracked(manager)
+        self.stop_if_colliding(manager)
         return False
 
 
 class FireballProjectile(Projectile):
+    __slots__ = ()
     type: int = FIREBALL_PROJECTILE
 
     def serialize(self) -> dict:
@@ -392,6 +542,7 @@ class FireballProjectile(Projectile):
 
 
 class EraserProjectile(Projectile):
+    __slots__ = ()
     type: int = ERASER_PROJECTILE
 
     def serialize(self) -> dict:
@@ -444,9 +595,8 @@ class MeleeWeapon(Weapon):
         for attackable in in_range:
             if attackable.kind == EntityType.MOB == attacker.kind and attacker.parent_uuid:
                 continue  # mobs shouldn't attack mobs
-            with manager.get_entity_lock(attackable):
-                attacker.deal_damage_to(attackable, self.damage)
-                logging.info(f"updated entity (uuid={attackable.uuid}) health to {attackable.health}")
+            attacker.deal_damage_to(attackable, self.damage)
+            logging.info(f"updated entity (uuid={attackable.uuid}) health to {attackable.health}")
 
 
 @dataclass(frozen=True)
@@ -455,16 +605,12 @@ class RangedWeapon(Weapon):
     """Projectile type to be shot. Can be any class which inherits from `Projectile`."""
 
     def use_to_attack(self, attacker: Combatant, manager: EntityManager):
-        print(self.projectile_class)
-        projectile = self.projectile_class(
-            pos=(int(attacker.pos[0] + ARROW_OFFSET_FACTOR * attacker.attacking_direction[0]),
-                 int(attacker.pos[1] + ARROW_OFFSET_FACTOR * attacker.attacking_direction[1])),
-            direction=attacker.attacking_direction,
-            damage=self.damage,
-            shot_by=attacker
-        )
-        manager.add_entity(projectile)
-        logging.debug(f"added projectile {projectile}")
+        projectile_id = manager.add_projectile(
+            self.projectile_class,
+            (int(attacker.pos[0] + ARROW_OFFSET_FACTOR * attacker.attacking_direction[0]),
+             int(attacker.pos[1] + ARROW_OFFSET_FACTOR * attacker.attacking_direction[1])),
+            attacker.attacking_direction, self.damage, attacker)
+        logging.debug(f"added {self.projectile_class.__name__} {projectile_id} shot by {attacker.uuid}")
 
 
 @dataclass(frozen=True)
@@ -472,9 +618,8 @@ class OneClickItem(Item):
     """An Item that disappears after one click."""
 
     def on_click(self, clicked_by: Player, manager: EntityManager):
-        with clicked_by.lock:
-            self.action(clicked_by, manager)
-            clicked_by.inventory[clicked_by.slot] = EMPTY_SLOT
+        self.action(clicked_by, manager)
+        clicked_by.inventory[clicked_by.slot] = EMPTY_SLOT
 
     @abc.abstractmethod
     def action(self, clicked_by: Player, manager: EntityManager):
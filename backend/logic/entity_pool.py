@@ -0,0 +1,49 @@
+"""Pooling of short-lived entities, such as projectiles and bags, so that steady-state combat reuses entity objects
+instead of allocating new ones."""
+from typing import Dict, List, Type, TypeVar
+
+from backend.backend_consts import ENTITY_POOL_SIZE
+
+T = TypeVar("T")
+
+
+class EntityPool:
+    """Free lists of released entities, by class.
+
+    An acquired entity is reset by running its dataclass ``__init__`` again on the pooled object, which resets every
+    field (including the ones with defaults) just like creating a new entity does. A released entity must not be used
+    by its releaser anymore."""
+
+    def __init__(self, max_size: int = ENTITY_POOL_SIZE):
+        self.max_size = max_size
+        """Maximal number of free entities kept per class, beyond which released entities are left to the GC."""
+        self._free: Dict[type, List] = {}
+        self._hits: Dict[type, int] = {}
+        self._misses: Dict[type, int] = {}
+
+    def acquire(self, cls: Type[T], fields: dict) -> T:
+        """Returns an entity of class ``cls`` initialized with ``fields``, reusing a released one if there's any.
+
+        :param fields: keyword arguments of the entity's ``__init__``, taken as a dictionary since unpacking them into
+            keyword arguments twice costs as much as allocating a new entity"""
+        try:
+            entity = self._free[cls].pop()
+        except (KeyError, IndexError):
+            self._misses[cls] = self._misses.get(cls, 0) + 1
+            return cls(**fields)
+        self._hits[cls] = self._hits.get(cls, 0) + 1
+        entity.__init__(**fields)
+        return entity
+
+    def release(self, entity):
+        """Returns an entity to the free list of its class, unless the list is full."""
+        free = self._free.setdefault(type(entity), [])
+        if len(free) < self.max_size:
+            free.append(entity)
+
+    def stats(self) -> dict:
+        """Returns the hits, misses and free entities of every class, for tuning the pool size."""
+        return {cls.__name__: {"hits": self._hits.get(cls, 0),
+                               "misses": self._misses.get(cls, 0),
+                               "free": len(self._free.get(cls, ()))}
+                for cls in self._hits.keys() | self._misses.keys()}
@@ -0,0 +1,154 @@
+"""Area of interest management: which entities every player is subscribed to, i.e. sent in its snapshots.
+
+Subscriptions are maintained incrementally on a coarse grid, only as entities and players cross its cells, instead of
+running a range query per player on every snapshot."""
+from typing import Dict, Hashable, List, Set, Tuple
+
+from backend.backend_consts import AOI_CELL_SIZE, AOI_VIEW_WIDTH, AOI_VIEW_HEIGHT, AOI_MARGIN
+from common.consts import Pos
+from common.utils import get_bounding_box
+
+Cell = Tuple[int, int]
+CellRange = Tuple[int, int, int, int]
+
+
+class InterestGrid:
+    """Keeps the subscriptions of watchers (players) to the entities around them, with the same keys as the entity
+    manager's spatial index.
+
+    Entities are bucketed by the cell their position is in. Every watcher has two windows of cells: the near window,
+    covering its view, and the far window, which is the near window grown by ``margin``. An entity is subscribed to
+    once its cell enters the near window, but only unsubscribed from once its cell leaves the far window, so that
+    entities moving along the edge of the view don't flicker in and out of it."""
+
+    def __init__(self, cell_size: int = AOI_CELL_SIZE, view_width: int = AOI_VIEW_WIDTH,
+                 view_height: int = AOI_VIEW_HEIGHT, margin: int = AOI_MARGIN):
+        self.cell_size = cell_size
+        self.view_width = view_width
+        self.view_height = view_height
+        self.margin = margin
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._entity_cells: Dict[Hashable, Cell] = {}
+        self._watching_cells: Dict[Cell, Set[Hashable]] = {}
+        """The watchers whose near window contains each cell."""
+        self._windows: Dict[Hashable, Tuple[CellRange, CellRange]] = {}
+        """Near and far windows of every watcher."""
+        self._subscriptions: Dict[Hashable, Set[Hashable]] = {}
+        self._subscribers: Dict[Hashable, Set[Hashable]] = {}
+
+    def __len__(self):
+        return len(self._entity_cells)
+
+    def _cell_of(self, pos: Pos) -> Cell:
+        return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+    def _windows_of(self, pos: Pos) -> Tuple[CellRange, CellRange]:
+        x_min, y_min, x_max, y_max = get_bounding_box(pos, self.view_height, self.view_width)
+        near = (int(x_min // self.cell_size), int(y_min // self.cell_size),
+                int(x_max // self.cell_size), int(y_max // self.cell_size))
+        far = (int((x_min - self.margin) // self.cell_size), int((y_min - self.margin) // self.cell_size),
+               int((x_max + self.margin) // self.cell_size), int((y_max + self.margin) // self.cell_size))
+        return near, far
+
+    @staticmethod
+    def _contains(cell_range: CellRange, cell: Cell) -> bool:
+        return cell_range[0] <= cell[0] <= cell_range[2] and cell_range[1] <= cell[1] <= cell_range[3]
+
+    @staticmethod
+    def _cells_in(cell_range: CellRange) -> List[Cell]:
+        return [(cell_x, cell_y) for cell_x in range(cell_range[0], cell_range[2] + 1)
+                for cell_y in range(cell_range[1], cell_range[3] + 1)]
+
+    def _subscribe(self, watcher: Hashable, key: Hashable):
+        if watcher == key or key in (subscriptions := self._subscriptions[watcher]):
+            return
+        subscriptions.add(key)
+        self._subscribers.setdefault(key, set()).add(watcher)
+
+    def _unsubscribe(self, watcher: Hashable, key: Hashable):
+        self._subscriptions[watcher].discard(key)
+        if subscribers := self._subscribers.get(key, None):
+            subscribers.discard(watcher)
+            if not subscribers:
+                del self._subscribers[key]
+
+    def _update_window(self, watcher: Hashable, pos: Pos):
+        old_near, old_far = self._windows.get(watcher, (None, None))
+        near, far = self._windows_of(pos)
+        if near == old_near and far == old_far:
+            return
+        self._windows[watcher] = near, far
+        if near != old_near:
+            old_cells = set(self._cells_in(old_near)) if old_near else set()
+            new_cells = set(self._cells_in(near))
+            for cell in old_cells - new_cells:
+                watching = self._watching_cells[cell]
+                watching.discard(watcher)
+                if not watching:
+                    del self._watching_cells[cell]
+            for cell in new_cells - old_cells:
+                self._watching_cells.setdefault(cell, set()).add(watcher)
+                for key in self._cells.get(cell, ()):
+                    self._subscribe(watcher, key)
+        for key in [key for key in self._subscriptions[watcher] if not self._contains(far, self._entity_cells[key])]:
+            self._unsubscribe(watcher, key)
+
+    def add(self, key: Hashable, pos: Pos, is_watcher: bool = False):
+        """Adds an entity, subscribing the watchers that see it. A watcher is subscribed to the entities it sees as
+        well, and is seen by other watchers like any other entity."""
+        if key in self._entity_cells:
+            raise ValueError(f"entity {key} is already in the grid")
+        cell = self._entity_cells[key] = self._cell_of(pos)
+        self._cells.setdefault(cell, set()).add(key)
+        if is_watcher:
+            self._subscriptions[key] = set()
+            self._update_window(key, pos)
+        for watcher in self._watching_cells.get(cell, ()):
+            self._subscribe(watcher, key)
+
+    def move(self, key: Hashable, pos: Pos):
+        """Moves an entity, which only changes subscriptions once it (or the view of a watcher) crosses a cell."""
+        if (old_cell := self._entity_cells.get(key, None)) is None:
+            raise ValueError(f"entity {key} isn't in the grid")
+        cell = self._cell_of(pos)
+        if cell != old_cell:
+            self._entity_cells[key] = cell
+            old_keys = self._cells[old_cell]
+            old_keys.discard(key)
+            if not old_keys:
+                del self._cells[old_cell]
+            self._cells.setdefault(cell, set()).add(key)
+            for watcher in self._watching_cells.get(cell, ()):
+                self._subscribe(watcher, key)
+            for watcher in [watcher for watcher in self._subscribers.get(key, ())
+                            if not self._contains(self._windows[watcher][1], cell)]:
+                self._unsubscribe(watcher, key)
+        if key in self._windows:
+            self._update_window(key, pos)
+
+    def remove(self, key: Hashable):
+        """Removes an entity, unsubscribing the watchers that see it. A removed watcher's subscriptions are dropped."""
+        if (cell := self._entity_cells.pop(key, None)) is None:
+            raise ValueError(f"entity {key} isn't in the grid")
+        keys = self._cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self._cells[cell]
+        for watcher in list(self._subscribers.get(key, ())):
+            self._unsubscribe(watcher, key)
+        if (windows := self._windows.pop(key, None)) is None:
+            return
+        for watching_cell in self._cells_in(windows[0]):
+            watching = self._watching_cells[watching_cell]
+            watching.discard(key)
+            if not watching:
+                del self._watching_cells[watching_cell]
+        for subscribed in self._subscriptions.pop(key):
+            subscribers = self._subscribers[subscribed]
+            subscribers.discard(key)
+            if not subscribers:
+                del self._subscribers[subscribed]
+
+    def subscriptions(self, watcher: Hashable) -> List[Hashable]:
+        """Returns the keys of the entities a watcher is subscribed to (which doesn't include the watcher itself)."""
+        return list(self._subscriptions.get(watcher, ()))
@@ -0,0 +1,84 @@
+"""Batched mob AI: picks the nearest target of every mob and computes their directions in one vectorized pass."""
+import itertools
+from typing import Sequence
+
+import numpy as np
+
+from backend.backend_consts import MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT, MOB_STOP_DISTANCE, RANGED_OFFSET, \
+    MOB_ERROR_TERM, GRID_CELL_SIZE, SIGHT_CELL_SIZE
+from backend.logic.entity_logic import EntityManager, Entity, Mob
+from backend.logic.spatial_index import overlapping_pairs
+from common.utils import get_entity_bounding_box
+
+
+def update_mob_directions(mobs: Sequence[Mob], manager: EntityManager):
+    """Batched equivalent of calling ``Mob.update_direction`` on every mob: wild mobs track the nearest player in sight,
+    and pets track the nearest mob in sight."""
+    wild_mobs, pets = [], []
+    for mob in mobs:
+        (pets if mob.parent_uuid else wild_mobs).append(mob)
+    track_nearest(wild_mobs, list(manager.players.values()))
+    track_nearest(pets, list(manager.mobs.values()))
+
+
+def get_bounding_boxes(entities: Sequence[Entity]) -> np.ndarray:
+    """Returns the bounding boxes of ``entities``, as an array of shape (n, 4)."""
+    return np.array([get_entity_bounding_box(entity.pos, entity.kind) for entity in entities],
+                    dtype=np.int64).reshape(-1, 4)
+
+
+def track_nearest(mobs: Sequence[Mob], targets: Sequence[Entity]):
+    """Makes every mob track the nearest of ``targets`` whose bounding box is within its sight."""
+    if not mobs:
+        return
+    positions = np.array([mob.pos for mob in mobs], dtype=np.int64).reshape(-1, 2)
+    # same box as get_bounding_box(mob.pos, MOB_SIGHT_WIDTH, MOB_SIGHT_HEIGHT)
+    half_sight = np.array([MOB_SIGHT_HEIGHT // 2, MOB_SIGHT_WIDTH // 2])
+    sight_boxes = np.hstack((positions - half_sight, positions + half_sight))
+    target_positions = np.array([target.pos for target in targets], dtype=np.int64).reshape(-1, 2)
+    target_boxes = get_bounding_boxes(targets)
+
+    mob_rows, target_rows = overlapping_pairs(sight_boxes, target_boxes, SIGHT_CELL_SIZE)
+    target_uuids = np.empty(len(targets), dtype=object)
+    target_uuids[:] = [target.uuid for target in targets]
+    mob_uuids = np.array([mob.uuid for mob in mobs], dtype=object)
+    parent_uuids = np.array([mob.parent_uuid for mob in mobs], dtype=object)
+    allowed = (target_uuids[target_rows] != mob_uuids[mob_rows]) & (target_uuids[target_rows] != parent_uuids[mob_rows])
+    mob_rows, target_rows = mob_rows[allowed], target_rows[allowed]
+
+    # nearest target per mob: sort the pairs by mob then by distance, and take the first pair of every mob
+    deltas = target_positions[target_rows] - positions[mob_rows]
+    squared_distances = (deltas ** 2).sum(axis=1)
+    order = np.lexsort((squared_distances, mob_rows))
+    tracking, first = np.unique(mob_rows[order], return_index=True)
+    nearest = order[first]
+
+    deltas, distances = deltas[nearest], np.sqrt(squared_distances[nearest])
+    directions = np.divide(deltas, distances[:, np.newaxis], out=np.zeros(deltas.shape),
+                           where=distances[:, np.newaxis] != 0)
+    is_ranged = np.array([mobs[row].has_ranged_weapon for row in tracking.tolist()], dtype=bool)
+    should_stop = distances <= MOB_STOP_DISTANCE + RANGED_OFFSET * is_ranged + MOB_ERROR_TERM
+
+    for mob in mobs:
+        mob.track(None)
+    for row, target_row, direction, stop in zip(tracking.tolist(), target_rows[nearest].tolist(),
+                                                directions.tolist(), should_stop.tolist()):
+        mobs[row].track(targets[target_row].uuid, tuple(direction), stop)
+
+
+def stop_colliding_mobs(mobs: Sequence[Mob], manager: EntityManager):
+    """Batched equivalent of calling ``Mob.stop_if_colliding`` on every mob."""
+    tracking = [mob for mob in mobs if mob.tracked_uuid]
+    if not tracking:
+        return
+    others = list(itertools.chain(manager.players.values(), manager.mobs.values(), manager.bags.values()))
+    other_uuids = np.array([other.uuid for other in others], dtype=object)
+    tracking_uuids = np.array([mob.uuid for mob in tracking], dtype=object)
+    tracking_boxes = get_bounding_boxes(tracking)
+
+    mob_rows, other_rows = overlapping_pairs(tracking_boxes, get_bounding_boxes(others), GRID_CELL_SIZE)
+    colliding = set(mob_rows[other_uuids[other_rows] != tracking_uuids[mob_rows]].tolist())
+    colliding.update(overlapping_pairs(tracking_boxes, manager.projectile_store.bounding_boxes(),
+                                       GRID_CELL_SIZE)[0].tolist())
+    for row in colliding:
+        tracking[row].direction = (0.0, 0.0)
@@ -0,0 +1,203 @@
+"""Structure-of-arrays storage of projectiles, advanced per tick in batched NumPy operations."""
+from typing import Callable, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from backend.backend_consts import GRID_CELL_SIZE
+from backend.logic.spatial_index import BBox, overlapping_pairs
+from common.consts import EntityType, PROJECTILE_WIDTH, PROJECTILE_HEIGHT, PROJECTILE_TTL
+from common.utils import get_entity_bounding_box
+
+
+class ProjectileStore:
+    """Holds every live projectile as a row in parallel NumPy arrays (positions, directions, speed, ttl, damage), with
+    the projectile class, shooter, uuid (its key, which is its entity id) and entity id kept in matching lists.
+
+    Projectile objects are only materialized when something outside the tick needs them, e.g. for serialization or
+    for handling a hit. Rows are kept packed: removing a projectile moves the last row into its place."""
+
+    def __init__(self, capacity: int = 64):
+        self._size = 0
+        self._positions = np.zeros((capacity, 2), dtype=np.int64)
+        self._directions = np.zeros((capacity, 2), dtype=np.float64)
+        self._speeds = np.zeros(capacity, dtype=np.int64)
+        self._ttls = np.zeros(capacity, dtype=np.int64)
+        self._damages = np.zeros(capacity, dtype=np.int64)
+        self._classes: List[type] = []
+        self._shot_by: List = []
+        self._uuids: List[int] = []
+        self._entity_ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+        """Maps a projectile's uuid to its row in the arrays."""
+        self._boxes: np.ndarray | None = None
+        """Cached bounding boxes, reset whenever a projectile is added, removed or moved."""
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, projectile_uuid: int):
+        return projectile_uuid in self._rows
+
+    def __iter__(self) -> Iterator:
+        return (self.materialize(row) for row in range(self._size))
+
+    @property
+    def capacity(self) -> int:
+        return len(self._ttls)
+
+    def _grow(self):
+        new_capacity = 2 * self.capacity
+        for name in ("_positions", "_directions", "_speeds", "_ttls", "_damages"):
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, projectile):
+        """Copies a projectile into the store."""
+        self.spawn(type(projectile), projectile.entity_id, projectile.pos, projectile.direction, projectile.damage,
+                   projectile.shot_by, projectile.ttl, projectile.uuid)
+
+    def spawn(self, cls: type, entity_id: int, pos, direction, damage: int, shot_by, ttl: int = PROJECTILE_TTL,
+              uuid: int | None = None):
+        """Adds a projectile of class ``cls`` to the store straight from its fields, without a projectile object.
+
+        :param uuid: the projectile's key, which is its entity id by default"""
+        if self._size == self.capacity:
+            self._grow()
+        uuid = entity_id if uuid is None else uuid
+        row = self._size
+        self._positions[row] = pos
+        self._directions[row] = direction
+        self._speeds[row] = cls.speed
+        self._ttls[row] = ttl
+        self._damages[row] = damage
+        self._classes.append(cls)
+        self._shot_by.append(shot_by)
+        self._uuids.append(uuid)
+        self._entity_ids.append(entity_id)
+        self._rows[uuid] = row
+        self._size += 1
+        self._boxes = None
+
+    def _remove_row(self, row: int):
+        last = self._size - 1
+        self._rows.pop(self._uuids[row])
+        if row != last:
+            for array in (self._positions, self._directions, self._speeds, self._ttls, self._damages):
+                array[row] = array[last]
+            for column in (self._classes, self._shot_by, self._uuids, self._entity_ids):
+                column[row] = column[last]
+            self._rows[self._uuids[row]] = row
+        for column in (self._classes, self._shot_by, self._uuids, self._entity_ids):
+            column.pop()
+        self._size = last
+        self._boxes = None
+
+    def remove(self, projectile_uuid: int):
+        self._remove_row(self._rows[projectile_uuid])
+
+    def materialize(self, row: int, pool=None):
+        """Builds a projectile object out of a row of the store.
+
+        :param pool: entity pool to take the object from, when the caller releases it back once it's done with it"""
+        fields = {"pos": tuple(self._positions[row].tolist()),
+                  "direction": tuple(self._directions[row].tolist()),
+                  "damage": int(self._damages[row]),
+                  "ttl": int(self._ttls[row]),
+                  "shot_by": self._shot_by[row],
+                  "uuid": self._uuids[row],
+                  "entity_id": self._entity_ids[row]}
+        return self._classes[row](**fields) if pool is None else pool.acquire(self._classes[row], fields)
+
+    def get(self, projectile_uuid: int):
+        """Returns a materialized projectile, or None if it isn't in the store."""
+        row = self._rows.get(projectile_uuid, None)
+        return None if row is None else self.materialize(row)
+
+    def move(self, projectile_uuid: int, new_location):
+        self._positions[self._rows[projectile_uuid]] = new_location
+        self._boxes = None
+
+    def bounding_boxes(self) -> np.ndarray:
+        """Returns the bounding boxes of all projectiles, as an array of shape (n, 4)."""
+        if self._boxes is None:
+            positions = self._positions[:self._size]
+            half_size = np.array([PROJECTILE_WIDTH // 2, PROJECTILE_HEIGHT // 2])
+            self._boxes = np.concatenate((positions - half_size, positions + half_size), axis=1)
+        return self._boxes
+
+    def _rows_in_range(self, bbox: BBox) -> List[int]:
+        if not self._size:
+            return []
+        boxes = self.bounding_boxes()
+        return np.flatnonzero((boxes[:, 2] >= bbox[0]) & (boxes[:, 0] <= bbox[2]) &
+                              (boxes[:, 3] >= bbox[1]) & (boxes[:, 1] <= bbox[3])).tolist()
+
+    def in_range(self, bbox: BBox, entity_filter: Callable[[EntityType, str], bool] = lambda a, b: True) -> List:
+        """Returns the materialized projectiles intersecting with ``bbox``, for which ``entity_filter`` returns true."""
+        return [self.materialize(row) for row in self._rows_in_range(bbox)
+                if entity_filter(EntityType.PROJECTILE, self._uuids[row])]
+
+    def pack_in_range(self, bbox: BBox, pool, packed: Dict[int, bytes] | None = None) -> Dict[int, bytes]:
+        """Returns the packed records of the projectiles intersecting with ``bbox``, by entity id. Projectiles are only
+        materialized (from ``pool``, and released right after) to be packed, so snapshots don't allocate any.
+
+        :param packed: records already packed during this network tick, see ``serialize_entity_list``"""
+        records = {}
+        for row in self._rows_in_range(bbox):
+            entity_id = self._entity_ids[row]
+            if packed is None or (record := packed.get(entity_id, None)) is None:
+                projectile = self.materialize(row, pool)
+                record = projectile.pack()
+                pool.release(projectile)
+                if packed is not None:
+                    packed[entity_id] = record
+            records[entity_id] = record
+        return records
+
+    def advance(self, targets: Sequence, manager) -> List[int]:
+        """Advances all projectiles by one tick: decrements their ttl, finds hits against ``targets`` and against other
+        projectiles in a batched broad phase, lets every hit projectile handle its hit and moves all of them.
+
+        :param targets: entities that can be hit by projectiles
+        :param manager: entity manager, passed to the projectiles' hit handlers
+        :returns: uuids of the projectiles that were removed"""
+        if not self._size:
+            return []
+        ttls = self._ttls[:self._size]
+        ttls -= 1
+        should_remove = ttls <= 0
+
+        boxes = self.bounding_boxes()
+        alive = np.flatnonzero(~should_remove)
+        target_boxes = np.array([get_entity_bounding_box(target.pos, target.kind) for target in targets],
+                                dtype=np.int64).reshape(-1, 4)
+        hit_rows, hit_targets = overlapping_pairs(boxes[alive], target_boxes, GRID_CELL_SIZE)
+        hitting_rows, hit_projectiles = overlapping_pairs(boxes[alive], boxes, GRID_CELL_SIZE)
+        hitting_rows = alive[hitting_rows]
+        not_self = hitting_rows != hit_projectiles
+
+        hit_objects: Dict[int, List] = {}
+        for row, target in zip(alive[hit_rows].tolist(), hit_targets.tolist()):
+            hit_objects.setdefault(row, []).append(targets[target])
+        for row, other in zip(hitting_rows[not_self].tolist(), hit_projectiles[not_self].tolist()):
+            hit_objects.setdefault(row, []).append(self.materialize(other, manager.pool))
+        for row, hit in hit_objects.items():
+            projectile = self.materialize(row, manager.pool)
+            should_remove[row] = projectile.on_hit(hit, manager)
+            manager.pool.release(projectile)
+        for hit in hit_objects.values():
+            for entity in hit:
+                if entity.kind == EntityType.PROJECTILE:
+                    manager.pool.release(entity)
+
+        directions = self._directions[:self._size] * self._speeds[:self._size, np.newaxis]
+        self._positions[:self._size] += np.trunc(directions).astype(np.int64)
+        self._boxes = None
+
+        removed_rows = np.flatnonzero(should_remove)[::-1].tolist()
+        removed = [self._uuids[row] for row in removed_rows]
+        for row in removed_rows:
+            self._remove_row(row)
+        return removed
@@ -1,42 +1,69 @@
+import itertools
 import logging
-import sched
-import time
+from typing import Callable
 
 from backend.backend_consts import FRAME_TIME
-from backend.logic.entity_logic import EntityManager, Bag
-from common.consts import EntityType
+from backend.logic.entity_logic import EntityManager, Bag, release_entity_id
+from backend.logic.mob_ai import update_mob_directions, stop_colliding_mobs
+from backend.logic.tick_loop import TickLoop, OverrunPolicy
+from backend.profiling import profiler
+from common.consts import EntityType, MIN_HEALTH
 
 
-def server_controlled_entities_update(entities_manager: EntityManager, s):
-    """update all projectiles and bots positions inside a loop"""
+def server_controlled_entities_update(entities_manager: EntityManager):
+    """update all projectiles and bots positions, once per tick"""
     # BUGFIX: deadlock when two mobs merge
     update_projectiles(entities_manager)
     update_mobs(entities_manager)
-    s.enter(FRAME_TIME, 1, server_controlled_entities_update, (entities_manager, s,))
 
 
+@profiler.timed("update_projectiles")
 def update_projectiles(entities_manager: EntityManager):
     """Update projectile position, ttl and existence.
        In addition, lowers entities HP, and kill them if needed"""
-    with entities_manager.projectile_lock:
-        to_remove = list(filter(lambda p: p.advance_per_tick(entities_manager), entities_manager.projectiles.values()))
-        for projectile in to_remove:
-            entities_manager.remove_entity(projectile)
-            logging.info(f"[update] removed projectile {projectile.uuid}")
+    targets = list(itertools.chain(entities_manager.players.values(), entities_manager.mobs.values(),
+                                   entities_manager.bags.values()))
+    profiler.count("projectiles_advanced", len(entities_manager.projectile_store))
+    for projectile_uuid in entities_manager.projectile_store.advance(targets, entities_manager):
+        release_entity_id(projectile_uuid)  # projectiles are keyed by their entity id
+        logging.info(f"[update] removed projectile {projectile_uuid}")
 
 
+@profiler.timed("update_mobs")
 def update_mobs(entities_manager: EntityManager):
     """Update mobs position. In addition, attack if mob is locked on target"""
-    with entities_manager.mob_lock:
-        to_remove = list(filter(lambda m: m.advance_per_tick(entities_manager), entities_manager.mobs.values()))
-        for mob in to_remove:
-            entities_manager.remove_entity(mob)
-            entities_manager.add_entity(Bag(pos=mob.pos))
-            logging.info(f"[update] killed mob {mob.uuid}")
-
-
-def server_entities_handler(entities_manager):
-    """Starts the schedular and update entities functions"""
-    s = sched.scheduler(time.time, time.sleep)
-    s.enter(FRAME_TIME, 1, server_controlled_entities_update, (entities_manager, s,))
-    s.run()
+    mobs = list(entities_manager.mobs.values())
+    alive = [mob for mob in mobs if mob.health > MIN_HEALTH]
+    update_mob_directions(alive, entities_manager)
+    for mob in alive:
+        mob.attack_tracked(entities_manager)
+    stop_colliding_mobs(alive, entities_manager)
+    for mob in alive:
+        mob.advance_location(entities_manager)
+
+    to_remove = [mob for mob in mobs if mob.health <= MIN_HEALTH]
+    for mob in to_remove:
+        entities_manager.remove_entity(mob)
+        entities_manager.add_entity(entities_manager.pool.acquire(Bag, {"pos": mob.pos}))
+        logging.info(f"[update] killed mob {mob.uuid}")
+
+
+def create_entities_tick_loop(entities_manager: EntityManager, policy: OverrunPolicy = OverrunPolicy.CATCH_UP,
+                              before_update: Callable[[], None] | None = None,
+                              after_update: Callable[[], None] | None = None) -> TickLoop:
+    """Creates the fixed-timestep loop of the simulation thread, which calls ``before_update`` (if given), updates the
+    server controlled entities, and then calls ``after_update`` (if given) on every tick."""
+
+    def tick():
+        if before_update:
+            before_update()
+        server_controlled_entities_update(entities_manager)
+        if after_update:
+            after_update()
+
+    return TickLoop(FRAME_TIME, tick, policy)
+
+
+def server_entities_handler(tick_loop: TickLoop):
+    """Runs the entities' tick loop"""
+    tick_loop.run()
@@ -0,0 +1,239 @@
+"""Spatial indices used by the ``EntityManager`` for collision/range detection."""
+import abc
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+import numpy as np
+from pyqtree import Index
+
+BBox = Tuple[int, int, int, int]
+
+
+class SpatialIndex(abc.ABC):
+    """Common contract of all spatial backends, matching pyqtree's ``Index`` interface.
+
+    Items have to be hashable, and are compared by equality (not identity) on removal."""
+
+    @abc.abstractmethod
+    def insert(self, item: Hashable, bbox: BBox):
+        """Inserts an item with a bounding box of format (x_min, y_min, x_max, y_max)."""
+        ...
+
+    @abc.abstractmethod
+    def remove(self, item: Hashable, bbox: BBox):
+        """Removes an item. ``bbox`` has to be the bounding box the item was inserted with."""
+        ...
+
+    @abc.abstractmethod
+    def intersect(self, bbox: BBox) -> List[Hashable]:
+        """Returns all items whose bounding boxes intersect with ``bbox``, edges included."""
+        ...
+
+    def move(self, item: Hashable, old_bbox: BBox, new_bbox: BBox):
+        """Moves an item from ``old_bbox`` to ``new_bbox``."""
+        self.remove(item, old_bbox)
+        self.insert(item, new_bbox)
+
+
+class QuadtreeIndex(SpatialIndex):
+    """Thin wrapper around pyqtree's quadtree."""
+
+    def __init__(self, bbox: BBox):
+        self._index = Index(bbox=bbox)
+
+    def insert(self, item: Hashable, bbox: BBox):
+        self._index.insert(item, bbox)
+
+    def remove(self, item: Hashable, bbox: BBox):
+        self._index.remove(item, bbox)
+
+    def intersect(self, bbox: BBox) -> List[Hashable]:
+        return self._index.intersect(bbox)
+
+
+class GridIndex(SpatialIndex):
+    """Uniform grid (spatial hash) index.
+
+    Every item is registered in each cell its bounding box overlaps. When ``cell_size`` is at least the size of the
+    largest item, an item spans at most 2x2 cells, so moves that stay inside the same cells only update the stored
+    bounding box, and range queries only touch the cells overlapping the search rectangle."""
+
+    def __init__(self, cell_size: int):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._bboxes: Dict[Hashable, BBox] = {}
+
+    def __len__(self):
+        return len(self._bboxes)
+
+    def _cell_range(self, bbox: BBox) -> Tuple[int, int, int, int]:
+        return (int(bbox[0] // self.cell_size), int(bbox[1] // self.cell_size),
+                int(bbox[2] // self.cell_size), int(bbox[3] // self.cell_size))
+
+    def _add_to_cells(self, item: Hashable, cell_range: Tuple[int, int, int, int]):
+        min_x, min_y, max_x, max_y = cell_range
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                cell = self._cells.get((cell_x, cell_y))
+                if cell is None:
+                    cell = self._cells[(cell_x, cell_y)] = set()
+                cell.add(item)
+
+    def _remove_from_cells(self, item: Hashable, cell_range: Tuple[int, int, int, int]):
+        min_x, min_y, max_x, max_y = cell_range
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                cell = self._cells[(cell_x, cell_y)]
+                cell.discard(item)
+                if not cell:
+                    del self._cells[(cell_x, cell_y)]
+
+    def insert(self, item: Hashable, bbox: BBox):
+        if item in self._bboxes:
+            raise ValueError(f"item {item} is already in the index")
+        self._bboxes[item] = bbox
+        self._add_to_cells(item, self._cell_range(bbox))
+
+    def remove(self, item: Hashable, bbox: BBox):
+        if (old_bbox := self._bboxes.pop(item, None)) is None:
+            raise ValueError(f"item {item} isn't in the index")
+        self._remove_from_cells(item, self._cell_range(old_bbox))
+
+    def move(self, item: Hashable, old_bbox: BBox, new_bbox: BBox):
+        if (stored_bbox := self._bboxes.get(item, None)) is None:
+            raise ValueError(f"item {item} isn't in the index")
+        self._bboxes[item] = new_bbox
+        old_range, new_range = self._cell_range(stored_bbox), self._cell_range(new_bbox)
+        if old_range != new_range:
+            self._remove_from_cells(item, old_range)
+            self._add_to_cells(item, new_range)
+
+    def intersect(self, bbox: BBox) -> List[Hashable]:
+        x_min, y_min, x_max, y_max = bbox
+        if x_min > x_max:
+            x_min, x_max = x_max, x_min
+        if y_min > y_max:
+            y_min, y_max = y_max, y_min
+        min_x, min_y, max_x, max_y = self._cell_range((x_min, y_min, x_max, y_max))
+
+        results = []
+        seen = set()
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                cell = self._cells.get((cell_x, cell_y))
+                if not cell:
+                    continue
+                for item in cell:
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                    item_bbox = self._bboxes[item]
+                    if item_bbox[2] >= x_min and item_bbox[0] <= x_max and \
+                            item_bbox[3] >= y_min and item_bbox[1] <= y_max:
+                        results.append(item)
+        return results
+
+
+class StaticRectIndex:
+    """Immutable index of static rectangles, such as map obstacles.
+
+    The rectangles are bulk-built once into a packed, sorted grid: every (cell, rectangle) pair is stored in two
+    NumPy arrays sorted by cell key, so that the rectangles of a row of cells are a single contiguous slice."""
+
+    def __init__(self, bboxes: Iterable[BBox], cell_size: int):
+        self.cell_size = cell_size
+        if not isinstance(bboxes, np.ndarray):
+            bboxes = list(bboxes)
+        rects = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+        self._rects = np.column_stack((np.minimum(rects[:, 0], rects[:, 2]), np.minimum(rects[:, 1], rects[:, 3]),
+                                       np.maximum(rects[:, 0], rects[:, 2]), np.maximum(rects[:, 1], rects[:, 3])))
+        self._rects.setflags(write=False)
+
+        cells_min, cells_max = self._rects[:, :2] // cell_size, self._rects[:, 2:] // cell_size
+        self._origin = cells_min.min(axis=0) if len(rects) else np.zeros(2, dtype=np.int64)
+        self._shape = (cells_max.max(axis=0) - self._origin + 1) if len(rects) else np.zeros(2, dtype=np.int64)
+
+        # expand every rect into the cells it overlaps
+        counts_x = cells_max[:, 0] - cells_min[:, 0] + 1
+        counts = counts_x * (cells_max[:, 1] - cells_min[:, 1] + 1)
+        rect_ids = np.repeat(np.arange(len(rects)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cells_min[rect_ids, 0] + local % counts_x[rect_ids]
+        cell_y = cells_min[rect_ids, 1] + local // counts_x[rect_ids]
+        keys = self._cell_key(cell_x, cell_y)
+
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._rect_ids = keys[order], rect_ids[order]
+
+    def __len__(self):
+        return len(self._rects)
+
+    def _cell_key(self, cell_x, cell_y):
+        return (cell_y - self._origin[1]) * self._shape[0] + (cell_x - self._origin[0])
+
+    def _candidates(self, bbox: BBox) -> np.ndarray:
+        if not len(self._rects):
+            return self._rect_ids
+        min_x, min_y = np.maximum(np.array(bbox[:2]) // self.cell_size, self._origin)
+        max_x, max_y = np.minimum(np.array(bbox[2:]) // self.cell_size, self._origin + self._shape - 1)
+        if min_x > max_x or min_y > max_y:
+            return self._rect_ids[:0]
+        slices = [self._rect_ids[np.searchsorted(self._keys, self._cell_key(min_x, cell_y), "left"):
+                                 np.searchsorted(self._keys, self._cell_key(max_x, cell_y), "right")]
+                  for cell_y in range(min_y, max_y + 1)]
+        return np.unique(np.concatenate(slices))
+
+    def intersect(self, bbox: BBox) -> np.ndarray:
+        """Returns the rectangles intersecting with ``bbox`` (edges included), as an array of shape (n, 4)."""
+        x_min, y_min = min(bbox[0], bbox[2]), min(bbox[1], bbox[3])
+        x_max, y_max = max(bbox[0], bbox[2]), max(bbox[1], bbox[3])
+        candidates = self._rects[self._candidates((x_min, y_min, x_max, y_max))]
+        hits = (candidates[:, 2] >= x_min) & (candidates[:, 0] <= x_max) & \
+               (candidates[:, 3] >= y_min) & (candidates[:, 1] <= y_max)
+        return candidates[hits]
+
+    def collides(self, bbox: BBox) -> bool:
+        """Returns whether ``bbox`` intersects with any of the rectangles."""
+        return len(self.intersect(bbox)) != 0
+
+
+def overlapping_pairs(boxes_a: np.ndarray, boxes_b: np.ndarray, cell_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Batched broad phase between two sets of bounding boxes.
+
+    ``boxes_b`` are bucketed by the grid cell of their minimum corner, and every box of ``boxes_a`` is matched against
+    the 3x3 neighbouring buckets, which covers all overlaps as long as ``cell_size`` is at least the width and height
+    of every box.
+
+    :param boxes_a: array of shape (n, 4) of bounding boxes, of format (x_min, y_min, x_max, y_max)
+    :param boxes_b: array of shape (m, 4) of bounding boxes
+    :param cell_size: bucket size
+    :returns: index arrays ``(i, j)`` such that ``boxes_a[i]`` intersects ``boxes_b[j]``, edges included"""
+    if not len(boxes_a) or not len(boxes_b):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    cells_a, cells_b = boxes_a[:, :2] // cell_size, boxes_b[:, :2] // cell_size
+    origin = np.minimum(cells_a.min(axis=0), cells_b.min(axis=0)) - 1
+    cells_a, cells_b = cells_a - origin, cells_b - origin
+    stride = max(cells_a[:, 0].max(), cells_b[:, 0].max()) + 2
+
+    keys_b = cells_b[:, 1] * stride + cells_b[:, 0]
+    order = np.argsort(keys_b, kind="stable")
+    sorted_keys = keys_b[order]
+
+    pairs_a, pairs_b = [], []
+    for delta_x in (-1, 0, 1):
+        for delta_y in (-1, 0, 1):
+            query = (cells_a[:, 1] + delta_y) * stride + cells_a[:, 0] + delta_x
+            starts = np.searchsorted(sorted_keys, query, "left")
+            counts = np.searchsorted(sorted_keys, query, "right") - starts
+            if not (total := counts.sum()):
+                continue
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            pairs_a.append(np.repeat(np.arange(len(boxes_a)), counts))
+            pairs_b.append(order[np.repeat(starts, counts) + offsets])
+    if not pairs_a:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    index_a, index_b = np.concatenate(pairs_a), np.concatenate(pairs_b)
+    candidates_a, candidates_b = boxes_a[index_a], boxes_b[index_b]
+    hits = (candidates_a[:, 2] >= candidates_b[:, 0]) & (candidates_a[:, 0] <= candidates_b[:, 2]) & \
+           (candidates_a[:, 3] >= candidates_b[:, 1]) & (candidates_a[:, 1] <= candidates_b[:, 3])
+    return index_a[hits], index_b[hits]
@@ -0,0 +1,105 @@
+"""Fixed-timestep tick loop with overrun accounting."""
+import collections
+import logging
+import threading
+import time
+from enum import IntEnum, auto
+from typing import Callable, Deque
+
+import numpy as np
+
+from backend.backend_consts import MAX_CATCH_UP_TICKS, TICK_STATS_WINDOW, TICK_STATS_LOG_INTERVAL
+
+
+class OverrunPolicy(IntEnum):
+    """What the loop does with the deadlines it missed because a tick ran for too long."""
+    CATCH_UP = auto()
+    """Run the missed ticks back-to-back (up to ``MAX_CATCH_UP_TICKS`` of them), keeping the average tick rate."""
+    SKIP = auto()
+    """Drop the missed ticks, and continue from the next deadline that is still in the future."""
+
+
+class TickLoop:
+    """Calls a function on absolute deadlines ``start + n * period``, so slow ticks don't make the rate drift."""
+
+    def __init__(self, period: float, tick: Callable[[], None], policy: OverrunPolicy = OverrunPolicy.CATCH_UP,
+                 clock: Callable[[], float] = time.perf_counter, sleep: Callable[[float], None] = time.sleep):
+        self.period = period
+        self.tick = tick
+        self.policy = policy
+        self._clock = clock
+        self._sleep = sleep
+        self._running = False
+
+        self._lock = threading.Lock()
+        self._durations: Deque[float] = collections.deque(maxlen=TICK_STATS_WINDOW)
+        """Durations of the latest ticks, in seconds."""
+        self._lateness: Deque[float] = collections.deque(maxlen=TICK_STATS_WINDOW)
+        """How late the latest ticks started relative to their deadlines, in seconds."""
+        self.tick_count = 0
+        self.overrun_count = 0
+        """Number of ticks that ended after the next tick's deadline."""
+        self.skipped_count = 0
+        """Number of ticks dropped, either by ``OverrunPolicy.SKIP`` or by exceeding ``MAX_CATCH_UP_TICKS``."""
+        self._started_at = 0.
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        """Runs the loop until ``stop`` is called."""
+        self._running = True
+        self._started_at = self._clock()
+        deadline = self._started_at + self.period
+        last_log = self._started_at
+        while self._running:
+            now = self._clock()
+            if now < deadline:
+                self._sleep(deadline - now)
+                continue
+
+            start = self._clock()
+            self.tick()
+            end = self._clock()
+            deadline = self._account(start, end, deadline)
+
+            if end - last_log >= TICK_STATS_LOG_INTERVAL:
+                last_log = end
+                logging.info(f"[ticks] {self.stats()}")
+
+    def _account(self, start: float, end: float, deadline: float) -> float:
+        """Records a tick's stats, and returns the deadline of the next tick according to the overrun policy."""
+        next_deadline = deadline + self.period
+        with self._lock:
+            self.tick_count += 1
+            self._durations.append(end - start)
+            self._lateness.append(start - deadline)
+            if end <= next_deadline:
+                return next_deadline
+
+            self.overrun_count += 1
+            missed = int((end - next_deadline) // self.period)
+            pending = missed + 1  # deadlines that already passed
+            to_skip = pending if self.policy == OverrunPolicy.SKIP else max(0, pending - MAX_CATCH_UP_TICKS)
+            self.skipped_count += to_skip
+        if to_skip:
+            logging.warning(f"[ticks] tick took {(end - start) * 1000:.2f}ms, skipping {to_skip} ticks")
+        return next_deadline + to_skip * self.period
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the loop's stats, with durations in milliseconds."""
+        with self._lock:
+            durations = np.array(self._durations) * 1000
+            lateness = np.array(self._lateness) * 1000
+            tick_count, overrun_count, skipped_count = self.tick_count, self.overrun_count, self.skipped_count
+        elapsed = self._clock() - self._started_at
+        return {"ticks": tick_count,
+                "overruns": overrun_count,
+                "skipped": skipped_count,
+                "target_rate": 1 / self.period,
+                "actual_rate": tick_count / elapsed if elapsed > 0 else 0.,
+                "last_ms": float(durations[-1]) if len(durations) else 0.,
+                "p50_ms": float(np.percentile(durations, 50)) if len(durations) else 0.,
+                "p99_ms": float(np.percentile(durations, 99)) if len(durations) else 0.,
+                "max_ms": float(durations.max()) if len(durations) else 0.,
+                "p99_lateness_ms": float(np.percentile(lateness, 99)) if len(lateness) else 0.}
@@ -0,0 +1,235 @@
+"""Batched datagram I/O for a node's client socket.
+
+On Linux, ``recvmmsg``/``sendmmsg`` move a whole batch of datagrams per syscall, through message vectors that are
+allocated once. Elsewhere (or for non IPv4 addresses) this falls back to one ``recvfrom``/``sendto`` per datagram."""
+import ctypes
+import ctypes.util
+import errno
+import functools
+import logging
+import os
+import socket
+import sys
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from backend.backend_consts import UDP_BATCH_SIZE
+from backend.profiling import profiler
+from common.consts import Addr, RECV_CHUNK
+
+MSG_WAITFORONE = 0x10000
+"""Makes ``recvmmsg`` block only until the first datagram, and return whatever else is already queued with it."""
+SOCKADDR_SIZE = 128
+"""Size of ``struct sockaddr_storage``, which fits the address of any socket family."""
+SOCKADDR_IN_SIZE = 16
+SEND_SLOT_SIZE = 4096
+"""Size of the buffer every batched outgoing packet is copied to. Larger packets are sent on their own."""
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IoVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+def _load_libc() -> ctypes.CDLL | None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    libc.recvmmsg.restype = libc.sendmmsg.restype = ctypes.c_int
+    return libc
+
+
+_libc = _load_libc()
+HAS_MMSG = _libc is not None
+"""Whether batched syscalls are available, otherwise every datagram takes a syscall of its own."""
+
+
+def _last_error() -> OSError:
+    code = ctypes.get_errno()
+    return OSError(code, os.strerror(code))
+
+
+class _MessageVector:
+    """Preallocated ``struct mmsghdr`` array, where every message has a single iovec pointing at a data slot of its
+    own, and an address buffer."""
+
+    def __init__(self, size: int, slot_size: int):
+        self.size = size
+        self.slot_size = slot_size
+        self.headers = (_MMsgHdr * size)()
+        self.iovecs = (_IoVec * size)()
+        self.names = ctypes.create_string_buffer(size * SOCKADDR_SIZE)
+        self.data = ctypes.create_string_buffer(size * slot_size)
+        self.names_view = memoryview(self.names).cast("B")
+        self.data_view = memoryview(self.data).cast("B")
+        for i, header in enumerate(self.headers):
+            header.msg_hdr.msg_name = ctypes.addressof(self.names) + i * SOCKADDR_SIZE
+            header.msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            header.msg_hdr.msg_iovlen = 1
+            self.iovecs[i].iov_base = ctypes.addressof(self.data) + i * slot_size
+            self.iovecs[i].iov_len = slot_size
+        # ctypes creates a new wrapper on every indexing, so the hot loops index these lists instead
+        self.header_list = list(self.headers)
+        self.iovec_list = list(self.iovecs)
+
+    def address(self, index: int) -> int:
+        return ctypes.addressof(self.headers) + index * ctypes.sizeof(_MMsgHdr)
+
+
+def _pack_sockaddr(addr: Addr) -> bytes:
+    """Packs an IPv4 address as a ``struct sockaddr_in``.
+
+    :raises OSError: if the address isn't an IPv4 address"""
+    return socket.AF_INET.to_bytes(2, sys.byteorder) + addr[1].to_bytes(2, "big") + socket.inet_aton(addr[0]) + \
+        bytes(8)
+
+
+@functools.lru_cache(maxsize=4096)
+def _unpack_sockaddr(name: bytes) -> Addr | None:
+    """Unpacks a ``struct sockaddr_in``. Cached, since the same clients keep sending packets."""
+    if int.from_bytes(name[:2], sys.byteorder) != socket.AF_INET:
+        return None
+    return socket.inet_ntoa(name[4:8]), int.from_bytes(name[2:4], "big")
+
+
+class BatchedReceiver:
+    """Receives the datagrams queued on an IPv4 socket in batches, into buffers that are allocated once."""
+
+    def __init__(self, sock: socket.socket, batch_size: int = UDP_BATCH_SIZE, buffer_size: int = RECV_CHUNK):
+        self.sock = sock
+        self.buffer_size = buffer_size
+        self._vector = _MessageVector(batch_size, buffer_size) if HAS_MMSG else None
+        if self._vector:
+            # the kernel only ever writes back IPv4 addresses, which fit, so the lengths never need to be reset
+            for header in self._vector.header_list:
+                header.msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+
+    def recv(self) -> List[Tuple[bytes, Addr]]:
+        """Blocks until at least one datagram arrives, and returns it with all other datagrams that are queued (up to
+        the batch size).
+
+        :raises OSError: like ``socket.recvfrom``, e.g. ``ConnectionRefusedError`` on an ICMP port unreachable"""
+        if (vector := self._vector) is None:
+            return [self.sock.recvfrom(self.buffer_size)]
+
+        count = _libc.recvmmsg(self.sock.fileno(), vector.address(0), vector.size, MSG_WAITFORONE, None)
+        if count < 0:
+            raise _last_error()
+        profiler.count("recv_syscalls")
+
+        datagrams = []
+        for i in range(count):
+            name_offset, offset = i * SOCKADDR_SIZE, i * self.buffer_size
+            addr = _unpack_sockaddr(vector.names_view[name_offset:name_offset + SOCKADDR_IN_SIZE].tobytes())
+            datagrams.append((vector.data_view[offset:offset + vector.header_list[i].msg_len].tobytes(), addr))
+        return datagrams
+
+
+class BatchedSender:
+    """Sends datagrams through a socket in batches.
+
+    Datagrams are queued with ``send``, and a sender thread (``run``) flushes everything that was queued while the
+    previous batch was being sent, so that batches grow with the load without adding latency when idle."""
+
+    def __init__(self, sock: socket.socket, batch_size: int = UDP_BATCH_SIZE):
+        self.sock = sock
+        self.batch_size = batch_size
+        self._pending: List[Tuple[bytes, Addr]] = []
+        self._ready = threading.Condition()
+        self._vector = _MessageVector(batch_size, SEND_SLOT_SIZE) if HAS_MMSG else None
+        if self._vector:
+            for header in self._vector.header_list:
+                header.msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+        self._sockaddrs: Dict[Addr, bytes] = {}
+        """Packed addresses of the clients, which seldom change."""
+        self._slot_sockaddrs: List[bytes | None] = [None] * batch_size
+        """The address currently in every slot, which doesn't have to be copied again if it's sent to again."""
+
+    def send(self, packet: bytes, addr: Addr):
+        with self._ready:
+            self._pending.append((packet, addr))
+            self._ready.notify()
+
+    def run(self):
+        while True:
+            with self._ready:
+                self._ready.wait_for(lambda: self._pending)
+                batch, self._pending = self._pending, []
+            self.send_batch(batch)
+
+    def send_batch(self, batch: Sequence[Tuple[bytes, Addr]]):
+        """Sends datagrams right away, ``batch_size`` per syscall."""
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            if self._vector is None:
+                for packet, addr in chunk:
+                    self._sendto(packet, addr)
+            else:
+                self._sendmmsg(chunk)
+
+    def _sendto(self, packet: bytes, addr: Addr):
+        try:
+            self.sock.sendto(packet, addr)
+            profiler.count("packets_sent")
+        except BlockingIOError:
+            # the socket is non-blocking when served by the asyncio front end, so a full send buffer drops the packet,
+            # just like the network would
+            profiler.count("packets_dropped")
+        except OSError as e:
+            logging.warning(f"[error] couldn't send packet to {addr=}, {e=}")
+
+    def _sendmmsg(self, chunk: Sequence[Tuple[bytes, Addr]]):
+        vector, addrs = self._vector, []
+        for packet, addr in chunk:
+            if (sockaddr := self._sockaddrs.get(addr, None)) is None:
+                try:
+                    sockaddr = self._sockaddrs[addr] = _pack_sockaddr(addr)
+                except (OSError, TypeError, ValueError):
+                    sockaddr = None
+            if sockaddr is None or len(packet) > vector.slot_size:
+                # not an IPv4 address or too large for a slot, so it can't be batched
+                self._sendto(packet, addr)
+                continue
+            index, size = len(addrs), len(packet)
+            if self._slot_sockaddrs[index] is not sockaddr:
+                vector.names_view[index * SOCKADDR_SIZE:index * SOCKADDR_SIZE + SOCKADDR_IN_SIZE] = sockaddr
+                self._slot_sockaddrs[index] = sockaddr
+            vector.data_view[index * vector.slot_size:index * vector.slot_size + size] = packet
+            vector.iovec_list[index].iov_len = size
+            addrs.append(addr)
+
+        sent = 0
+        while sent < len(addrs):
+            count = _libc.sendmmsg(self.sock.fileno(), vector.address(sent), len(addrs) - sent, 0)
+            profiler.count("send_syscalls")
+            if count >= 0:
+                sent += count
+                profiler.count("packets_sent", count)
+                continue
+            error = _last_error()
+            if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                profiler.count("packets_dropped", len(addrs) - sent)
+                return
+            # only the first datagram failed (e.g. with ECONNREFUSED), skip it and carry on with the rest
+            logging.warning(f"[error] couldn't send packet to {addrs[sent]}, {error=}")
+            sent += 1
@@ -1,16 +1,18 @@
-import base64
-import json
 import logging
 import socket
 from enum import IntEnum, auto
-from typing import Iterable, Dict, List, Any
+from typing import Iterable, Dict
 
-from cryptography.exceptions import InvalidKey
-from cryptography.fernet import Fernet
+from cryptography.fernet import InvalidToken
 
 from backend.logic.entity_logic import EntityManager, Entity, Player
+from backend.networks.snapshots import SnapshotDelta
+from backend.profiling import profiler
 from common.consts import Pos, RECV_CHUNK, FIRE_BALL
 from common.message_type import MessageType
+from common.protocol import decode_message, encode_json_message, encode_message, \
+    encode_routine_server
+from common.session_cipher import SessionCipher
 from common.utils import send_public_key, get_shared_key, deserialize_public_key
 
 
@@ -19,6 +21,9 @@ class S2SMessageType(IntEnum):
     PLAYER_LOGIN = auto()
     PLAYER_CONNECTED = auto()
     PLAYER_DISCONNECTED = auto()
+    NODE_CAPACITY = auto()
+    ENTITY_HANDOFF = auto()
+    ENTITY_ID_RELEASE = auto()
 
 
 def do_ecdh(conn: socket.socket) -> None | bytes:
@@ -32,34 +37,53 @@ def do_ecdh(conn: socket.socket) -> None | bytes:
     return get_shared_key(private_key, client_public_key)
 
 
-def decrypt_client_packet(parsed_packet: dict[str, Any], player_fernet: Fernet) -> dict | None:
+def decrypt_client_packet(encrypted_message: bytes, player_cipher: SessionCipher) -> dict | None:
+    """Decrypts and decodes the message of a client packet, see ``common.protocol.decode_message``."""
     try:
-        contents = json.loads(player_fernet.decrypt(base64.b64decode(parsed_packet["contents"])))
-        parsed_packet["contents"] = contents
-        return parsed_packet
-    except KeyError as e:
-        logging.warning(f"[error] invalid message from client, {parsed_packet=}, {e=}")
-    except InvalidKey as e:
-        logging.warning(f"[security] invalid key from client, {parsed_packet=}, {e=}")
-
-
-def serialize_entity_list(entities: Iterable[Entity]) -> dict:
-    """Serializes a list of entities to a JSON format."""
-    return {"entities": [entity.serialize() for entity in entities]}
-
-
-def craft_message(message_type: MessageType, message_contents: dict, fernet: Fernet) -> bytes:
-    return fernet.encrypt(json.dumps({"id": int(message_type)} | message_contents).encode())
+        with profiler.timer("decrypt"):
+            decrypted = player_cipher.decrypt(encrypted_message)
+        with profiler.timer("decode_message"):
+            return decode_message(decrypted)
+    except ValueError as e:
+        logging.warning(f"[error] invalid message from client, {e=}")
+    except InvalidToken as e:
+        logging.warning(f"[security] invalid token from client, {e=}")
+
+
+def serialize_entity_list(entities: Iterable[Entity], packed: Dict[int, bytes] | None = None) -> Dict[int, bytes]:
+    """Serializes a list of entities to packed entity records, by entity id.
+
+    :param packed: records that were already packed during this network tick, which are reused instead of packing
+        their entities again, and which the newly packed records are added to. Entities cache their own records (see
+        ``Entity.pack``), but projectiles are only materialized to be packed, so this is what they are shared by (see
+        ``EntityManager.pack_visible_projectiles``)"""
+    if packed is None:
+        return {entity.entity_id: entity.pack() for entity in entities}
+    records = {}
+    for entity in entities:
+        if (record := packed.get(entity.entity_id, None)) is None:
+            record = packed[entity.entity_id] = entity.pack()
+        records[entity.entity_id] = record
+    return records
+
+
+@profiler.timed("craft_message")
+def craft_message(message_type: MessageType, message_contents: dict, cipher: SessionCipher) -> bytes:
+    return cipher.encrypt(encode_json_message(message_type, message_contents))
+
+
+def generate_status_message(status: MessageType, cipher: SessionCipher) -> bytes:
+    """Generates a message with no contents` useful for status updates."""
+    return craft_message(status, {}, cipher)
 
 
-def generate_status_message(status: MessageType, fernet: Fernet) -> bytes:
-    """Generates a message with no contents` useful for status updates."""
-    return craft_message(status, {}, fernet)
+@profiler.timed("craft_message")
+def encode_routine_update(valid_pos: Pos, player: Player, snapshot: SnapshotDelta) -> bytes:
+    """Encodes (without encrypting) a routine server message, so that it can be encrypted away from the simulation."""
+    return encode_message(MessageType.ROUTINE_SERVER,
+                          encode_routine_server(valid_pos, player.health, player.skill_id, player.inventory,
+                                                snapshot.seqn, snapshot.baseline, snapshot.changed, snapshot.removed))
 
 
-def generate_routine_message(valid_pos: Pos, player: Player, sent_entities: Iterable[Entity]) -> bytes:
-    return craft_message(MessageType.ROUTINE_SERVER, {"valid_pos": valid_pos,
-                                                      "health": player.health,
-                                                      "inventory": player.inventory,
-                                                      "skill_id": player.skill_id} | serialize_entity_list(sent_entities),
-                         player.fernet)
+def generate_routine_message(valid_pos: Pos, player: Player, snapshot: SnapshotDelta) -> bytes:
+    return player.cipher.encrypt(encode_routine_update(valid_pos, player, snapshot))
@@ -0,0 +1,52 @@
+"""Per-client world snapshots, used to only send the entities that changed since the client's last acked snapshot."""
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+
+from common.consts import SNAPSHOT_HISTORY_SIZE
+
+
+class SnapshotDelta(NamedTuple):
+    seqn: int
+    baseline: int
+    """Snapshot the delta is relative to, or 0 for a full snapshot."""
+    changed: List[bytes]
+    """Packed records of the entities that were added or changed since ``baseline``."""
+    removed: List[int]
+    """Ids of the entities that were in ``baseline`` but aren't anymore."""
+
+
+class SnapshotHistory:
+    """The snapshots recently sent to a single client, each being a mapping of entity ids to their packed records.
+
+    Every new snapshot is delta-compressed against the latest snapshot the client acked, which it's guaranteed to
+    have. Until the client acks anything (or if its ack is too old), full snapshots are sent."""
+
+    def __init__(self, size: int = SNAPSHOT_HISTORY_SIZE):
+        self.size = size
+        self.acked = 0
+        self._last_seqn = 0
+        self._snapshots: OrderedDict[int, Dict[int, bytes]] = OrderedDict()
+
+    def ack(self, seqn: int):
+        """Marks a snapshot as received by the client, dropping the snapshots before it."""
+        if seqn <= self.acked or seqn not in self._snapshots:
+            return
+        self.acked = seqn
+        while next(iter(self._snapshots)) < seqn:
+            self._snapshots.popitem(last=False)
+
+    def delta(self, records: Dict[int, bytes]) -> SnapshotDelta:
+        """Stores a new snapshot, and returns its delta against the acked snapshot.
+
+        :param records: packed records of all entities the client should see, by entity id"""
+        self._last_seqn += 1
+        baseline = self._snapshots.get(self.acked, None)
+        self._snapshots[self._last_seqn] = records
+        if len(self._snapshots) > self.size:
+            self._snapshots.popitem(last=False)
+
+        if baseline is None:
+            return SnapshotDelta(self._last_seqn, 0, list(records.values()), [])
+        return SnapshotDelta(self._last_seqn, self.acked,
+                             [record for entity_id, record in records.items() if baseline.get(entity_id) != record],
+                             [entity_id for entity_id in baseline if entity_id not in records])
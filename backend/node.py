@@ -1,44 +1,59 @@
+import copy
+import functools
 import logging
 import queue
 import sys
 import threading
 import time
 from collections import defaultdict
-from typing import Set, Dict
-
-from pyqtree import Index
+from concurrent.futures import Future
+from typing import Set, Dict, Tuple, Callable, List, TypeVar
 
 # to import from a dir
 # from backend.logic.attacks import attack
 from backend.database import SqlDatabase, DB_PASS
 from backend.database.database_utils import update_user_info
 from backend.logic.collision import invalid_movement
+from backend.logic.collision_map import load_or_compile_collision_map
 from backend.logic.entity_logic import EntityManager, Player, Mob
+from backend.logic.spatial_index import GridIndex, StaticRectIndex
+from backend.logic.tick_loop import TickLoop, OverrunPolicy
 from common.message_type import MessageType
+from common.protocol import decode_client_packet
+from common.session_cipher import create_session_cipher
 
 sys.path.append('../')
 
 from common.consts import *
 from common.utils import *
-from backend_consts import MAX_SLOT, ROOT_SERVER2SERVER_PORT
+from backend_consts import MAX_SLOT, ROOT_SERVER2SERVER_PORT, GRID_CELL_SIZE, OBSTACLE_CELL_SIZE, PROFILING_ENABLED, \
+    STATS_EXPORT_ADDR, STATS_EXPORT_PATH, ASYNC_FRONTEND, CRYPTO_OFFLOAD_WORKERS, NETWORK_TICK_RATE, \
+    SNAPSHOT_TIMEOUT_TICKS
 
 from backend.networks.networking import decrypt_client_packet, \
-    generate_routine_message, generate_status_message, S2SMessageType, craft_message
+    encode_routine_update, generate_status_message, S2SMessageType, craft_message, serialize_entity_list
+from backend.networks.batched_io import BatchedReceiver, BatchedSender
+from backend.networks.snapshots import SnapshotHistory
+from backend.async_frontend import run_async_frontend
+
+from backend.logic.server_controlled_entities import server_entities_handler, create_entities_tick_loop
+from backend.profiling import profiler, StatsExporter
 
-from backend.logic.server_controlled_entities import server_entities_handler
-from client.map_manager import Map, Layer, TilesetData
+T = TypeVar("T")
 
 
 class Node:
     """Server that receive and transfer data to the clients and root server"""
 
-    def __init__(self, port, db_conn: SqlDatabase):
+    def __init__(self, port, db_conn: SqlDatabase, server_sock: socket.socket | None = None):
         # TODO: uncomment when coding on prod
         self.node_ip = "0.0.0.0" # the server need to bind to all possible ips
         #self.node_ip = "127.0.0.1"
         self.address = (self.node_ip, port)
-        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if server_sock is None:
+            server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock = server_sock
         self.root_sock = socket.socket()
         self.db = db_conn
         self.queue = queue.Queue()
@@ -46,6 +61,9 @@ class Node:
         # root_ip = enter_ip("Enter root's IP: ")
 
         self.root_send_queue = queue.Queue()
+        self.db_write_queue: queue.Queue[Player] = queue.Queue()
+        """Copies of the players that left the game, whose data is saved by the database thread."""
+        self.sender = BatchedSender(self.server_sock)
         self.root_recv_queue = queue.Queue()
 
         self.socket_dict = defaultdict(lambda: self.server_sock)
@@ -53,17 +71,37 @@ class Node:
 
         self.dead_clients: Set[str] = set()
         self.should_join: Dict[str, Player] = {}
-        self.entities_manager = EntityManager(create_map())
+        self.snapshots: Dict[str, SnapshotHistory] = defaultdict(SnapshotHistory)
+        """Snapshots recently sent to every player, by uuid."""
+        self.position_corrections: Dict[str, Pos] = {}
+        """Result of the latest movement check of every player, sent (once) with its next snapshot."""
+        self.commands: queue.SimpleQueue[Callable[[], None]] = queue.SimpleQueue()
+        """World mutations queued by the network threads, which the simulation thread applies at the start of its
+        next tick. The simulation thread is the only one mutating the world (and ``should_join`` and ``dead_clients``,
+        which the network threads only read), so that it needs no locks."""
+        self.inputs: Dict[str, List[dict]] = defaultdict(list)
+        """Routine messages of every player, buffered by the simulation thread until they are applied in a batch at the
+        start of its next tick."""
+        self.entities_manager = EntityManager(GridIndex(GRID_CELL_SIZE), create_map())
         self.generate_mobs()
-        # Starts the node
-        self.run()
+        self.tick_loop = create_entities_tick_loop(self.entities_manager, before_update=self.begin_tick)
+        self.network_loop = TickLoop(1 / NETWORK_TICK_RATE, self.broadcast_snapshots, OverrunPolicy.SKIP) \
+            if NETWORK_TICK_RATE else None
+        profiler.add_gauge("queue", self.queue.qsize)
+        profiler.add_gauge("commands", self.commands.qsize)
+        profiler.add_gauge("root_send_queue", self.root_send_queue.qsize)
+        profiler.add_gauge("db_write_queue", self.db_write_queue.qsize)
 
     def receiver(self):
+        receiver = BatchedReceiver(self.server_sock)
         while True:
             try:
-                self.queue.put(self.server_sock.recvfrom(RECV_CHUNK))
+                datagrams = receiver.recv()
             except ConnectionError:
                 continue
+            for datagram in datagrams:
+                self.queue.put(datagram)
+            profiler.count("packets_received", len(datagrams))
 
     def root_sender(self):
         while True:
@@ -71,18 +109,68 @@ class Node:
             self.root_sock.send(json.dumps(message).encode())
             logging.info(f"sent to root {message=}")
 
-    def update_location(self, player_pos: Pos, seqn: int, player: Player) -> Pos:
+    def db_writer(self):
+        """Saves the data of the players that left the game, so that the simulation thread never waits on the
+        database."""
+        while True:
+            player = self.db_write_queue.get()
+            try:
+                update_user_info(self.db, player)
+            except Exception:
+                logging.exception(f"[error] couldn't save the data of {player.uuid=}")
+
+    def send_to_client(self, packet: bytes, addr: Addr):
+        """Queues a packet to the client, which is sent in a batch with the other packets queued meanwhile."""
+        self.sender.send(packet, addr)
+
+    def apply_commands(self):
+        """Applies the commands queued since the previous tick, in order. Commands queued meanwhile wait for the next
+        tick, so that a flood of packets can't starve the simulation."""
+        for _ in range(self.commands.qsize()):
+            command = self.commands.get_nowait()
+            try:
+                command()
+            except Exception:
+                logging.exception("[error] command failed")
+
+    def run_command(self, command: Callable[[], T], timeout: float | None = None) -> T:
+        """Runs a command on the simulation thread, and blocks until it's done.
+
+        :param timeout: seconds to wait for the command, after which it's cancelled unless it already started
+        :returns: what the command returned
+        :raises TimeoutError: if the command isn't done within ``timeout``"""
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(command())
+            except Exception as e:
+                future.set_exception(e)
+
+        self.commands.put(run)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def update_location(self, player_pos: Pos, seqn: int, player: Player, collapsed: int = 1) -> Pos:
         """Updates the player location in the server and returns location data to be sent to the client.
 
         :param player: player to update
         :param player_pos: position of player given by the client
         :param seqn: sequence number given by the client
+        :param collapsed: number of messages (ending with ``seqn``) whose movement this update applies at once. Unless
+            they're consecutive, i.e. a message was lost, the movement is corrected as it is for a single message
         :returns: ``DEFAULT_POS_MARK`` if the client position is fine, or the server-side-calculated pos for the client
         otherwise.
         """
         # if the received packet is dated then update player
         secure_pos = DEFAULT_POS_MARK
-        if invalid_movement(player, player_pos, seqn, self.entities_manager) or seqn != player.last_updated_seqn + 1:
+        if invalid_movement(player, player_pos, seqn, self.entities_manager) or \
+                seqn != player.last_updated_seqn + collapsed:
             secure_pos = self.entities_manager.players[player.uuid].pos
         else:
             self.entities_manager.update_entity_location(player, player_pos)
@@ -90,79 +178,104 @@ class Node:
 
     def handle_player_termination(self, player: Player):
         self.entities_manager.remove_entity(player)
-        update_user_info(self.db, player)
+        self.snapshots.pop(player.uuid, None)
+        self.position_corrections.pop(player.uuid, None)
+        # a copy of the fields that are saved, taken on the simulation thread
+        saved = copy.copy(player)
+        saved.inventory = list(player.inventory)
+        self.db_write_queue.put(saved)
         self.dead_clients.add(player.uuid)
         self.root_send_queue.put({"status": S2SMessageType.PLAYER_DISCONNECTED, "uuid": player.uuid})
-        self.server_sock.sendto(generate_status_message(MessageType.DIED_SERVER, player.fernet), player.addr)
+        self.send_to_client(generate_status_message(MessageType.DIED_SERVER, player.cipher), player.addr)
 
     def kill_player(self, player: Player):
         logging.info(f"killing {player!r}")
         self.handle_player_termination(player)
 
+    def snapshot_client(self, player: Player, secure_pos: Pos, packed: Dict[int, bytes] | None = None) -> bytes:
+        """Builds the (not yet encrypted) routine message of a player. Reads the world, so it runs on the simulation
+        thread.
+
+        :param packed: entity records already packed during this network tick, see ``serialize_entity_list``"""
+        view = get_bounding_box(player.pos, SCREEN_HEIGHT, SCREEN_WIDTH)
+        entities_array = self.entities_manager.get_visible_entities(player, view)
+        # only the entities that changed since the last snapshot the client acked. The delta against it covers the
+        # entities that entered and left the player's view as well
+        records = serialize_entity_list(entities_array, packed) | \
+            self.entities_manager.pack_visible_projectiles(view, packed)
+        snapshot = self.snapshots[player.uuid].delta(records)
+        profiler.count("entity_records_sent", len(snapshot.changed))
+        return encode_routine_update(secure_pos, player, snapshot)
+
+    @profiler.timed("update_client")
     def update_client(self, player: Player, secure_pos: Pos):
         """Sends server message to the client"""
-        entities_array = self.entities_manager.get_entities_in_range(
-            get_bounding_box(player.pos, SCREEN_HEIGHT, SCREEN_WIDTH),
-            entity_filter=lambda _, entity_uuid: entity_uuid != player.uuid
-        )
-        # generate and send message
-        update_packet = generate_routine_message(secure_pos, player, entities_array)
-        self.server_sock.sendto(update_packet, player.addr)
+        self.send_to_client(player.cipher.encrypt(self.snapshot_client(player, secure_pos)), player.addr)
         logging.debug(f"[debug] sent message to client {player.uuid=}")
 
-    def routine_message_handler(self, player_uuid: str, contents: dict):
-        """Handles messages of type `MessageType.ROUTINE_CLIENT`."""
-        if player_uuid in self.should_join:
-            player = self.should_join.pop(player_uuid)
-            self.entities_manager.add_entity(player)
+    @profiler.timed("routine_message_handler")
+    def routine_message_handler(self, player_uuid: str, messages: List[dict]):
+        """Handles the messages of type `MessageType.ROUTINE_CLIENT` a player sent since the previous tick, as a single
+        batch.
 
+        Movement is collapsed: only the latest position is validated and applied, against the distance the player
+        could have moved since its last applied message. Swaps, attacks and skills are discrete, so every one of them is
+        applied, in order, with the slot and direction of the message it came with, ending up with the latest ones."""
         if player_uuid in self.dead_clients:
             return
 
-        try:
-            player_pos, seqn, attack_dir, slot_index, clicked_mouse, did_swap, using_skill = tuple(contents["pos"]), \
-                                                                                             contents["seqn"], \
-                                                                                             contents["dir"], \
-                                                                                             contents["slot"], \
-                                                                                             contents["is_attacking"], \
-                                                                                             contents["did_swap"], \
-                                                                                             contents["using_skill"]
-            swap_indices = (-1, -1)
-            if did_swap:
-                swap_indices = contents["swap"]
-        except KeyError:
-            logging.warning(f"[security] invalid message given by {player_uuid=}")
-            return
-
-        if slot_index > MAX_SLOT or slot_index < 0:
-            return
-
         player = self.entities_manager.players[player_uuid]
-        logging.debug(f"{player=} sent a routine message, {contents=}")
-        if seqn <= player.last_updated_seqn != 0:
-            logging.info(f"Got outdated packet from {player_uuid=}")
+        # the input of every message by sequence number, which drops duplicated messages as well
+        batch: Dict[int, tuple] = {}
+        for contents in messages:
+            try:
+                seqn, slot_index = contents["seqn"], contents["slot"]
+                swap_indices = tuple(contents["swap"]) if contents["did_swap"] else None
+                message_input = (tuple(contents["pos"]), contents["dir"], slot_index, contents["is_attacking"],
+                                 swap_indices, contents["using_skill"], contents["ack"])
+            except (KeyError, TypeError, ValueError):
+                logging.warning(f"[security] invalid message given by {player_uuid=}")
+                continue
+            if slot_index > MAX_SLOT or slot_index < 0:
+                continue
+            if swap_indices is not None and (len(swap_indices) != 2 or
+                                             not all(0 <= index < len(player.inventory) for index in swap_indices)):
+                logging.warning(f"[security] invalid inventory swap {swap_indices} given by {player_uuid=}")
+                continue
+            if seqn <= player.last_updated_seqn != 0:
+                logging.info(f"Got outdated packet from {player_uuid=}")
+                continue
+            batch[seqn] = message_input
+        if not batch:
             return
+        seqns = sorted(batch)
+        logging.debug(f"{player=} sent {len(seqns)} routine messages, {seqns=}")
+        profiler.count("inputs_collapsed", len(seqns) - 1)
+        for seqn in seqns:
+            self.snapshots[player_uuid].ack(batch[seqn][-1])
 
         if player.health <= MIN_HEALTH:
             self.kill_player(player)
             return
 
-        player.attacking_direction = attack_dir
-        secure_pos = self.update_location(player_pos, seqn, player)
+        latest_seqn = seqns[-1]
+        secure_pos = self.update_location(batch[latest_seqn][0], latest_seqn, player, len(seqns))
 
-        if did_swap:
-            player.inventory[swap_indices[0]], player.inventory[swap_indices[1]] = player.inventory[
-                                                                                       swap_indices[1]], \
-                                                                                   player.inventory[swap_indices[0]]
-            logging.info(f"{player=!r} swapped inventory slot {swap_indices[0]} with slot {swap_indices[1]}")
-        player.slot = slot_index
-        if clicked_mouse:
-            player.item.on_click(player, self.entities_manager)
+        for seqn in seqns:
+            _, attack_dir, slot_index, clicked_mouse, swap_indices, using_skill, _ = batch[seqn]
+            player.attacking_direction = attack_dir
+            if swap_indices is not None:
+                player.inventory[swap_indices[0]], player.inventory[swap_indices[1]] = \
+                    player.inventory[swap_indices[1]], player.inventory[swap_indices[0]]
+                logging.info(f"{player=!r} swapped inventory slot {swap_indices[0]} with slot {swap_indices[1]}")
+            player.slot = slot_index
+            if clicked_mouse:
+                player.item.on_click(player, self.entities_manager)
 
-        if using_skill:
-            player.skill.on_click(player, self.entities_manager)
+            if using_skill:
+                player.skill.on_click(player, self.entities_manager)
 
-        player.last_updated_seqn = seqn
+        player.last_updated_seqn = latest_seqn
         player.last_updated_time = time.time()
 
         bags = self.entities_manager.get_entities_in_range(
@@ -173,8 +286,53 @@ class Node:
             player.fill_inventory(bag)
             self.entities_manager.remove_entity(bag)
 
-        # self.broadcast_clients(player.uuid)
-        self.update_client(player, secure_pos)
+        if self.network_loop:
+            self.position_corrections[player_uuid] = secure_pos
+        else:
+            self.update_client(player, secure_pos)
+
+    @profiler.timed("apply_inputs")
+    def apply_inputs(self):
+        """Applies the routine messages buffered since the previous tick, one batch per player, in the order the
+        players joined. The outcome of a tick therefore doesn't depend on the order its packets were received in, and a
+        burst of late packets costs about as much as a single one."""
+        inputs, self.inputs = self.inputs, defaultdict(list)
+        for player_uuid in [player_uuid for player_uuid in self.entities_manager.players if player_uuid in inputs]:
+            try:
+                self.routine_message_handler(player_uuid, inputs[player_uuid])
+            except Exception:
+                logging.exception(f"[error] inputs of {player_uuid=} failed")
+
+    def begin_tick(self):
+        """Applies everything the network threads queued since the previous tick: the commands, and then the
+        players' inputs."""
+        self.apply_commands()
+        self.apply_inputs()
+
+    def collect_snapshots(self) -> List[Tuple[Player, bytes]]:
+        """Builds the routine message of every player, on the simulation thread. Every visible entity is packed once
+        per tick, and its record is shared by all players that see it."""
+        packed: Dict[int, bytes] = {}
+        messages = [(player, self.snapshot_client(player, self.position_corrections.pop(player.uuid, DEFAULT_POS_MARK),
+                                                  packed))
+                    for player in self.entities_manager.players.values()]
+        profiler.count("entity_records_packed", len(packed))
+        return messages
+
+    @profiler.timed("broadcast_snapshots")
+    def broadcast_snapshots(self):
+        """Sends every player a snapshot of the entities it sees, once per network tick. The snapshots are built by
+        the simulation thread at the start of its next tick, and encrypted and sent from this one. If the simulation
+        thread stalls, the broadcast is skipped rather than waited for."""
+        try:
+            messages = self.run_command(self.collect_snapshots, SNAPSHOT_TIMEOUT_TICKS / NETWORK_TICK_RATE)
+        except TimeoutError:
+            logging.warning(f"[ticks] the simulation thread didn't build the snapshots within {SNAPSHOT_TIMEOUT_TICKS} "
+                            f"network ticks, skipping the broadcast")
+            profiler.count("broadcasts_skipped")
+            return
+        for player, message in messages:
+            self.send_to_client(player.cipher.encrypt(message), player.addr)
 
     def closed_game_handler(self, player_uuid: str):
         if player := self.entities_manager.get(player_uuid, EntityType.PLAYER):
@@ -193,46 +351,59 @@ class Node:
         """Communicate with client"""
         while True:
             data, addr = self.queue.get()
-            parsed_packet = json.loads(data)
+            self.handle_client_packet(data)
 
-            if not (player_uuid := parsed_packet.get("uuid", None)):
-                logging.warning(f"[security] invalid packet {data=}")
-                continue
+    @profiler.timed("client_handler")
+    def handle_client_packet(self, data: bytes):
+        """Parses, decrypts and dispatches a single client packet."""
+        if not (resolved := self.resolve_client_packet(data)):
+            return
+        player_uuid, player, encrypted_message = resolved
+        if contents := decrypt_client_packet(encrypted_message, player.cipher):
+            self.dispatch_client_message(player_uuid, contents)
 
-            # sus
-            if player_uuid in self.dead_clients:
-                continue
+    def resolve_client_packet(self, data: bytes) -> Tuple[str, Player, bytes] | None:
+        """Finds the player that sent a client packet, letting it join if it's its first packet.
 
-            player = self.handle_should_join(player_uuid) if player_uuid in self.should_join.keys() else \
-                self.entities_manager.get(player_uuid, EntityType.PLAYER)
+        :returns: the player's uuid, the player and the (still encrypted) message, or ``None`` if the packet should be
+        dropped"""
+        try:
+            player_uuid, encrypted_message = decode_client_packet(data)
+        except ValueError as e:
+            logging.warning(f"[security] invalid packet {data=}, {e=}")
+            return None
 
-            if not player:
-                logging.warning(f"player uuid={player_uuid} couldn't be found")
-                continue
+        # sus
+        if player_uuid in self.dead_clients:
+            return None
 
-            data = decrypt_client_packet(parsed_packet, player.fernet)
-            if not data:
-                continue
-            try:
-                message_type = MessageType(data["contents"]["id"])
-            except KeyError as e:
-                logging.warning(f"[security] invalid message, no id/uuid present {data=}, {e=}")
-                continue
-            except ValueError as e:
-                logging.warning(f"[security] invalid id, {data=}, {e=}")
-                continue
+        # a joining player is only added to the world once its first message is handled
+        player = self.should_join.get(player_uuid, None) or self.entities_manager.get(player_uuid, EntityType.PLAYER)
 
-            if player := self.entities_manager.players.get(parsed_packet["uuid"], None):
-                with player.lock:
-                    match message_type:
-                        case MessageType.ROUTINE_CLIENT:
-                            self.routine_message_handler(player_uuid, data["contents"])
-                        case MessageType.CHAT_PACKET:
-                            self.chat_handler(player_uuid, data["contents"])
-                        case MessageType.CLOSED_GAME_CLIENT:
-                            self.closed_game_handler(player_uuid)
-                        case _:
-                            logging.warning(f"[security] no handler present for {message_type=}, {data=}")
+        if not player:
+            logging.warning(f"player uuid={player_uuid} couldn't be found")
+            return None
+        return player_uuid, player, encrypted_message
+
+    def dispatch_client_message(self, player_uuid: str, contents: dict):
+        """Queues a decrypted client message, to be handled by the simulation thread."""
+        self.commands.put(functools.partial(self.handle_client_message, player_uuid, contents))
+
+    def handle_client_message(self, player_uuid: str, contents: dict):
+        """Handles a decrypted client message, on the simulation thread."""
+        if player_uuid in self.should_join:
+            self.handle_should_join(player_uuid)
+        if player_uuid not in self.entities_manager.players:
+            return  # removed (or handed off to another worker) meanwhile
+        match message_type := contents["id"]:
+            case MessageType.ROUTINE_CLIENT:
+                self.inputs[player_uuid].append(contents)
+            case MessageType.CHAT_PACKET:
+                self.chat_handler(player_uuid, contents)
+            case MessageType.CLOSED_GAME_CLIENT:
+                self.closed_game_handler(player_uuid)
+            case _:
+                logging.warning(f"[security] no handler present for {message_type=}, {contents=}")
 
     def handle_player_prelogin(self, data: dict):
         """Handles the root message of a player that is going to join.
@@ -242,6 +413,8 @@ class Node:
         try:
             shared_key, player_uuid, initial_pos, ip, port = base64.b64decode(data["key"]), data["uuid"], \
                                                              data["initial_pos"], data["client_ip"], data["client_port"]
+            cipher = create_session_cipher(shared_key, CipherMode(data.get("cipher", CipherMode.FERNET)),
+                                           is_server=True)
             logging.info(f"[login] notified player {player_uuid=} with addr={(ip, port)} is about to join")
 
             if data["is_login"]:
@@ -249,19 +422,26 @@ class Node:
                 if new_health == 0:
                     new_health = MAX_HEALTH
 
-                self.should_join[player_uuid] = Player(uuid=player_uuid, addr=(ip, port),
-                                                       fernet=Fernet(base64.urlsafe_b64encode(shared_key)),
-                                                       pos=initial_pos, slot=data["initial_slot"],
-                                                       health=new_health, inventory=data["initial_inventory"])
+                player = Player(uuid=player_uuid, addr=(ip, port),
+                                cipher=cipher,
+                                pos=initial_pos, slot=data["initial_slot"],
+                                health=new_health, inventory=data["initial_inventory"])
 
             else:  # on signup
-                self.should_join[player_uuid] = Player(uuid=player_uuid, addr=(ip, port),
-                                                       fernet=Fernet(base64.urlsafe_b64encode(shared_key)),
-                                                       pos=initial_pos)
-            if player_uuid in self.dead_clients:
-                self.dead_clients.remove(player_uuid)
+                player = Player(uuid=player_uuid, addr=(ip, port),
+                                cipher=cipher,
+                                pos=initial_pos)
+            self.commands.put(functools.partial(self.prepare_join, player))
         except KeyError as e:
             logging.warning(f"[error] invalid message from root message, {data=}, {e=}")
+        except ValueError as e:
+            logging.warning(f"[error] unknown session cipher from root message, {data=}, {e=}")
+
+    def prepare_join(self, player: Player):
+        """Lets a player that is about to join send its first message, on the simulation thread. Its packets are
+        dropped until then, which the client's next packets make up for."""
+        self.dead_clients.discard(player.uuid)
+        self.should_join[player.uuid] = player
 
     def root_handler(self):
         """Receive new clients from the root infinitely
@@ -287,8 +467,8 @@ class Node:
         for uuid_to_broadcast in self.entities_manager.players:
             if player_uuid != uuid_to_broadcast:
                 player = self.entities_manager.get(uuid_to_broadcast, EntityType.PLAYER)
-                self.server_sock.sendto(craft_message(MessageType.CHAT_PACKET, {"new_message": new_message}
-                                                      , player.fernet), player.addr)
+                self.send_to_client(craft_message(MessageType.CHAT_PACKET, {"new_message": new_message},
+                                                  player.cipher), player.addr)
                 # TODO: update root server
 
     def generate_mobs(self):
@@ -304,34 +484,60 @@ class Node:
         self.server_sock.bind(self.address)
         self.root_sock.connect(("127.0.0.1", ROOT_SERVER2SERVER_PORT))  # may case the bug
         logging.info(f"bound to address {self.address}")
-
+        self.start_threads()
+        wait_for_threads()
+
+    def start_frontend(self):
+        """Starts serving client packets, either from an asyncio event loop or from a receiver thread feeding a pool
+        of handler threads, and the thread sending the replies."""
+        threading.Thread(target=self.sender.run, name="sender").start()
+        if ASYNC_FRONTEND:
+            threading.Thread(target=run_async_frontend, args=(self, self.server_sock, CRYPTO_OFFLOAD_WORKERS),
+                             name="frontend").start()
+            return
         threading.Thread(target=self.receiver).start()
-        threading.Thread(target=server_entities_handler, args=(self.entities_manager,)).start()
-        threading.Thread(target=self.root_handler).start()
-        threading.Thread(target=self.root_sender).start()
         for _ in range(THREADS_COUNT):
             # starts handlers threads
             client_thread = threading.Thread(target=self.client_handler)
             client_thread.start()
 
-
-def create_map():
-    """Create a new quadtree and loads the map
-
-    :returns: spindex: the quadtree
+    def start_threads(self):
+        self.start_frontend()
+        threading.Thread(target=server_entities_handler, args=(self.tick_loop,), name="simulation").start()
+        if self.network_loop:
+            threading.Thread(target=self.network_loop.run, name="broadcaster").start()
+        threading.Thread(target=self.root_handler).start()
+        threading.Thread(target=self.root_sender).start()
+        threading.Thread(target=self.db_writer, name="db_writer").start()
+        if PROFILING_ENABLED:
+            profiler.enabled = True
+            exporter = StatsExporter(profiler, path=STATS_EXPORT_PATH, addr=STATS_EXPORT_ADDR)
+            exporter.add_source("ticks", self.tick_loop.stats)
+            exporter.add_source("pools", self.entities_manager.pool.stats)
+            if self.network_loop:
+                exporter.add_source("network_ticks", self.network_loop.stats)
+            threading.Thread(target=exporter.run, daemon=True).start()
+
+
+def wait_for_threads():
+    """Blocks until all other threads exit. Once the main thread (or a process' target) returns, the interpreter starts
+    shutting down even though the node's threads keep running, and process pools stop accepting work."""
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread():
+            thread.join()
+
+
+def create_map() -> StaticRectIndex:
+    """Loads the map's obstacles into a static index, out of the memory-mapped collision map (which is compiled first
+    if it's outdated, see ``backend.logic.collision_map``).
+
+    :returns: the obstacles index
     """
-    spindex = Index(bbox=(0, 0, WORLD_WIDTH, WORLD_HEIGHT))
-    game_map = Map()
-    game_map.add_layer(Layer("../client/assets/map/animapa_test.csv",
-                             TilesetData("../client/assets/map/new_props.png",
-                                         "../client/assets/map/new_props.tsj")))
-    game_map.load_collision_objects_to(spindex)
-
-    return spindex
+    return load_or_compile_collision_map().build_index(OBSTACLE_CELL_SIZE)
 
 
 if __name__ == "__main__":
     logging.basicConfig(format="%(levelname)s:%(asctime)s %(threadName)s:%(thread)d - %(message)s", level=logging.INFO)
     db = SqlDatabase("127.0.0.1", DB_PASS)
     print(socket.gethostbyname(socket.gethostname()))
-    Node(NODE_PORT, db)
+    Node(NODE_PORT, db).run()
@@ -0,0 +1,165 @@
+"""Lightweight instrumentation of a node's hot paths: per-stage latency histograms, counters and gauges."""
+import contextlib
+import functools
+import json
+import logging
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from backend.backend_consts import HISTOGRAM_BUCKETS, STATS_EXPORT_INTERVAL
+from common.consts import Addr
+
+_null_timer = contextlib.nullcontext()
+
+
+class _StageStats:
+    """Latency histogram of a single stage, with power-of-two microsecond buckets."""
+
+    __slots__ = ("count", "total_ns", "max_ns", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        """``buckets[i]`` counts the samples that took less than ``2 ** i`` microseconds."""
+
+    def record(self, duration_ns: int):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.buckets[min((duration_ns // 1000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Returns an upper bound, in microseconds, of the given percentile."""
+        threshold, seen = fraction * self.count, 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= threshold:
+                return min(float(2 ** index), self.max_ns / 1000)
+        return self.max_ns / 1000
+
+    def to_dict(self) -> dict:
+        return {"count": self.count,
+                "mean_us": self.total_ns / self.count / 1000 if self.count else 0.,
+                "p50_us": self.percentile(0.5),
+                "p99_us": self.percentile(0.99),
+                "max_us": self.max_ns / 1000,
+                "histogram_us": {2 ** index: bucket for index, bucket in enumerate(self.buckets) if bucket}}
+
+
+class _Timer:
+    __slots__ = ("_profiler", "_stage", "_start")
+
+    def __init__(self, profiler: "Profiler", stage: str):
+        self._profiler = profiler
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info):
+        self._profiler.record(self._stage, time.perf_counter_ns() - self._start)
+
+
+class Profiler:
+    """Collects stage timings and counters. While disabled, every hook is a single attribute check."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageStats] = {}
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def record(self, stage: str, duration_ns: int):
+        with self._lock:
+            if not (stats := self._stages.get(stage, None)):
+                stats = self._stages[stage] = _StageStats()
+            stats.record(duration_ns)
+
+    def timer(self, stage: str):
+        """Context manager that times its body as ``stage``."""
+        return _Timer(self, stage) if self.enabled else _null_timer
+
+    def timed(self, stage: str):
+        """Decorator that times every call of the decorated function as ``stage``."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter_ns() - start)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, counter: str, amount: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def add_gauge(self, gauge: str, sample: Callable[[], float]):
+        """Registers a function that is sampled on every snapshot, e.g. a queue's ``qsize``."""
+        self._gauges[gauge] = sample
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """Returns the current stats. If ``reset`` is set, timings and counters start over afterwards."""
+        with self._lock:
+            stages = {stage: stats.to_dict() for stage, stats in self._stages.items()}
+            counters = dict(self._counters)
+            if reset:
+                self._stages.clear()
+                self._counters.clear()
+        return {"time": time.time(),
+                "stages": stages,
+                "counters": counters,
+                "gauges": {gauge: sample() for gauge, sample in list(self._gauges.items())}}
+
+
+profiler = Profiler()
+"""The process-wide profiler used by the node's hot paths."""
+
+
+class StatsExporter:
+    """Periodically exports snapshots of a profiler, as JSON lines appended to a file and/or as UDP datagrams sent to
+    a local address."""
+
+    def __init__(self, stats_profiler: Profiler, path: str | None = None, addr: Addr | None = None,
+                 interval: float = STATS_EXPORT_INTERVAL):
+        self.profiler = stats_profiler
+        self.path = path
+        self.addr = addr
+        self.interval = interval
+        self.extra_sources: List[Tuple[str, Callable[[], dict]]] = []
+        """Other stats that are exported with every snapshot, such as the tick loop's stats."""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if addr else None
+
+    def add_source(self, name: str, source: Callable[[], dict]):
+        self.extra_sources.append((name, source))
+
+    def export(self):
+        snapshot = self.profiler.snapshot(reset=True) | {name: source() for name, source in self.extra_sources}
+        data = json.dumps(snapshot)
+        if self.path:
+            with open(self.path, "a") as stats_file:
+                stats_file.write(data + "\n")
+        if self._sock:
+            try:
+                self._sock.sendto(data.encode(), self.addr)
+            except OSError as e:
+                logging.warning(f"[stats] couldn't export stats to {self.addr}, {e=}")
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.export()
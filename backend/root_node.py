@@ -27,7 +27,7 @@ from networks import do_ecdh
 
 from common.utils import deserialize_json, serialize_json
 from common.consts import ROOT_PORT, Addr, DEFAULT_ADDR, RECV_CHUNK, NUM_NODES, \
-    WORLD_WIDTH, WORLD_HEIGHT, MIN_HEALTH, MAX_HEALTH
+    WORLD_WIDTH, WORLD_HEIGHT, MIN_HEALTH, MAX_HEALTH, CipherMode
 from backend_consts import ROOT_SERVER2SERVER_PORT
 
 
@@ -43,6 +43,8 @@ class NodeData:
     map_id: int
     clients_info: List[ClientData]
     conn: socket.socket
+    capacity: int = 1
+    """Number of worker processes of the node (1 for a regular node)."""
 
 
 class EntryNode:
@@ -75,8 +77,8 @@ class EntryNode:
         return map(lambda data: data.conn, self.nodes)
 
     def get_minimal_load_server(self):
-        """get the Node with the smallest number of clients"""
-        return min(self.nodes, key=lambda n: len(n.clients_info))
+        """get the Node with the smallest number of clients per worker"""
+        return min(self.nodes, key=lambda n: len(n.clients_info) / n.capacity)
 
     def sender(self):
         """Sends messages to nodes"""
@@ -94,21 +96,28 @@ class EntryNode:
             ready_socks, _, _ = select.select(self.conns, [], [])
             for readable in ready_socks:
                 print("got here")
-                self.server_recv_queue.put(readable.recv(RECV_CHUNK))
+                self.server_recv_queue.put((readable, readable.recv(RECV_CHUNK)))
 
     def servers_handler(self):
         """Handles incoming packets from servers and responds accordingly."""
         while True:
             try:
-                message = json.loads(self.server_recv_queue.get())
+                conn, data = self.server_recv_queue.get()
+                message = json.loads(data)
                 logging.info(f"root: got {message=}")
+                node = next(node for node in self.nodes if node.conn is conn)
                 match S2SMessageType(message["status"]):
                     case S2SMessageType.PLAYER_CONNECTED:
                         self.connected_players.add(message["uuid"])
+                        node.clients_info.append(ClientData(uuid=message["uuid"]))
                     case S2SMessageType.PLAYER_DISCONNECTED:
                         self.connected_players.remove(message["uuid"])
+                        node.clients_info = [client for client in node.clients_info
+                                             if client.uuid != message["uuid"]]
+                    case S2SMessageType.NODE_CAPACITY:
+                        node.capacity = message["capacity"]
 
-            except KeyError | ValueError:
+            except (KeyError, ValueError):
                 continue
 
     def handle_incoming_players(self):
@@ -121,6 +130,10 @@ class EntryNode:
             data = deserialize_json(conn.recv(RECV_CHUNK), fernet)
             is_login, username, password, client_game_addr = data["is_login"], data["username"], data["password"], \
                                                              data["game_addr"]
+            try:
+                cipher_mode = CipherMode(data.get("cipher", CipherMode.FERNET))
+            except ValueError:
+                cipher_mode = CipherMode.FERNET
             initial_pos = self.get_initial_position()
             if is_login:
                 success, error_msg, user_uuid = login(username, password.encode(), self.db_conn)
@@ -147,6 +160,7 @@ class EntryNode:
                     "initial_pos": initial_pos,
                     "client_ip": client_game_addr[0],
                     "client_port": client_game_addr[1],
+                    "cipher": cipher_mode,
                     "is_login": False}
 
             if is_login:
@@ -161,6 +175,7 @@ class EntryNode:
             conn.send(serialize_json({"ip": target_node.ip,
                                       "initial_pos": initial_pos,
                                       "uuid": user_uuid,
+                                      "cipher": cipher_mode,
                                       "success": True}, fernet))
 
             self.server_send_queue.put(([target_node], data))
@@ -0,0 +1,242 @@
+"""Node whose world is sharded across worker processes, so that it isn't capped at a single core by the GIL.
+
+The front process owns the node's public UDP socket and its connection with the root. It only reads the (clear)
+envelope of client packets, and dispatches them to the worker that owns the player. Every worker is a full ``Node``
+owning a strip of the world, which replies to its clients directly through the front's socket (inherited by the
+worker), and hands off the players/mobs that cross into another strip to the worker owning it."""
+import functools
+import json
+import logging
+import math
+import multiprocessing
+import pickle
+import socket
+import sys
+import threading
+import uuid
+from typing import Dict, List, Tuple
+
+from backend.async_frontend import run_async_frontend
+from backend.backend_consts import NODE_WORKERS, ROOT_SERVER2SERVER_PORT, ASYNC_FRONTEND
+from backend.database import SqlDatabase, DB_PASS
+from backend.logic.entity_logic import Entity, Mob, Player, partition_entity_ids, entity_id_owner, release_entity_id
+from backend.logic.server_controlled_entities import create_entities_tick_loop
+from backend.networks.networking import S2SMessageType
+from backend.node import Node, wait_for_threads
+from backend.profiling import profiler
+from common.consts import NODE_PORT, RECV_CHUNK, WORLD_HEIGHT, MOB_COUNT, EntityType, Pos
+from common.protocol import CLIENT_ENVELOPE, PROTOCOL_VERSION
+
+
+class RegionMap:
+    """Splits the playable area of the world into horizontal strips of equal height, one per worker."""
+
+    def __init__(self, count: int, height: int = WORLD_HEIGHT // 3):
+        self.count = count
+        self.strip_height = math.ceil(height / count)
+
+    def region_of(self, pos: Pos) -> int:
+        """Returns the region a position is in. Positions outside the playable area belong to the closest region."""
+        return min(max(int(pos[1]) // self.strip_height, 0), self.count - 1)
+
+    def bounds(self, region: int) -> Tuple[int, int]:
+        """Returns the minimal and maximal y of a region."""
+        return region * self.strip_height, (region + 1) * self.strip_height
+
+
+class WorkerNode(Node):
+    """Node that owns a single region of a sharded node. It receives its client packets from the front process, and
+    talks with the root and the other workers through the front process as well."""
+
+    def __init__(self, region: int, regions: RegionMap, server_sock: socket.socket, channel: socket.socket,
+                 inbox: multiprocessing.Queue, outbox: multiprocessing.Queue, db_conn: SqlDatabase):
+        partition_entity_ids(region, regions.count, release_foreign=self.release_foreign_id)
+        self.region = region
+        self.regions = regions
+        self.channel = channel
+        """Datagram socket through which the front process dispatches client packets."""
+        self.inbox = inbox
+        """Messages from the front: players about to join, and entities handed off by other workers."""
+        self.outbox = outbox
+        """Messages to the front: messages to the root, and entities handed off to other workers."""
+        super().__init__(NODE_PORT, db_conn, server_sock)
+        self.tick_loop = create_entities_tick_loop(self.entities_manager, before_update=self.begin_tick,
+                                                   after_update=self.hand_off_leaving_entities)
+
+    def generate_mobs(self):
+        """Generates this region's share of the mobs."""
+        y_min, y_max = self.regions.bounds(self.region)
+        for _ in range(MOB_COUNT // self.regions.count):
+            mob = Mob()
+            mob.pos = self.entities_manager.get_available_position(EntityType.MOB, y_min=y_min, y_max=y_max)
+            self.entities_manager.add_entity(mob)
+
+    def start_frontend(self):
+        if ASYNC_FRONTEND:
+            # workers are daemon processes, which can't have a crypto pool of their own
+            threading.Thread(target=run_async_frontend, args=(self, self.channel), name="frontend").start()
+            return
+        super().start_frontend()
+
+    def receiver(self):
+        while True:
+            self.queue.put((self.channel.recv(RECV_CHUNK), None))
+            profiler.count("packets_received")
+
+    def root_sender(self):
+        while True:
+            self.outbox.put(self.root_send_queue.get())
+
+    def root_handler(self):
+        while True:
+            message = self.inbox.get()
+            match message["id"]:
+                case S2SMessageType.PLAYER_LOGIN:
+                    self.handle_player_prelogin(message)
+                case S2SMessageType.ENTITY_HANDOFF:
+                    self.commands.put(functools.partial(self.receive_entity, message))
+                case S2SMessageType.ENTITY_ID_RELEASE:
+                    self.commands.put(functools.partial(release_entity_id, message["entity_id"]))
+
+    def hand_off(self, region: int, entity: Entity):
+        """Sends an entity, which was already removed from this worker, to the worker owning ``region``."""
+        logging.info(f"[handoff] handing off {entity.uuid} to region {region}")
+        message = {"id": S2SMessageType.ENTITY_HANDOFF,
+                   "region": region,
+                   "entity": pickle.dumps(entity),
+                   "player_uuid": None,
+                   "snapshots": None}
+        if isinstance(entity, Player):
+            # the broadcaster may still encrypt snapshots of this tick for the player, after it's pickled above, which
+            # its session cipher reserves counters for (see ``AeadSession.__getstate__``).
+            # the client keeps acking snapshots of this worker, so the next worker carries on from them
+            message |= {"player_uuid": entity.uuid, "snapshots": pickle.dumps(self.snapshots.pop(entity.uuid, None))}
+            self.position_corrections.pop(entity.uuid, None)
+        self.outbox.put(message)
+
+    def release_foreign_id(self, entity_id: int):
+        """Sends the id of an entity that was handed off to this worker and left the game back to the worker that
+        allocated it, so that it can be reused."""
+        self.outbox.put({"id": S2SMessageType.ENTITY_ID_RELEASE,
+                         "region": entity_id_owner(entity_id),
+                         "entity_id": entity_id})
+
+    def hand_off_leaving_entities(self):
+        """Hands off the players and mobs that left this worker's region, once per tick."""
+        for player in list(self.entities_manager.players.values()):
+            if (region := self.regions.region_of(player.pos)) != self.region:
+                self.entities_manager.remove_entity(player, release_id=False)
+                self.hand_off(region, player)
+        for mob in list(self.entities_manager.mobs.values()):
+            if (region := self.regions.region_of(mob.pos)) != self.region:
+                self.entities_manager.remove_entity(mob, release_id=False)
+                self.hand_off(region, mob)
+
+    def receive_entity(self, message: dict):
+        entity = pickle.loads(message["entity"])
+        if isinstance(entity, Player) and (snapshots := pickle.loads(message["snapshots"])):
+            self.snapshots[entity.uuid] = snapshots
+        self.entities_manager.add_entity(entity)
+        logging.info(f"[handoff] received {entity.uuid}")
+
+    def run(self):
+        self.start_threads()
+        wait_for_threads()
+
+
+def run_worker(region: int, regions: RegionMap, server_sock: socket.socket, channel: socket.socket,
+               inbox: multiprocessing.Queue, outbox: multiprocessing.Queue):
+    """Entry point of a worker process."""
+    logging.basicConfig(format=f"%(levelname)s:%(asctime)s worker-{region} %(threadName)s - %(message)s",
+                        level=logging.INFO)
+    WorkerNode(region, regions, server_sock, channel, inbox, outbox, SqlDatabase("127.0.0.1", DB_PASS)).run()
+
+
+class ShardedNode:
+    """Front process of a sharded node, see the module's documentation."""
+
+    def __init__(self, port: int, worker_count: int = NODE_WORKERS):
+        self.address = ("0.0.0.0", port)
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.root_sock = socket.socket()
+        self.regions = RegionMap(worker_count)
+
+        self.routes: Dict[bytes, int] = {}
+        """Maps the (raw) uuid of every player to the region of the worker that currently owns it."""
+        self.outbox = multiprocessing.Queue()
+        self.inboxes: List[multiprocessing.Queue] = []
+        self.channels: List[socket.socket] = []
+        self.workers: List[multiprocessing.Process] = []
+        for region in range(worker_count):
+            front_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.inboxes.append(multiprocessing.Queue())
+            self.channels.append(front_end)
+            self.workers.append(multiprocessing.Process(target=run_worker, name=f"worker-{region}", daemon=True,
+                                                        args=(region, self.regions, self.server_sock, worker_end,
+                                                              self.inboxes[region], self.outbox)))
+
+    def dispatcher(self):
+        """Dispatches every client packet to the worker that owns its player."""
+        while True:
+            try:
+                packet, addr = self.server_sock.recvfrom(RECV_CHUNK)
+            except ConnectionError:
+                continue
+            if len(packet) < CLIENT_ENVELOPE.size:
+                continue
+            version, player_uuid = CLIENT_ENVELOPE.unpack_from(packet)
+            if version != PROTOCOL_VERSION or (region := self.routes.get(player_uuid, None)) is None:
+                logging.warning(f"[security] couldn't dispatch packet from {addr=}")
+                continue
+            self.channels[region].send(packet)
+
+    def root_handler(self):
+        """Sends every player that is about to join to the worker owning its initial position."""
+        while True:
+            try:
+                data = json.loads(self.root_sock.recv(RECV_CHUNK))
+                match S2SMessageType(data["id"]):
+                    case S2SMessageType.PLAYER_LOGIN:
+                        region = self.regions.region_of(data["initial_pos"])
+                        self.routes[uuid.UUID(data["uuid"]).bytes] = region
+                        self.inboxes[region].put(data)
+            except (KeyError, ValueError) as e:
+                logging.warning(f"[error] prelogin message from root has an invalid format, {e=}")
+
+    def workers_handler(self):
+        """Passes handed off entities and released ids between workers, and forwards all other worker messages to the
+        root."""
+        while True:
+            message = self.outbox.get()
+            if message.get("id", None) == S2SMessageType.ENTITY_ID_RELEASE:
+                self.inboxes[message["region"]].put(message)
+                continue
+            if message.get("id", None) == S2SMessageType.ENTITY_HANDOFF:
+                if message["player_uuid"]:
+                    self.routes[uuid.UUID(message["player_uuid"]).bytes] = message["region"]
+                self.inboxes[message["region"]].put(message)
+                continue
+
+            if message["status"] == S2SMessageType.PLAYER_DISCONNECTED:
+                self.routes.pop(uuid.UUID(message["uuid"]).bytes, None)
+            self.root_sock.send(json.dumps(message).encode())
+            logging.info(f"sent to root {message=}")
+
+    def run(self):
+        self.server_sock.bind(self.address)
+        self.root_sock.connect(("127.0.0.1", ROOT_SERVER2SERVER_PORT))
+        self.root_sock.send(json.dumps({"status": S2SMessageType.NODE_CAPACITY,
+                                        "capacity": self.regions.count}).encode())
+        logging.info(f"bound to address {self.address}, starting {self.regions.count} workers")
+
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self.dispatcher).start()
+        threading.Thread(target=self.root_handler).start()
+        threading.Thread(target=self.workers_handler).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(levelname)s:%(asctime)s %(threadName)s:%(thread)d - %(message)s", level=logging.INFO)
+    ShardedNode(NODE_PORT, int(sys.argv[1]) if len(sys.argv) > 1 else NODE_WORKERS).run()
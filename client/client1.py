@@ -41,7 +41,8 @@ def main():
 
         my_game = game.Game(connection_screen.sock, connection_screen.game_server_addr,
                             connection_screen.received_player_uuid, connection_screen.shared_key,
-                            connection_screen.full_screen, connection_screen.initial_pos)
+                            connection_screen.full_screen, connection_screen.initial_pos,
+                            connection_screen.cipher_mode)
         pygame.init()
         my_game.run()
 
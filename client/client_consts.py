@@ -21,6 +21,10 @@ GAME_NAME = "MMORPG Game"
 
 FPS = 60
 TILE_SIZE = 64
+CHUNK_TILES = 16
+"""Width and height (in tiles) of the pre-rendered chunks the map's tile layers are drawn in."""
+MAX_CACHED_CHUNKS = 12
+"""Number of pre-rendered chunks kept, at 4 MiB each, which is a few screens' worth."""
 
 # general player data
 SPEED = 5
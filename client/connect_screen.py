@@ -12,7 +12,7 @@ from login import do_ecdh, send_credentials
 
 sys.path.append('../')
 from client_consts import *
-from common.consts import NODE_PORT, SCREEN_HEIGHT, ROOT_PORT, RECV_CHUNK
+from common.consts import NODE_PORT, SCREEN_HEIGHT, ROOT_PORT, RECV_CHUNK, CipherMode
 from graphics import *
 
 
@@ -22,6 +22,7 @@ class ConnectScreen:
         self.received_player_uuid = None
         self.game_server_addr = None
         self.shared_key = None
+        self.cipher_mode = CipherMode.FERNET
         self.width = SCREEN_WIDTH
         self.height = SCREEN_HEIGHT
         self.screen = screen
@@ -172,6 +173,7 @@ class ConnectScreen:
                 self.game_server_addr = (data["ip"], NODE_PORT)
                 self.received_player_uuid = data["uuid"]
                 self.initial_pos = data["initial_pos"]
+                self.cipher_mode = CipherMode(data.get("cipher", CipherMode.FERNET))
             except KeyError as e:
                 print(f"Invalid message received, {e=}")
 
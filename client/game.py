@@ -13,6 +13,7 @@ import items
 
 from graphics import ChatBox
 from common.consts import *
+from common.session_cipher import create_session_cipher
 from networking import *
 from player import Player
 from sprites import PlayerEntity, FollowingCameraGroup, Entity
@@ -22,12 +23,13 @@ from map_manager import *
 
 class Game:
     def __init__(self, conn: socket.socket, server_addr: tuple, player_uuid: str, shared_key: bytes, full_screen,
-                 initial_pos: tuple):
+                 initial_pos: tuple, cipher_mode: CipherMode = CipherMode.FERNET):
         # misc networking
         self.entities = {}
         self.recv_queue = queue.Queue()
         self.seqn = 0
-        self.fernet = Fernet(base64.urlsafe_b64encode(shared_key))
+        self.snapshots = SnapshotBuffer()
+        self.cipher = create_session_cipher(shared_key, cipher_mode, is_server=False)
 
         # init sprites
         self.can_recv: bool = False
@@ -139,35 +141,37 @@ class Game:
                     self.player.set_item_in_slot(i, weapon)
             else:
                 self.player.set_item_in_slot(i, None)
-        self.render_entities(entities)
+        if (snapshot := self.snapshots.apply(contents)) is not None:
+            self.render_entities(list(snapshot.values()))
         self.update_player_status(pos, health)
 
     def server_update(self):
         """communicate with the server over UDP."""
-        update_packet = generate_client_routine_message(self.player_uuid, self.seqn, self.x, self.y,
-                                                        self.player, self.fernet)
+        update_packet = generate_client_routine_message(self.player_uuid, self.seqn, self.snapshots.latest, self.x,
+                                                        self.y, self.player, self.cipher)
         print(self.server_addr)
         self.conn.sendto(update_packet, self.server_addr)
         self.seqn += 1
-        # receive server update
-        try:
-            packet, addr = self.recv_queue.get(block=False)
-        except queue.Empty:
-            return
-        if addr != self.server_addr:
-            return
-        contents = parse_message(packet, self.fernet)
-
-        match MessageType(contents["id"]):
-            case MessageType.ROUTINE_SERVER:
-                self.server_routine_handler(contents)
-            case MessageType.CHAT_PACKET:
-                self.chat.add_message(contents["new_message"])
-            case MessageType.DIED_SERVER:
-                self.running = False
-                pygame.quit()
-            case _:
-                print("invalid message type")
+        # receive all server updates since the last frame, since the server sends snapshots on its own network tick
+        while self.running:
+            try:
+                packet, addr = self.recv_queue.get(block=False)
+            except queue.Empty:
+                return
+            if addr != self.server_addr:
+                continue
+            contents = parse_message(packet, self.cipher)
+
+            match MessageType(contents["id"]):
+                case MessageType.ROUTINE_SERVER:
+                    self.server_routine_handler(contents)
+                case MessageType.CHAT_PACKET:
+                    self.chat.add_message(contents["new_message"])
+                case MessageType.DIED_SERVER:
+                    self.running = False
+                    pygame.quit()
+                case _:
+                    print("invalid message type")
 
     def update_player_status(self, valid_pos: Pos, health: int) -> None:
         """update player status by the server message"""
@@ -182,42 +186,42 @@ class Game:
         Use: prints the other clients by the given info about them
         """
         for entity in entities:
-            entity_type, entity_uuid, pos, entity_dir = entity["type"], entity["uuid"], entity["pos"], entity["dir"]
-            print(f"received entity {entity_uuid=} {entity_type=} {pos=} {entity_dir=}")
-            if entity_uuid in self.entities.keys():
+            entity_type, entity_id, pos, entity_dir = entity["type"], entity["id"], entity["pos"], entity["dir"]
+            print(f"received entity {entity_id=} {entity_type=} {pos=} {entity_dir=}")
+            if entity_id in self.entities.keys():
                 print("entity in keys, updating")
-                self.entities[entity_uuid].direction = entity_dir
-                self.entities[entity_uuid].move_to(*pos)
-                if entity_type == EntityType.PLAYER and self.entities[entity_uuid].tool_id != entity["tool"]:
+                self.entities[entity_id].direction = entity_dir
+                self.entities[entity_id].move_to(*pos)
+                if entity_type == EntityType.PLAYER and self.entities[entity_id].tool_id != entity["tool"]:
                     print("THERE IS A PLAYER")
-                    self.entities[entity_uuid].update_tool(entity["tool"])
+                    self.entities[entity_id].update_tool(entity["tool"])
                 if hp := entity.get("hp", None):
-                    self.entities[entity_uuid].health = hp
+                    self.entities[entity_id].health = hp
             else:
                 match entity_type:
                     case EntityType.PLAYER:
                         print("creating player")
-                        self.entities[entity_uuid] = PlayerEntity((self.obstacles_sprites, self.visible_sprites), *pos,
-                                                                  entity_dir, entity["tool"], self.map_collision)
+                        self.entities[entity_id] = PlayerEntity((self.obstacles_sprites, self.visible_sprites), *pos,
+                                                                entity_dir, entity["tool"], self.map_collision)
                     case EntityType.BAG:
                         print(f"creating bag")
-                        self.entities[entity_uuid] = Entity((self.visible_sprites,), entity_type,
-                                                            *pos, entity_dir)
+                        self.entities[entity_id] = Entity((self.visible_sprites,), entity_type,
+                                                          *pos, entity_dir)
                     case _:
                         print(f"creating entity of type {entity_type}")
-                        self.entities[entity_uuid] = Entity((self.visible_sprites, self.obstacles_sprites), entity_type,
-                                                            *pos, entity_dir)
+                        self.entities[entity_id] = Entity((self.visible_sprites, self.obstacles_sprites), entity_type,
+                                                          *pos, entity_dir)
 
         remove_entities = []
-        received_uuids = list(map(lambda info: info["uuid"], entities))
-        for entity_uuid in self.entities.keys():
-            if entity_uuid not in received_uuids:
-                print(f"killing uuid={entity_uuid}")
-                self.entities[entity_uuid].kill()
-                remove_entities.append(entity_uuid)
+        received_ids = {entity["id"] for entity in entities}
+        for entity_id in self.entities.keys():
+            if entity_id not in received_ids:
+                print(f"killing id={entity_id}")
+                self.entities[entity_id].kill()
+                remove_entities.append(entity_id)
 
-        for entity_uuid in remove_entities:
-            self.entities.pop(entity_uuid)
+        for entity_id in remove_entities:
+            self.entities.pop(entity_id)
 
     def run(self):
         """
@@ -259,7 +263,7 @@ class Game:
                         elif event.key == pygame.K_RETURN:  # Check if enter is clicked and sends the message
                             self.chat.add_message(self.chat_msg)
                             chat_packet = craft_client_message(MessageType.CHAT_PACKET, self.player_uuid,
-                                                               {"new_message": self.chat_msg}, self.fernet)
+                                                               {"new_message": self.chat_msg}, self.cipher)
                             self.conn.sendto(chat_packet, self.server_addr)
 
                             self.chat_msg = ""
@@ -343,8 +347,7 @@ class Game:
         self.display_surface.blit(hot_bar, (width, SCREEN_HEIGHT - self.hot_bar.get_height()))
 
     def draw_map(self):
-        for layer in self.map.layers:
-            layer.draw_layer(self.visible_sprites)
+        self.visible_sprites.map_chunks = MapChunks(self.map.layers)
 
 
 @atexit.register
@@ -352,6 +355,6 @@ def on_game_exit(*args, game: Game | None = None):
     """Handles game closure."""
     pygame.quit()
     if game:
-        game.conn.sendto(craft_client_message(MessageType.CLOSED_GAME_CLIENT, game.player_uuid, {}, fernet=game.fernet),
+        game.conn.sendto(craft_client_message(MessageType.CLOSED_GAME_CLIENT, game.player_uuid, {}, game.cipher),
                          game.server_addr)
         game.running = False
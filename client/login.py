@@ -3,7 +3,7 @@ import socket
 
 from cryptography.fernet import Fernet
 
-from common.consts import RECV_CHUNK, Addr
+from common.consts import RECV_CHUNK, Addr, SESSION_CIPHER_MODE
 from common.utils import get_shared_key, deserialize_public_key, send_public_key, serialize_json
 
 
@@ -20,10 +20,12 @@ def do_ecdh(conn: socket.socket) -> bytes | None:
 
 def send_credentials(username: str, password: str, conn: socket.socket, fernet: Fernet, client_game_addr: Addr,
                      is_login: bool = False):
-    """Sends over a TCP connection the encrypted login data of a client: its username, password, and UDP game address.
+    """Sends over a TCP connection the encrypted login data of a client: its username, password, UDP game address
+    and the cipher it wants for the game session.
     """
     conn.send(serialize_json({"username": username,
                               "password": password,
                               "game_addr": client_game_addr,
-                              "is_login": is_login},
+                              "is_login": is_login,
+                              "cipher": SESSION_CIPHER_MODE},
                              fernet))
@@ -1,6 +1,11 @@
+import glob
 import json
-from csv import reader
+import os
+import sys
+from collections import OrderedDict
+from typing import List, Tuple
 
+import numpy as np
 import pygame
 from pyqtree import Index
 
@@ -8,20 +13,43 @@ from common.utils import get_bounding_box
 from common.consts import EntityType
 
 try:
-    from client_consts import TILE_SIZE
-    from sprites import Tile
+    from client_consts import TILE_SIZE, CHUNK_TILES, MAX_CACHED_CHUNKS
 except ModuleNotFoundError:
-    from client.client_consts import TILE_SIZE
-    from client.sprites import Tile
+    from client.client_consts import TILE_SIZE, CHUNK_TILES, MAX_CACHED_CHUNKS
 
 
-def import_csv_layer(path):
-    layer = []
-    with open(path) as level_map:
-        layout = reader(level_map, delimiter=",")
-        for row in layout:
-            layer.append(row)
-        return layer
+EMPTY_TILE = np.iinfo(np.uint16).max
+"""Id of the empty tiles in binary layers, which are -1 in CSV layers."""
+
+
+def binary_layer_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".npy"
+
+
+def convert_csv_layer(csv_path: str) -> str:
+    """Converts a CSV layer into a binary grid of ``uint16`` tile ids next to it, see ``load_layer_grid``.
+
+    :returns: path of the binary layer"""
+    grid = np.loadtxt(csv_path, delimiter=",", dtype=np.int32, ndmin=2)
+    if grid.max(initial=-1) >= EMPTY_TILE:
+        raise ValueError(f"{csv_path} has tile ids that don't fit in 16 bits")
+    binary_path = binary_layer_path(csv_path)
+    temporary_path = f"{binary_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as binary_file:
+        np.save(binary_file, np.where(grid < 0, EMPTY_TILE, grid).astype(np.uint16))
+    os.replace(temporary_path, binary_path)
+    return binary_path
+
+
+def load_layer_grid(csv_path: str) -> np.ndarray:
+    """Memory-maps the binary version of a CSV layer, converting the layer first if its binary version is missing or
+    older than it.
+
+    :returns: read-only grid of tile ids, indexed by (y, x), in which empty tiles are ``EMPTY_TILE``"""
+    binary_path = binary_layer_path(csv_path)
+    if not os.path.exists(binary_path) or os.path.getmtime(binary_path) < os.path.getmtime(csv_path):
+        convert_csv_layer(csv_path)
+    return np.load(binary_path, mmap_mode="r")
 
 
 class MapTile:
@@ -73,30 +101,26 @@ class TilesetData:
 
 class Layer:
     def __init__(self, csv_file_path, tileset: TilesetData):
-        self.layer_grid = import_csv_layer(csv_file_path)
+        self.layer_grid = load_layer_grid(csv_file_path)
         self.tileset = tileset
         self.collision_objects = []
 
+    def tiles(self, x_min: int = 0, y_min: int = 0, x_max: int | None = None, y_max: int | None = None):
+        """Yields the x and y (in tiles) and the id of every non-empty tile, without going over the empty ones.
+
+        :param x_min, y_min, x_max, y_max: limits (in tiles, the maximums excluded) of the area whose tiles are yielded,
+            which is the whole layer by default"""
+        area = self.layer_grid[y_min:y_max, x_min:x_max]
+        tile_ys, tile_xs = np.nonzero(area != EMPTY_TILE)
+        return zip((tile_xs + x_min).tolist(), (tile_ys + y_min).tolist(), area[tile_ys, tile_xs].tolist())
+
     def load_collision_objects(self):
-        for y in range(len(self.layer_grid)):
-            for x in range(len(self.layer_grid[0])):
-                tile_id = int(self.layer_grid[y][x])
-                if tile_id != -1:
-                    tile_id = int(tile_id)
-                    tile = self.tileset.get_tile(tile_id)
-                    if tile.has_collision:
-                        for rect in tile.get_collision_objects():
-                            rect.x += x * TILE_SIZE
-                            rect.y += y * TILE_SIZE
-                            self.collision_objects.append(rect)
-
-    def draw_layer(self, visible_sprites):
-        for y in range(len(self.layer_grid)):
-            for x in range(len(self.layer_grid[0])):
-                tile_id = int(self.layer_grid[y][x])
-                if tile_id != -1:
-                    tile = self.tileset.get_tile(tile_id)
-                    Tile((visible_sprites,), (x * TILE_SIZE, y * TILE_SIZE), tile.image)
+        for x, y, tile_id in self.tiles():
+            tile = self.tileset.get_tile(tile_id)
+            if tile.has_collision:
+                for rect in tile.get_collision_objects():
+                    # a moved copy, since the tile's rects are shared by all of its occurrences
+                    self.collision_objects.append(rect.move(x * TILE_SIZE, y * TILE_SIZE))
 
 
 class Map:
@@ -107,11 +131,68 @@ class Map:
     def add_layer(self, layer: Layer):
         self.layers.append(layer)
 
-    def load_collision_objects_to(self, quadtree: Index):
+    def load_collision_objects(self) -> list:
+        """Loads the collision objects of all layers, and returns them."""
         self.collision_objects = []
         for layer in self.layers:
             layer.load_collision_objects()
             self.collision_objects.extend(layer.collision_objects)
+        return self.collision_objects
+
+    def load_collision_objects_to(self, quadtree: Index):
+        for obj in self.load_collision_objects():
+            quadtree.insert((EntityType.OBSTACLE, obj), get_bounding_box((obj.x, obj.y), obj.height, obj.width))
+
+
+class MapChunks:
+    """The map's tile layers, pre-rendered in square chunks of ``chunk_tiles`` tiles, so that drawing the map costs a
+    blit per chunk on the screen instead of one per tile.
 
-            for obj in layer.collision_objects:
-                quadtree.insert((EntityType.OBSTACLE, obj), get_bounding_box((obj.x, obj.y), obj.height, obj.width))
+    Chunks are rendered the first time the camera sees them, and only the ``max_chunks`` least recently seen ones are
+    kept."""
+
+    def __init__(self, layers: List[Layer], chunk_tiles: int = CHUNK_TILES, max_chunks: int = MAX_CACHED_CHUNKS):
+        self.layers = layers
+        self.chunk_tiles = chunk_tiles
+        self.chunk_size = chunk_tiles * TILE_SIZE
+        self.max_chunks = max_chunks
+        self._chunks: OrderedDict[Tuple[int, int], pygame.Surface | None] = OrderedDict()
+        """Rendered chunks by their (x, y), in least recently seen order. Empty chunks are None."""
+
+    def render(self, chunk_x: int, chunk_y: int) -> pygame.Surface | None:
+        """Renders the tiles of all layers in a chunk, in layers' order.
+
+        :returns: the chunk's surface, or None if it has no tiles"""
+        surface = None
+        x_min, y_min = chunk_x * self.chunk_tiles, chunk_y * self.chunk_tiles
+        for layer in self.layers:
+            for x, y, tile_id in layer.tiles(x_min, y_min, x_min + self.chunk_tiles, y_min + self.chunk_tiles):
+                if surface is None:
+                    surface = pygame.Surface((self.chunk_size, self.chunk_size), pygame.SRCALPHA)
+                surface.blit(layer.tileset.get_tile(tile_id).image, ((x - x_min) * TILE_SIZE, (y - y_min) * TILE_SIZE))
+        return surface
+
+    def get(self, chunk_x: int, chunk_y: int) -> pygame.Surface | None:
+        key = chunk_x, chunk_y
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        chunk = self._chunks[key] = self.render(chunk_x, chunk_y)
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def draw(self, surface: pygame.Surface, offset: pygame.math.Vector2):
+        """Blits the chunks that intersect with the camera, whose top left corner is at ``offset`` in the world."""
+        width, height = surface.get_size()
+        for chunk_y in range(max(int(offset.y) // self.chunk_size, 0), int(offset.y + height) // self.chunk_size + 1):
+            for chunk_x in range(max(int(offset.x) // self.chunk_size, 0),
+                                 int(offset.x + width) // self.chunk_size + 1):
+                if chunk := self.get(chunk_x, chunk_y):
+                    surface.blit(chunk, (chunk_x * self.chunk_size - offset.x, chunk_y * self.chunk_size - offset.y))
+
+
+if __name__ == "__main__":
+    # converts the given CSV layers (by default, all of the map's) ahead of time, e.g. before packaging the client
+    for path in sys.argv[1:] or sorted(glob.glob(os.path.join("assets", "map", "*.csv"))):
+        print(f"converted {path} into {convert_csv_layer(path)}")
@@ -1,36 +1,58 @@
 """Utils for communicating with the server"""
-import base64
-import json
-
-from cryptography.fernet import Fernet
+from typing import Dict
 
 from player import Player
+from common.consts import SNAPSHOT_HISTORY_SIZE
 from common.message_type import MessageType
-
-
-def parse_message(data: bytes, fernet: Fernet) -> dict:
-    return json.loads(fernet.decrypt(data))
-
-
-def craft_client_message(message_type: MessageType, client_uuid: str, contents: dict, fernet: Fernet) -> bytes:
-    return json.dumps({"uuid": client_uuid,
-                       "contents": base64.b64encode(fernet.encrypt(json.dumps({"id": int(message_type)} |
-                                                                              contents).encode())).decode()}).encode()
-
-
-def generate_client_routine_message(player_uuid: str, seqn: int, x: int, y: int, player: Player,
-                                    fernet: Fernet) -> bytes:
-    data = {
-        "pos": (x, y),
-        "seqn": seqn,
-        "dir": player.get_direction_vec(),
-        "slot": player.current_hotbar_slot,
-        "is_attacking": player.attacking,
-        "using_skill": player.using_skill,
-        "did_swap": False
-    }
-    if player.inv.move != (-1, -1):
-        data["did_swap"] = True
-        data["swap"] = player.inv.move
-
-    return craft_client_message(MessageType.ROUTINE_CLIENT, player_uuid, data, fernet)
+from common.session_cipher import SessionCipher
+from common.protocol import decode_message, encode_client_packet, encode_json_message, encode_message, \
+    encode_routine_client
+
+
+def parse_message(data: bytes, cipher: SessionCipher) -> dict:
+    return decode_message(cipher.decrypt(data))
+
+
+def craft_client_message(message_type: MessageType, client_uuid: str, contents: dict, cipher: SessionCipher) -> bytes:
+    return encode_client_packet(client_uuid, cipher.encrypt(encode_json_message(message_type, contents)))
+
+
+def generate_client_routine_message(player_uuid: str, seqn: int, ack: int, x: int, y: int, player: Player,
+                                    cipher: SessionCipher) -> bytes:
+    body = encode_routine_client(seqn, ack, (x, y), player.get_direction_vec(), player.current_hotbar_slot,
+                                 player.attacking, player.using_skill,
+                                 player.inv.move if player.inv.move != (-1, -1) else None)
+    return encode_client_packet(player_uuid, cipher.encrypt(encode_message(MessageType.ROUTINE_CLIENT, body)))
+
+
+class SnapshotBuffer:
+    """Rebuilds the world snapshots sent by the server out of their deltas, and keeps the latest ones as baselines."""
+
+    def __init__(self, size: int = SNAPSHOT_HISTORY_SIZE):
+        self.size = size
+        self.latest = 0
+        """Number of the latest snapshot received, which is acked to the server."""
+        self._snapshots: Dict[int, Dict[int, dict]] = {}
+
+    def apply(self, contents: dict) -> Dict[int, dict] | None:
+        """Rebuilds the snapshot of a routine server message.
+
+        :returns: the entities in the snapshot by id, or None if the snapshot is outdated or its baseline is missing"""
+        seqn, baseline = contents["snapshot"], contents["baseline"]
+        if seqn <= self.latest:
+            return None
+        if baseline:
+            if baseline not in self._snapshots:
+                return None
+            entities = dict(self._snapshots[baseline])
+            for entity_id in contents["removed"]:
+                entities.pop(entity_id, None)
+        else:
+            entities = {}
+        entities.update((entity["id"], entity) for entity in contents["entities"])
+
+        self.latest = seqn
+        self._snapshots[seqn] = entities
+        for old_seqn in [old_seqn for old_seqn in self._snapshots if old_seqn <= seqn - self.size]:
+            del self._snapshots[old_seqn]
+        return entities
@@ -26,15 +26,6 @@ class Obstacle(pygame.sprite.Sprite):
         self.rect = rect
 
 
-class Tile(pygame.sprite.Sprite):
-    def __init__(self, groups, pos, image):
-        super().__init__(*groups)
-        # get the directory of this file
-        self.image = image
-
-        self.rect = self.image.get_rect(topleft=pos)
-
-
 class FollowingCameraGroup(pygame.sprite.Group):
     def __init__(self):
         # general setup
@@ -47,6 +38,8 @@ class FollowingCameraGroup(pygame.sprite.Group):
         # creating the floor
         self.floor_surface = pygame.image.load('assets/map1.jpg')
         self.floor_rect = self.floor_surface.get_rect(topleft=(0, 0))
+        self.map_chunks = None
+        """Pre-rendered tile layers (see ``map_manager.MapChunks``), drawn over the floor and under all sprites."""
 
     def custom_draw(self, player):
         # getting the offset
@@ -62,8 +55,13 @@ class FollowingCameraGroup(pygame.sprite.Group):
         floor_offset_pos = self.floor_rect.topleft - self.offset
         self.display_surface.blit(self.floor_surface, floor_offset_pos)
 
-        # for spr in self.sprites():
-        for sprite in sorted(self.sprites(), key=lambda spr: spr.rect.centery):
+        if self.map_chunks:
+            self.map_chunks.draw(self.display_surface, self.offset)
+
+        # only the sprites on the screen are sorted and drawn
+        camera = pygame.Rect(self.offset, self.display_surface.get_size())
+        visible = [sprite for sprite in self.sprites() if camera.colliderect(sprite.rect)]
+        for sprite in sorted(visible, key=lambda spr: spr.rect.centery):
             offset_pos = sprite.rect.topleft - self.offset
             self.display_surface.blit(sprite.image, offset_pos)
 
@@ -47,6 +47,8 @@ NODE_COUNT = 1
 
 # Networking conventions
 DEFAULT_POS_MARK = (-1, -1)
+SNAPSHOT_HISTORY_SIZE = 32
+"""Number of recent world snapshots both sides keep as possible baselines for delta compression."""
 DEFAULT_DIR = (0.0, 0.0)
 DEFAULT_ADDR = (DEFAULT_NODE_IP, -1)
 
@@ -97,6 +99,17 @@ COMPRESSED_POINT_SIZE = 49
 ELLIPTIC_CURVE = SECP384R1()
 SHARED_KEY_SIZE = 32
 
+
+# Cipher of the UDP game session, agreed on during login
+class CipherMode(IntEnum):
+    FERNET = auto()
+    CHACHA20_POLY1305 = auto()
+    AES_GCM = auto()
+
+
+SESSION_CIPHER_MODE = CipherMode.CHACHA20_POLY1305
+"""Cipher the client asks for on login. Servers fall back to Fernet for clients that don't ask for any."""
+
 MOB_COUNT = 100
 PROJECTILE_TTL = 120
 # Some temporary consts
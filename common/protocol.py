@@ -0,0 +1,168 @@
+"""Binary wire format of the messages sent between the clients and the nodes.
+
+Every (decrypted) message starts with a ``MESSAGE_HEADER`` of the protocol version and the ``MessageType``. The
+per-frame messages, ``ROUTINE_CLIENT`` and ``ROUTINE_SERVER``, have fixed-width packed bodies; all other messages are
+rare enough to keep JSON bodies.
+
+Packets sent by a client are wrapped in a ``CLIENT_ENVELOPE`` holding the player's uuid in raw bytes, followed by the
+encrypted message."""
+import json
+import struct
+import uuid
+from typing import List, Sequence, Tuple
+
+from common.consts import Pos, INVENTORY_ROWS, INVENTORY_COLUMNS
+from common.message_type import MessageType
+
+PROTOCOL_VERSION = 2
+
+INVENTORY_SIZE = INVENTORY_ROWS * INVENTORY_COLUMNS
+
+CLIENT_ENVELOPE = struct.Struct("!B16s")
+"""Protocol version, player uuid."""
+MESSAGE_HEADER = struct.Struct("!BB")
+"""Protocol version, message type."""
+ROUTINE_CLIENT = struct.Struct("!IIiiffBBbb")
+"""Sequence number, latest snapshot received, position, attack direction, hotbar slot, flags, swapped inventory
+slots."""
+ROUTINE_SERVER = struct.Struct(f"!iiiB{INVENTORY_SIZE}BIIHH")
+"""Valid position, health, skill id, inventory, snapshot number, baseline snapshot number (0 for a full snapshot),
+number of entity records and number of removed entity ids that follow."""
+REMOVED_ENTITY = struct.Struct("!I")
+ENTITY_RECORD = struct.Struct("!IBiiffBiBB")
+"""Entity id, type, position, direction, flags, hp, tool (or weapon), skill id."""
+
+# routine client flags
+ATTACKING = 1
+USING_SKILL = 2
+DID_SWAP = 4
+
+# entity record flags
+IS_ATTACKING = 1
+HAS_HP = 2
+
+
+def encode_client_packet(player_uuid: str, encrypted_message: bytes) -> bytes:
+    return CLIENT_ENVELOPE.pack(PROTOCOL_VERSION, uuid.UUID(player_uuid).bytes) + encrypted_message
+
+
+def decode_client_packet(packet: bytes) -> Tuple[str, bytes]:
+    """Returns the player uuid and the encrypted message of a client packet.
+
+    :raises ValueError: if the packet is malformed or of another protocol version"""
+    if len(packet) < CLIENT_ENVELOPE.size:
+        raise ValueError(f"packet is too short ({len(packet)} bytes)")
+    version, uuid_bytes = CLIENT_ENVELOPE.unpack_from(packet)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported protocol version {version}")
+    return str(uuid.UUID(bytes=uuid_bytes)), packet[CLIENT_ENVELOPE.size:]
+
+
+def encode_message(message_type: MessageType, body: bytes = b"") -> bytes:
+    return MESSAGE_HEADER.pack(PROTOCOL_VERSION, message_type) + body
+
+
+def encode_json_message(message_type: MessageType, contents: dict) -> bytes:
+    return encode_message(message_type, json.dumps(contents).encode() if contents else b"")
+
+
+def decode_message(message: bytes) -> dict:
+    """Decodes a decrypted message to a dictionary of its contents, with the message type under ``"id"``.
+
+    :raises ValueError: if the message is malformed, of an unknown type or of another protocol version"""
+    if len(message) < MESSAGE_HEADER.size:
+        raise ValueError(f"message is too short ({len(message)} bytes)")
+    version, message_type = MESSAGE_HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported protocol version {version}")
+    message_type = MessageType(message_type)
+    body = memoryview(message)[MESSAGE_HEADER.size:]
+    try:
+        match message_type:
+            case MessageType.ROUTINE_CLIENT:
+                contents = decode_routine_client(body)
+            case MessageType.ROUTINE_SERVER:
+                contents = decode_routine_server(body)
+            case _:
+                contents = json.loads(bytes(body)) if body else {}
+    except struct.error as e:
+        raise ValueError(f"malformed {message_type!r} body") from e
+    if not isinstance(contents, dict):
+        raise ValueError(f"{message_type!r} body isn't an object")
+    return {"id": message_type} | contents
+
+
+def encode_routine_client(seqn: int, ack: int, pos: Pos, direction: Tuple[float, float], slot: int,
+                          is_attacking: bool, using_skill: bool, swap: Tuple[int, int] | None = None) -> bytes:
+    flags = ATTACKING * bool(is_attacking) | USING_SKILL * bool(using_skill) | DID_SWAP * (swap is not None)
+    swap = swap if swap is not None else (-1, -1)
+    return ROUTINE_CLIENT.pack(seqn, ack, *pos, *direction, slot, flags, *swap)
+
+
+def decode_routine_client(body: bytes) -> dict:
+    seqn, ack, x, y, dir_x, dir_y, slot, flags, swap_from, swap_to = ROUTINE_CLIENT.unpack(body)
+    contents = {"seqn": seqn,
+                "ack": ack,
+                "pos": (x, y),
+                "dir": (dir_x, dir_y),
+                "slot": slot,
+                "is_attacking": bool(flags & ATTACKING),
+                "using_skill": bool(flags & USING_SKILL),
+                "did_swap": bool(flags & DID_SWAP)}
+    if contents["did_swap"]:
+        contents["swap"] = (swap_from, swap_to)
+    return contents
+
+
+def encode_entity(entity: dict) -> bytes:
+    """Packs a serialized entity (see ``Entity.serialize`` on the server) into a fixed-width record."""
+    flags = IS_ATTACKING * bool(entity.get("is_attacking", False)) | HAS_HP * ("hp" in entity)
+    return ENTITY_RECORD.pack(entity["id"], entity["type"], *entity["pos"], *entity["dir"], flags,
+                              round(entity.get("hp", 0)), entity.get("tool", entity.get("weapon", 0)),
+                              entity.get("skill_id", 0))
+
+
+def encode_routine_server(valid_pos: Pos, health: float, skill_id: int, inventory: Sequence[int], snapshot: int,
+                          baseline: int, entity_records: Sequence[bytes], removed_ids: Sequence[int]) -> bytes:
+    """Packs a routine server message out of already packed entity records (see ``encode_entity``).
+
+    :param snapshot: number of the snapshot sent
+    :param baseline: number of the snapshot the records are relative to, or 0 if they are the full world state
+    :param entity_records: records of the entities that were added or changed since ``baseline``
+    :param removed_ids: ids of the entities that are in ``baseline``, but not in ``snapshot``"""
+    return ROUTINE_SERVER.pack(*valid_pos, round(health), skill_id, *inventory, snapshot, baseline,
+                               len(entity_records), len(removed_ids)) + \
+        b"".join(entity_records) + b"".join(REMOVED_ENTITY.pack(entity_id) for entity_id in removed_ids)
+
+
+def decode_entities(body: bytes, count: int, offset: int = 0) -> List[dict]:
+    entities = []
+    for entity_id, entity_type, x, y, dir_x, dir_y, flags, hp, tool, skill_id in \
+            ENTITY_RECORD.iter_unpack(body[offset:offset + count * ENTITY_RECORD.size]):
+        entity = {"id": entity_id, "type": entity_type, "pos": (x, y), "dir": (dir_x, dir_y),
+                  "is_attacking": bool(flags & IS_ATTACKING), "tool": tool, "skill_id": skill_id}
+        if flags & HAS_HP:
+            entity["hp"] = hp
+        entities.append(entity)
+    if len(entities) != count:
+        raise struct.error(f"expected {count} entity records, got {len(entities)}")
+    return entities
+
+
+def decode_routine_server(body: bytes) -> dict:
+    x, y, health, skill_id, *inventory, snapshot, baseline, entity_count, removed_count = \
+        ROUTINE_SERVER.unpack_from(body)
+    removed_offset = ROUTINE_SERVER.size + entity_count * ENTITY_RECORD.size
+    removed = [entity_id for entity_id, in REMOVED_ENTITY.iter_unpack(
+        body[removed_offset:removed_offset + removed_count * REMOVED_ENTITY.size])]
+    if len(removed) != removed_count:
+        raise struct.error(f"expected {removed_count} removed entity ids, got {len(removed)}")
+    return {"valid_pos": (x, y),
+            "health": health,
+            "skill_id": skill_id,
+            "inventory": inventory,
+            "snapshot": snapshot,
+            "baseline": baseline,
+            "entities": decode_entities(body, entity_count, ROUTINE_SERVER.size),
+            "removed": removed}
+
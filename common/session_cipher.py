@@ -0,0 +1,88 @@
+"""Ciphers of the UDP game session, keyed by the ECDH shared key negotiated on login.
+
+The TCP login path always uses Fernet. The UDP session either keeps using Fernet, or an AEAD cipher over raw bytes,
+which skips Fernet's CBC padding, HMAC, timestamp and base64 encoding."""
+import base64
+import itertools
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from common.consts import CipherMode, SHARED_KEY_SIZE
+
+NONCE_COUNTER = struct.Struct("!Q")
+"""Per-packet counter, sent in the clear in front of every AEAD packet."""
+CLIENT_NONCE_PREFIX = b"\x00\x00\x00\x00"
+SERVER_NONCE_PREFIX = b"\x00\x00\x00\x01"
+"""Nonce prefixes of the two directions, so that both sides can count from zero with the same key."""
+HANDOFF_COUNTER_GAP = 2 ** 32
+"""Counters a session reserves for itself when it's pickled, e.g. when its player is handed off to another worker. The
+original may still encrypt packets it already built (while the unpickled copy carries on after these counters), so
+that the two never reuse a nonce."""
+
+
+class AeadSession:
+    """AEAD session cipher, with the same ``encrypt``/``decrypt`` contract as ``Fernet``.
+
+    Every packet is ``counter || ciphertext || tag``: the 96-bit nonce is the sender's direction prefix followed by
+    the 64-bit counter, which is incremented on every packet, so that a nonce is never reused under the same key."""
+
+    def __init__(self, shared_key: bytes, mode: CipherMode, is_server: bool):
+        self._key = HKDF(algorithm=SHA256(), length=SHARED_KEY_SIZE, salt=None,
+                         info=b"udp session " + mode.name.encode()).derive(shared_key)
+        self._mode = mode
+        self._aead = ChaCha20Poly1305(self._key) if mode == CipherMode.CHACHA20_POLY1305 else AESGCM(self._key)
+        self._send_prefix = SERVER_NONCE_PREFIX if is_server else CLIENT_NONCE_PREFIX
+        self._recv_prefix = CLIENT_NONCE_PREFIX if is_server else SERVER_NONCE_PREFIX
+        self._counter = itertools.count()
+        """Thread safe on its own, since ``next`` on a counter is atomic."""
+        self._counter_limit = 2 ** (8 * NONCE_COUNTER.size)
+        """Counter this session may not reach, which is lowered once it's pickled."""
+
+    def __getstate__(self):
+        """Pickles the session, for a copy that carries on from it. The AEAD object can't be pickled, and the copy's
+        counter starts ``HANDOFF_COUNTER_GAP`` counters after this session's, which is limited to the counters in
+        between, so that the two never reuse a nonce. A session should therefore be pickled only once."""
+        self._counter_limit = next(self._counter) + HANDOFF_COUNTER_GAP
+        return {"key": self._key, "mode": self._mode, "send_prefix": self._send_prefix,
+                "recv_prefix": self._recv_prefix, "next_counter": self._counter_limit}
+
+    def __setstate__(self, state: dict):
+        self._key, self._mode = state["key"], state["mode"]
+        self._aead = ChaCha20Poly1305(self._key) if self._mode == CipherMode.CHACHA20_POLY1305 else AESGCM(self._key)
+        self._send_prefix, self._recv_prefix = state["send_prefix"], state["recv_prefix"]
+        self._counter = itertools.count(state["next_counter"])
+        self._counter_limit = 2 ** (8 * NONCE_COUNTER.size)
+
+    def encrypt(self, data: bytes) -> bytes:
+        """:raises OverflowError: if the session ran out of counters, e.g. if it was pickled and then kept being used
+            for more than ``HANDOFF_COUNTER_GAP`` packets"""
+        if (counter := next(self._counter)) >= self._counter_limit:
+            raise OverflowError("the session ran out of nonce counters")
+        packed_counter = NONCE_COUNTER.pack(counter)
+        return packed_counter + self._aead.encrypt(self._send_prefix + packed_counter, data, None)
+
+    def decrypt(self, packet: bytes) -> bytes:
+        """Decrypts and authenticates a packet.
+
+        :raises InvalidToken: if the packet is malformed or fails authentication"""
+        if len(packet) < NONCE_COUNTER.size:
+            raise InvalidToken
+        try:
+            return self._aead.decrypt(self._recv_prefix + packet[:NONCE_COUNTER.size], packet[NONCE_COUNTER.size:],
+                                      None)
+        except InvalidTag as e:
+            raise InvalidToken from e
+
+
+SessionCipher = Fernet | AeadSession
+
+
+def create_session_cipher(shared_key: bytes, mode: CipherMode, is_server: bool) -> SessionCipher:
+    if mode == CipherMode.FERNET:
+        return Fernet(base64.urlsafe_b64encode(shared_key))
+    return AeadSession(shared_key, mode, is_server)